@@ -58,16 +58,19 @@ def main():
 
     if seal_db is not None:
         groups = []
+        num_groups = None
         #required_fits = []
 
+        # Only the uids are needed, so stream lightweight rows.
         if args.sqlite == "":
             # Look at all the groups
-            groups = seal_db.get_groups()
+            groups = seal_db.iter_groups(rows=True)
+            num_groups = seal_db.get_num_groups()
 
         else:
-            groups = seal_db.get_groups_filters([Groups.sqlite == args.sqlite, ])
+            groups = seal_db.iter_groups_filters([Groups.sqlite == args.sqlite, ], rows=True)
             
-        for group in tqdm(groups, desc="Checking Groups"):
+        for group in tqdm(groups, desc="Checking Groups", total=num_groups):
             # Now go through all UIDs, get the group, it's images and create a video
             # TODO - eventually we'll ignore the sonarid
 
@@ -78,15 +81,15 @@ def main():
                 print("*** No Image Records found for group: " + str(group.uid) + " ***")
 
             else:
+                # The images with points, for both sonars, in one query.
+                group_bbs = seal_db.get_group_image_bbs(group.uid)
+
                 # Sonar 854 check
                 group_images = seal_db.get_images_group_sonarid(group.uid, 854)
                 track_len = 0
 
                 for img in group_images:
-                    fname = img.filename
-                    points = seal_db.get_image_points_by_filename_group(fname, group.uid)
-
-                    if len(points) > 0:
+                    if (img.filename, img.sonarid) in group_bbs:
                         track_len+=1
 
                 track_lengths.append(track_len)
@@ -96,10 +99,7 @@ def main():
                 track_len = 0
 
                 for img in group_images:
-                    fname = img.filename
-                    points = seal_db.get_image_points_by_filename_group(fname, group.uid)
-
-                    if len(points) > 0:
+                    if (img.filename, img.sonarid) in group_bbs:
                         track_len += 1
 
                 track_lengths.append(track_len)
@@ -32,8 +32,20 @@ import os
 import logging
 import traceback
 from sealhits.db.db import DB
+from typing import List
+from sealhits.db.dbbulk import bulk_merge
+from sealhits.db.dbcopy import copy_points
 from sealhits.db.dbmodel import DBModel, diff_models, gen_model
-from sealhits.db.dbschema import Groups
+from sealhits.db.dbprogress import (
+    STAGE_GLFS,
+    STAGE_GROUPS,
+    UNIT_ALL,
+    checkpoint_glfs,
+    clear_progress,
+    get_completed,
+    mark_completed,
+)
+from sealhits.db.dbschema import Groups, Images, groups_images
 from sealhits.sources import sqlpam
 from sqlalchemy.orm import Session
 from sealhits.sources.glf import process_glfs
@@ -42,6 +54,30 @@ from sealhits.sources.pgdf import process_pgdfs, tracks_to_pgdfs
 from sealhits.utils import create_dir
 
 
+def _resumed_images(session: Session, groups: List[Groups]) -> List[Images]:
+    """Return the images a previous, interrupted ingest attached to these groups.
+    These are the images process_glfs would have returned for the groups,
+    so they are kept when the models are compared.
+    """
+    if len(groups) == 0:
+        return []
+
+    with session.no_autoflush:
+        q = (
+            session.query(Images)
+            .join(groups_images, groups_images.c.image_id == Images.uid)
+            .join(Groups, Groups.uid == groups_images.c.group_id)
+            .filter(
+                Groups.uid.in_([g.uid for g in groups]),
+                Images.time >= Groups.timestart,
+                Images.time <= Groups.timeend,
+            )
+            .distinct()
+        )
+
+        return q.all()
+
+
 def main(args):
     """The main function that build the objects and either creates new objects,
     or adds to the database.
@@ -53,23 +89,28 @@ def main(args):
         4) Split the groups based on a buffer time.
         5) Create a DB Model of the existing database for this SQLITE file only.
         6) Insert or merge the new groups, trackgroups, points and pgdfs.
-        7) Find the GLFs we need for each group. Extract the images and save to disk. Create Image
-            objects and attach them to the groups.
-        8) Insert or merge the GLF and Image objects, updating existing groups.
-        9) Compare the new model against the older model, deleting anything that doesn't appear in
-            the new model.
+        7) Compare these against the older model, deleting anything that doesn't appear in
+            the new model, then commit.
+        8) Find the GLFs we need for each group. Extract the images and save to disk. Create Image
+            objects and attach them to the groups, committing after each batch of groups.
+        9) Compare the GLFs and Images against the older model, deleting anything that doesn't
+            appear in the new model, then commit.
+
+    Each commit is recorded in the ingest_progress table. If the ingest is interrupted,
+    running it again with --resume skips steps 1 to 7 if they were committed, and any
+    groups that already have their images.
     """
-    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass)
+    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass, host=args.dbhost)
+    new_tracks = []
+    sgroups = []
 
-    # Do everything as one big session / transaction
-    # TODO - we should break up this into update add, per group item
-  
-    with Session(pgdb.engine) as session:
+    # Objects are kept loaded between the commits, as the GLF stage
+    # refers back to them throughout.
+    with Session(pgdb.engine, expire_on_commit=False) as session:
         try:
             # These lines are the main processes for dealing with all the
             # different files an ingest might have. At the end will be the
             # correct model structure for this ingest.
-            session.begin()
 
             # Generate the existing model for this sqlite file.
             # We need to see if we are using an alias for the SQLITE file.
@@ -84,55 +125,88 @@ def main(args):
             if args.sql_alias != "":
                 sqlalias = args.sql_alias
                 sqlmodelname = sqlalias
-                
-            model_a = gen_model(session, sqlmodelname)
-            sqldb = sqlpam.SQLPAM(args.sqldb)
-          
-            new_groups, new_tracks = find_group_objects(session, sqldb, sqldbname, sqlalias, args.max_secs)
-           
-            pgdfs_needed = tracks_to_pgdfs(new_tracks)
-            assert(len(pgdfs_needed) >  0)
-            assert(len(new_groups) >  0)
 
-            # Assuming all the required PGDFs exist on this path!
-            new_pgdfs, new_points = process_pgdfs(
-                session, args.pgdf, pgdfs_needed, new_groups, new_tracks
-            )
+            if not args.resume:
+                clear_progress(session, sqldbname)
 
-            assert(len(new_pgdfs) >  0)
-            assert(len(new_points) >  0)
-
-            fixed_groups = fix_group_times(new_groups, new_points)
+            model_a = gen_model(session, sqlmodelname)
+            model_b = DBModel()
 
-            sgroups, spoints = split_groups(
-                session, fixed_groups, new_points, args.buffer
-            )
+            if UNIT_ALL in get_completed(session, sqldbname, STAGE_GROUPS):
+                logging.info("Groups, tracks, PGDFs and points already ingested. Resuming...")
+            else:
+                sqldb = sqlpam.SQLPAM(args.sqldb)
+          
+                new_groups, new_tracks = find_group_objects(session, sqldb, sqldbname, sqlalias, args.max_secs)
+           
+                pgdfs_needed = tracks_to_pgdfs(new_tracks)
+                assert(len(pgdfs_needed) >  0)
+                assert(len(new_groups) >  0)
 
-            # Record the new model for deletion purposes
-            model_b = DBModel()
-            model_b.groups = sgroups
-            model_b.pgdfs = new_pgdfs
-            model_b.points = spoints
-            model_b.track_groups = new_tracks
+                # Assuming all the required PGDFs exist on this path!
+                new_pgdfs, new_points = process_pgdfs(
+                    session, args.pgdf, pgdfs_needed, new_groups, new_tracks, args.workers
+                )
 
-            # TODO - at this point we may have orphans due to, say, removal of tracks from
-            # one group and additions of new tracks, so check over the relations
-            # We add these to the session as we need to refer to these objects in the
-            # GLF Image creation.
+                assert(len(new_pgdfs) >  0)
+                assert(len(new_points) >  0)
 
-            # We are performing merge manually due to the nature of how primary keys are
-            # randomly generated each ingest.
-            for group in sgroups:
-                session.merge(group)
+                fixed_groups = fix_group_times(new_groups, new_points)
 
-            for track in new_tracks:
-                session.merge(track)
-               
-            for pgdf in new_pgdfs:
-                session.merge(pgdf)
+                sgroups, spoints = split_groups(
+                    session, fixed_groups, new_points, args.buffer
+                )
 
-            for point in spoints:
-                session.merge(point)
+                # Record the new model for deletion purposes
+                model_b.groups = sgroups
+                model_b.pgdfs = new_pgdfs
+                model_b.points = spoints
+                model_b.track_groups = new_tracks
+
+                # TODO - at this point we may have orphans due to, say, removal of tracks from
+                # one group and additions of new tracks, so check over the relations
+                # We add these to the session as we need to refer to these objects in the
+                # GLF Image creation.
+
+                # Everything that already exists was loaded while building the new
+                # model, so anything not in the session is new and is inserted in
+                # batches, rather than merged (and SELECTed) one object at a time.
+                bulk_merge(session, sgroups)
+                bulk_merge(session, new_tracks)
+                bulk_merge(session, new_pgdfs)
+
+                # Points we read back from the DB are moved to their new groups
+                # and updated by the session. New points are streamed with COPY
+                # straight from the point store, rather than made into objects
+                # and merged one at a time.
+                moved = spoints.attach_existing()
+                logging.info("Existing points moved: %s", moved)
+                copy_points(session, spoints.rows(new_only=True))
+
+                # Delete the groups, tracks, pgdfs and points that are no longer
+                # present. GLFs and images are compared once they have all been processed.
+                logging.info("Performing model diff...")
+                model_c = DBModel()
+                model_c.groups = model_a.groups
+                model_c.pgdfs = model_a.pgdfs
+                model_c.points = model_a.points
+                model_c.track_groups = model_a.track_groups
+                diff_model = diff_models(session, model_c, model_b)
+
+                for group in diff_model.groups:
+                    session.delete(group)
+
+                for track in diff_model.track_groups:
+                    session.delete(track)
+
+                for pgdf in diff_model.pgdfs:
+                    session.delete(pgdf)
+
+                for point in diff_model.points:
+                    session.delete(point)
+
+                mark_completed(session, sqldbname, STAGE_GROUPS, [UNIT_ALL])
+                session.commit()
 
             # Look at the GLF ingest unless we are skipping it.
             if not args.skip_glfs:
@@ -142,51 +216,47 @@ def main(args):
                 # Loaded the groups again before looking at GLFS
                 # This is a test and I'm not sure if it solves the
                 # two part issue but worth a shot.
-                groups = []
-
                 with session.no_autoflush:
                     q = session.query(Groups).filter(
-                        Groups.sqliteid == sqldbname,
+                        Groups.sqlite == sqldbname,
                     )
 
                 groups = q.all()
+                done = get_completed(session, sqldbname, STAGE_GLFS)
+                todo = [g for g in groups if str(g.uid) not in done]
+                skipped = [g for g in groups if str(g.uid) in done]
+                logging.info("Groups with images already ingested: %s", len(skipped))
 
                 new_glfs, new_images = process_glfs(
-                    session, groups, args.glf, args.outpath, args.max_glf
+                    session,
+                    todo,
+                    args.glf,
+                    args.outpath,
+                    args.max_secs,
+                    checkpoint_glfs(session, sqldbname),
                 )
 
                 model_b.glfs = new_glfs
-                model_b.images = new_images
-
-                for glf in new_glfs:
-                    session.merge(glf)
-
-                for image in new_images:
-                    session.merge(image)
-
-            # Now perform the deletion side of the operation
-            logging.info("Performing model diff...")
-            diff_model = diff_models(session, model_a, model_b)
-
-            # Perform the deletion then check it
-            for group in diff_model.groups:
-                session.delete(group)
-
-            for track in diff_model.track_groups:
-                session.delete(track)
+                model_b.images = new_images + _resumed_images(session, skipped)
 
-            for pgdf in diff_model.pgdfs:
-                session.delete(pgdf)
+                bulk_merge(session, new_glfs)
+                bulk_merge(session, new_images)
 
-            for point in diff_model.points:
-                session.delete(point)
+                # Now perform the deletion side of the operation for the GLFs and images.
+                logging.info("Performing GLF and image model diff...")
+                model_c = DBModel()
+                model_c.glfs = model_a.glfs
+                model_c.images = model_a.images
+                diff_model = diff_models(session, model_c, model_b)
 
-            for glf in diff_model.glfs:
-                session.delete(glf)
+                for glf in diff_model.glfs:
+                    session.delete(glf)
 
-            for image in diff_model.images:
-                session.delete(image)
+                for image in diff_model.images:
+                    session.delete(image)
 
+            # The ingest is complete so there is nothing left to resume.
+            clear_progress(session, sqldbname)
             session.commit()
 
         except Exception as e:
@@ -204,6 +274,9 @@ def main(args):
                     print("Track refers to a group that doesn't exist", track)
     
             session.rollback()
+            logging.error(
+                "Ingest interrupted. Committed work is kept - run again with --resume to continue."
+            )
 
 
 if __name__ == "__main__":
@@ -256,6 +329,13 @@ if __name__ == "__main__":
         default=False,
         help="Skip processing the GLFs (default: False)",
     )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Resume an interrupted ingest, skipping the work already committed (default: False)",
+    )
     parser.add_argument(
         "-p", "--pgdf", help="The path to the folder containing PGDF Files"
     )
@@ -276,6 +356,13 @@ if __name__ == "__main__":
         default=800,
         help="Maximum number of seconds to ingest for a group (default: 800)?",
     )
+    parser.add_argument(
+        "-n",
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of processes used to read the PGDFs (default: the number of CPUs)",
+    )
     parser.add_argument(
         "-o", "--outpath", default=".", help="The path where the FITS images are saved"
     )
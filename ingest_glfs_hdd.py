@@ -20,6 +20,8 @@ __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 import logging
 from sealhits.db.db import DB
+from sealhits.db.dbbulk import bulk_merge
+from sealhits.db.dbprogress import STAGE_GLFS, checkpoint_glfs, clear_progress, get_completed
 from sealhits.db.dbschema import Groups
 from sealhits.sources.glf import process_glfs
 from sqlalchemy.orm import Session
@@ -90,6 +92,13 @@ def main():
         default=800,
         help="Maximum number of seconds to ingest for a group (default: 800)?",
     )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Resume an interrupted run, skipping groups already committed (default: False)",
+    )
 
     args = parser.parse_args()
 
@@ -101,35 +110,45 @@ def main():
     sys.setrecursionlimit(10**6)
     faulthandler.enable()
 
-    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass)
+    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass, host=args.dbhost)
+
+    # Each batch of groups is committed as it completes, so keep the objects
+    # loaded between commits.
+    with Session(pgdb.engine, expire_on_commit=False) as session:
+        try:
+            if not args.resume:
+                clear_progress(session, args.sqlite)
 
-    try:
-        with Session(pgdb.engine) as session:
-            session.begin()
             logging.info("Reading GLFS...")
             create_dir(args.outpath)
             groups = session.query(Groups).filter(Groups.sqlite==args.sqlite).order_by(Groups.gid.asc()).all()
             logging.info("Number of groups: %d", len(groups))
-           
-            new_glfs, new_images = process_glfs(
-                    session, groups, args.glf, args.outpath, args.max_glf
-            )
 
-            # Update groups as images are attached to groups
-            for group in groups:
-                session.merge(group)
+            done = get_completed(session, args.sqlite, STAGE_GLFS)
+            groups = [g for g in groups if str(g.uid) not in done]
+            logging.info("Groups remaining: %d", len(groups))
 
-            for glf in new_glfs:
-                session.merge(glf)
+            new_glfs, new_images = process_glfs(
+                    session,
+                    groups,
+                    args.glf,
+                    args.outpath,
+                    args.max_glf,
+                    checkpoint_glfs(session, args.sqlite),
+            )
 
-            for img in new_images:
-                session.merge(img)
+            bulk_merge(session, new_glfs)
 
+            # The ingest is complete so there is nothing left to resume.
+            clear_progress(session, args.sqlite)
             session.commit()
 
-    except Exception as e:
-        print(e)
-        session.rollback()
+        except Exception as e:
+            print(e)
+            session.rollback()
+            logging.error(
+                "Ingest interrupted. Committed groups are kept - run again with --resume to continue."
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+"""Postgresql Migration Script on the 2026-10-19.
+Adds the indexes for the hot query shapes: points by
+track, groups by sqlite file
+and the group side of tracks_groups and the link tables.
+The indexes are listed in sealhits/db/dbindex.py.
+
+"""
+from __future__ import annotations
+
+import sys
+from sqlalchemy import create_engine
+
+sys.path.append("../")
+
+from sealhits.db.dbindex import create_indexes  # noqa: E402
+
+
+def migrate():
+    """Perform the migration. The indexes are built concurrently, so
+    the database can be used while this runs. Indexes that already
+    exist are skipped, so it is safe to run again if it fails."""
+    username = "sealhits"
+    password = "kissfromarose"
+    host = "localhost"
+    db_name = "sealhits"
+    echo = True
+
+    con_str = (
+        "postgresql+psycopg2://"
+        + username
+        + ":"
+        + password
+        + "@"
+        + host
+        + "/"
+        + db_name
+    )
+    engine = create_engine(con_str, echo=echo)
+    create_indexes(engine)
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,54 @@
+"""Postgresql Migration Script on the 2026-10-19.
+Adds the ingest_progress table, used by ingest.py
+and ingest_glfs_hdd.py to record committed work so
+an interrupted ingest can be resumed.
+
+"""
+from __future__ import annotations
+
+import sys
+from sqlalchemy import create_engine, text
+
+sys.path.append("../")
+
+
+def migrate():
+    """Perform the migration. Creating the table is a single
+    transaction so nothing changes if it fails, and it is
+    safe to run again."""
+    username = "sealhits"
+    password = "kissfromarose"
+    host = "localhost"
+    db_name = "sealhits"
+    echo = True
+
+    con_str = (
+        "postgresql+psycopg2://"
+        + username
+        + ":"
+        + password
+        + "@"
+        + host
+        + "/"
+        + db_name
+    )
+    engine = create_engine(con_str, echo=echo)
+
+    with engine.connect() as con:
+        create_progress = """
+            CREATE TABLE IF NOT EXISTS public.ingest_progress (
+                sqlite character varying NOT NULL,
+                stage character varying NOT NULL,
+                unit character varying NOT NULL,
+                completed timestamp with time zone NOT NULL,
+                CONSTRAINT ingest_progress_pk PRIMARY KEY (sqlite, stage, unit)
+            );
+            ALTER TABLE public.ingest_progress OWNER TO sealhits;
+            """
+
+        con.execute(text(create_progress))
+        con.commit()
+
+
+if __name__ == "__main__":
+    migrate()
@@ -254,6 +254,20 @@ CREATE TABLE public.tracks_groups (
 
 ALTER TABLE public.tracks_groups OWNER TO sealhits;
 
+--
+-- Name: ingest_progress; Type: TABLE; Schema: public; Owner: sealhits
+--
+
+CREATE TABLE public.ingest_progress (
+    sqlite character varying NOT NULL,
+    stage character varying NOT NULL,
+    unit character varying NOT NULL,
+    completed timestamp with time zone NOT NULL
+);
+
+
+ALTER TABLE public.ingest_progress OWNER TO sealhits;
+
 --
 -- Name: __diesel_schema_migrations __diesel_schema_migrations_pkey; Type: CONSTRAINT; Schema: public; Owner: sealhits
 --
@@ -262,6 +276,14 @@ ALTER TABLE ONLY public.__diesel_schema_migrations
     ADD CONSTRAINT __diesel_schema_migrations_pkey PRIMARY KEY (version);
 
 
+--
+-- Name: ingest_progress ingest_progress_pk; Type: CONSTRAINT; Schema: public; Owner: sealhits
+--
+
+ALTER TABLE ONLY public.ingest_progress
+    ADD CONSTRAINT ingest_progress_pk PRIMARY KEY (sqlite, stage, unit);
+
+
 --
 -- Name: glfs glfs_pk; Type: CONSTRAINT; Schema: public; Owner: sealhits
 --
@@ -417,6 +439,48 @@ CREATE INDEX pgdfs_filename_idx ON public.pgdfs USING btree (filename);
 CREATE INDEX points_group_id_idx ON public.points USING btree (group_id);
 
 
+--
+-- Name: points_track_id_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX points_track_id_idx ON public.points USING btree (track_id);
+
+
+--
+-- Name: tracks_groups_group_id_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX tracks_groups_group_id_idx ON public.tracks_groups USING btree (group_id);
+
+
+--
+-- Name: groups_sqlite_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX groups_sqlite_idx ON public.groups USING btree (sqlite);
+
+
+--
+-- Name: groups_images_group_id_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX groups_images_group_id_idx ON public.groups_images USING btree (group_id);
+
+
+--
+-- Name: groups_glfs_group_id_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX groups_glfs_group_id_idx ON public.groups_glfs USING btree (group_id);
+
+
+--
+-- Name: groups_pgdfs_group_id_idx; Type: INDEX; Schema: public; Owner: sealhits
+--
+
+CREATE INDEX groups_pgdfs_group_id_idx ON public.groups_pgdfs USING btree (group_id);
+
+
 --
 -- Name: groups_glfs groups_glfs_fk; Type: FK CONSTRAINT; Schema: public; Owner: sealhits
 --
@@ -4,17 +4,34 @@ db.py - The Postgresql Database Object.
 This file holds the class that represents everything about our 
 data. We use SQLAlchemy as the ORM to wrap the various postgresql
 commands and schemas.
+
+The engine keeps a pool of connections, so the many small queries
+the DB functions make reuse them rather than connecting each time.
+Within a unit_of_work block, the DB functions also share a single
+session and transaction.
 '''
 
 from __future__ import annotations
 
 __all__ = [
+    "POOL_SIZE",
+    "MAX_OVERFLOW",
+    "POOL_RECYCLE",
     "DB",
 ]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
-from sqlalchemy import create_engine
+import threading
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+# Connection pool defaults. pool_recycle is in seconds.
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 3600
 
 # Declare our ORM here with the PostgreSQL classes
 # TODO session.query might be legacy. Might need to redo it: https://docs.sqlalchemy.org/en/20/changelog/migration_20.html#migration-20-query-usage
@@ -44,13 +61,20 @@ class DB:
         get_tracks_groups_groups_binfile,
         get_image_points_by_filename,
         get_image_points_by_filename_group,
+        get_group_image_bbs,
         get_image_groups_by_filename,
         get_tracks_group_uid,
         get_points_from_track,
         get_images_group,
         get_images_group_sonarid,
         get_image_uid,
-        get_img_fname
+        get_img_fname,
+        iter_groups,
+        iter_groups_filters,
+        iter_pgdfs,
+        iter_tracks_groups,
+        iter_images,
+        iter_points
     )
 
     from sealhits.db.dbset import (
@@ -66,7 +90,31 @@ class DB:
         del_by_sqlite
     )
 
-    def __init__(self, db_name, username, password, host="localhost", echo=False):
+    def __init__(
+        self,
+        db_name,
+        username,
+        password,
+        host="localhost",
+        echo=False,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=POOL_RECYCLE,
+    ):
+        """Create the engine and its connection pool.
+
+        Args:
+            db_name (str): the name of the postgresql database.
+            username (str): the database user.
+            password (str): the password for the user.
+            host (str): the database host (default: localhost).
+            echo (bool): log all the SQL statements (default: False).
+            pool_size (int): the number of connections kept open in the pool.
+            max_overflow (int): how many connections may be opened beyond pool_size when busy.
+            pool_pre_ping (bool): test connections as they leave the pool, replacing dead ones.
+            pool_recycle (int): replace connections older than this many seconds.
+        """
         con_str = (
             "postgresql+psycopg2://"
             + username
@@ -77,4 +125,132 @@ class DB:
             + "/"
             + db_name
         )
-        self.engine = create_engine(con_str, echo=echo)
+        self.engine = create_engine(
+            con_str,
+            echo=echo,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
+        )
+        self._sessions = sessionmaker(bind=self.engine)
+        self._local = threading.local()
+        self._pool_counts = {"connects": 0, "checkouts": 0}
+        self._pool_lock = threading.Lock()  # The pool events fire on any thread
+
+        def on_connect(dbapi_connection, connection_record):
+            with self._pool_lock:
+                self._pool_counts["connects"] += 1
+
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            with self._pool_lock:
+                self._pool_counts["checkouts"] += 1
+
+        event.listen(self.engine, "connect", on_connect)
+        event.listen(self.engine, "checkout", on_checkout)
+
+    @contextmanager
+    def session(self):
+        """The session the DB functions use. Inside a unit_of_work this is
+        the shared session; otherwise a new session is created and closed
+        when the block ends. Either way, the connection comes from the pool.
+
+        Yields:
+            Session: the SQLAlchemy session.
+        """
+        shared = getattr(self._local, "session", None)
+
+        if shared is not None:
+            yield shared
+            return
+
+        with self._sessions() as session:
+            yield session
+
+    @contextmanager
+    def _write_session(self, name=None):
+        """The session for a function that changes the database. Inside a
+        unit_of_work, the changes are flushed to the shared session and any
+        error is raised, leaving the unit to roll back. Otherwise a new session
+        is committed when the block ends. If a name is given, an IntegrityError
+        outside a unit is rolled back and printed rather than raised.
+
+        Args:
+            name (str): the name of the calling function, for the error message.
+
+        Yields:
+            Session: the SQLAlchemy session.
+        """
+        shared = getattr(self._local, "session", None)
+
+        if shared is not None:
+            yield shared
+            shared.flush()
+            return
+
+        with self._sessions() as session:
+            try:
+                yield session
+                session.commit()
+
+            except IntegrityError as e:
+                session.rollback()
+
+                if name is None:
+                    raise
+
+                print(name + " failed", e)
+
+    @contextmanager
+    def unit_of_work(self):
+        """Share one session (and so one connection) between all the DB
+        functions called in this block, on this thread. The session is
+        committed when the block ends, or rolled back if it raises.
+        Objects stay loaded after the commit. Nested blocks join the
+        outer one. The set_* functions only flush their changes here, so
+        they are committed, or rolled back, with the rest of the unit.
+
+        Yields:
+            Session: the shared SQLAlchemy session.
+        """
+        shared = getattr(self._local, "session", None)
+
+        if shared is not None:
+            yield shared
+            return
+
+        with self._sessions(expire_on_commit=False) as session:
+            self._local.session = session
+
+            try:
+                yield session
+                session.commit()
+
+            except Exception:
+                session.rollback()
+                raise
+
+            finally:
+                self._local.session = None
+
+    def pool_status(self) -> dict:
+        """The state of the connection pool, for checking connections are
+        being reused. 'connects' counts the new database connections made and
+        'checkouts' the times a connection was taken from the pool.
+
+        Returns:
+            dict: the pool size, the connections checked in and out, the overflow and the counts.
+        """
+        pool = self.engine.pool
+
+        with self._pool_lock:
+            counts = dict(self._pool_counts)
+
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "connects": counts["connects"],
+            "checkouts": counts["checkouts"],
+        }
@@ -0,0 +1,99 @@
+"""
+dbbulk.py - Bulk writes to the Postgresql database.
+
+Ingests create far more rows than session.merge can
+cope with one object at a time. bulk_merge writes many
+rows per statement, within the caller's session and
+transaction. The points, the largest table, are loaded
+with COPY instead (see dbcopy.py).
+
+An ingest preloads every object that might already
+exist, so any object that is not yet in the session
+is new. bulk_merge uses this to replace session.merge,
+which costs a SELECT per object.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "BATCH_SIZE",
+    "bulk_merge",
+]
+
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+from typing import Iterable, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import (
+    Session,
+)
+
+# Rows per statement. Postgresql allows 65535 parameters per statement.
+BATCH_SIZE = 1000
+
+
+def bulk_merge(session: Session, objects: Iterable, batch_size=BATCH_SIZE) -> Tuple[int, int]:
+    """A bulk replacement for calling session.merge on each object. The objects
+    are split by their state in the session:
+
+        - new (transient) objects are added, so the flush INSERTs them, along
+          with their association rows, in batched executemany statements.
+        - objects already in the session need nothing more; their changes are
+          flushed as batched UPDATEs.
+        - detached objects are loaded in chunked IN queries, then merged, so each
+          merge finds its object in the identity map without a SELECT.
+
+    This relies on the caller having loaded every object that might already exist
+    in the database, as the ingest does. A new object whose primary key is already
+    in the database will fail to insert, where merge would have updated it.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        objects (Iterable): The ORM objects to write.
+        batch_size (int): The number of primary keys per IN query for detached objects.
+
+    Returns:
+        Tuple[int, int]: the number of objects inserted and the number updated.
+    """
+    inserts = []
+    updates = 0
+    detached = {}
+
+    for obj in objects:
+        state = inspect(obj)
+
+        if state.transient:
+            inserts.append(obj)
+        elif state.detached:
+            detached.setdefault(type(obj), []).append(obj)
+        else:
+            updates += 1
+
+    for cls, objs in detached.items():
+        mapper = inspect(cls)
+        pk = mapper.primary_key[0]
+        keys = [mapper.primary_key_from_instance(obj)[0] for obj in objs]
+
+        # Hold on to the loaded objects, as the identity map only keeps weak
+        # references to them.
+        loaded = []
+
+        with session.no_autoflush:
+            for i in range(0, len(keys), batch_size):
+                loaded += (
+                    session.query(cls).filter(pk.in_(keys[i : i + batch_size])).all()
+                )
+
+            for obj in objs:
+                session.merge(obj)
+
+        del loaded
+
+        updates += len(objs)
+
+    session.add_all(inserts)
+
+    return (len(inserts), updates)
+
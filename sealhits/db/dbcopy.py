@@ -0,0 +1,231 @@
+"""
+dbcopy.py - COPY based loading of the largest tables.
+
+Points and images are the largest tables by far. These
+functions stream rows to Postgresql with COPY FROM STDIN
+into temporary staging tables, then merge the staging
+tables into points, images and groups_images with a single
+INSERT ... SELECT each. They run within the caller's
+session and transaction.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "POINT_COLUMNS",
+    "IMAGE_COLUMNS",
+    "copy_points",
+    "copy_images",
+    "copy_groups_images",
+]
+
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import datetime
+from typing import Iterable, List
+
+from sqlalchemy.orm import (
+    Session,
+)
+
+POINT_COLUMNS = [
+    "uid",
+    "time",
+    "sonarid",
+    "minbearing",
+    "maxbearing",
+    "minrange",
+    "maxrange",
+    "peakbearing",
+    "peakrange",
+    "maxvalue",
+    "occupancy",
+    "objsize",
+    "track_id",
+    "group_id",
+]
+
+IMAGE_COLUMNS = ["uid", "filename", "hastrack", "glf", "time", "sonarid", "range"]
+
+# Special characters in the COPY text format.
+ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value) -> str:
+    """Format a single value for the COPY text format."""
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value).translate(ESCAPES)
+
+
+class _CopyStream(object):
+    """A file-like object that formats rows for COPY as they are read,
+    so the rows are never all held in memory."""
+
+    def __init__(self, rows: Iterable[dict], columns: List[str]):
+        self._lines = (
+            "\t".join([_copy_value(row[c]) for c in columns]) + "\n" for row in rows
+        )
+        self._rest = ""
+        self.count = 0
+
+    def read(self, size=-1) -> str:
+        parts = [self._rest]
+        length = len(self._rest)
+
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+
+            if line is None:
+                break
+
+            parts.append(line)
+            length += len(line)
+            self.count += 1
+
+        data = "".join(parts)
+
+        if size < 0:
+            self._rest = ""
+            return data
+
+        self._rest = data[size:]
+        return data[:size]
+
+
+def _copy_to_stage(
+    session: Session, stage: str, create: str, columns: List[str], rows: Iterable[dict]
+) -> int:
+    """Create (or empty) a staging table and COPY the rows into it. The staging
+    table is temporary and dropped when the transaction ends."""
+    # Anything pending in the session (the groups and tracks the rows
+    # refer to) must be written first.
+    session.flush()
+    cursor = session.connection().connection.dbapi_connection.cursor()
+
+    try:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS " + stage + " " + create + " ON COMMIT DROP"
+        )
+        cursor.execute("TRUNCATE " + stage)
+        stream = _CopyStream(rows, columns)
+        cursor.copy_expert(
+            "COPY " + stage + " (" + ", ".join(columns) + ") FROM STDIN", stream
+        )
+
+    finally:
+        cursor.close()
+
+    return stream.count
+
+
+def _merge_stage(session: Session, sql: str) -> int:
+    cursor = session.connection().connection.dbapi_connection.cursor()
+
+    try:
+        cursor.execute(sql)
+        return cursor.rowcount
+
+    finally:
+        cursor.close()
+
+
+def copy_points(session: Session, rows: Iterable[dict]) -> int:
+    """Write points, given as dicts of column values (see POINT_COLUMNS and
+    PointStore.rows), through a COPY staging table. A point that already
+    exists (by the points_un natural key) has its group and peakrange
+    updated instead.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        rows (Iterable[dict]): The column values of each point.
+
+    Returns:
+        int: the number of points inserted or updated.
+    """
+    cols = ", ".join(POINT_COLUMNS)
+    count = _copy_to_stage(
+        session, "points_stage", "(LIKE points)", POINT_COLUMNS, rows
+    )
+
+    if count == 0:
+        return 0
+
+    return _merge_stage(
+        session,
+        "INSERT INTO points (" + cols + ") SELECT " + cols + " FROM points_stage "
+        "ON CONFLICT ON CONSTRAINT points_un DO UPDATE SET "
+        "group_id = EXCLUDED.group_id, peakrange = EXCLUDED.peakrange",
+    )
+
+
+def copy_images(session: Session, rows: Iterable[dict]) -> int:
+    """Write images, given as dicts of column values (see IMAGE_COLUMNS), through
+    a COPY staging table. An image that already exists (by filename) keeps its
+    uid and has its other values updated.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        rows (Iterable[dict]): The column values of each image.
+
+    Returns:
+        int: the number of images inserted or updated.
+    """
+    cols = ", ".join(IMAGE_COLUMNS)
+    count = _copy_to_stage(
+        session, "images_stage", "(LIKE images)", IMAGE_COLUMNS, rows
+    )
+
+    if count == 0:
+        return 0
+
+    return _merge_stage(
+        session,
+        "INSERT INTO images (" + cols + ") SELECT DISTINCT ON (filename) " + cols +
+        " FROM images_stage ON CONFLICT ON CONSTRAINT images_un DO UPDATE SET "
+        "hastrack = EXCLUDED.hastrack, glf = EXCLUDED.glf, time = EXCLUDED.time, "
+        "sonarid = EXCLUDED.sonarid, range = EXCLUDED.range",
+    )
+
+
+def copy_groups_images(session: Session, rows: Iterable[dict]) -> int:
+    """Link images to groups through a COPY staging table. Each row holds a
+    group_id and the image filename, so links can be made to images that
+    already existed under a different uid. Links that already exist are skipped.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        rows (Iterable[dict]): The group_id and filename of each link.
+
+    Returns:
+        int: the number of new links.
+    """
+    count = _copy_to_stage(
+        session,
+        "groups_images_stage",
+        "(group_id uuid, filename character varying)",
+        ["group_id", "filename"],
+        rows,
+    )
+
+    if count == 0:
+        return 0
+
+    return _merge_stage(
+        session,
+        "INSERT INTO groups_images (group_id, image_id) "
+        "SELECT DISTINCT s.group_id, i.uid FROM groups_images_stage AS s "
+        "JOIN images AS i ON i.filename = s.filename "
+        "ON CONFLICT DO NOTHING",
+    )
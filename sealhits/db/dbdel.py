@@ -15,110 +15,95 @@ __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 
-from sqlalchemy.orm import (
-    Session,
-)
-
-from sealhits.db.dbschema import (
-    Points,
-    Groups,
-    Images,
-    GLFS,
-    PGDFS,
-    TrackGroup
-)
-
-def del_by_sqlite(self, sqlite:str):
+import logging
+from sqlalchemy import text
+
+
+def _shared_step(table: str, assoc: str, link: str) -> str:
+    """The statement that unlinks the images, GLFs or PGDFs from the groups
+    being removed, deleting those left linked to no other group. The CTE's
+    DELETE isn't visible to the outer statement, hence the check against
+    undigest_groups."""
+    return f"""WITH links AS (
+            DELETE FROM {assoc} AS l USING undigest_groups AS g
+            WHERE l.group_id = g.uid RETURNING l.{link} AS uid
+        )
+        DELETE FROM {table} AS x USING (SELECT DISTINCT uid FROM links) AS d
+        WHERE x.uid = d.uid AND NOT EXISTS (
+            SELECT 1 FROM {assoc} AS o
+            WHERE o.{link} = x.uid
+            AND o.group_id NOT IN (SELECT uid FROM undigest_groups)
+        )"""
+
+
+# The statements that undo an ingest, in order, with the table each deletes
+# from. They work from the temporary undigest_groups table of the uids of the
+# groups for the sqlite file.
+UNDIGEST_STEPS = [
+    (
+        "points",
+        """DELETE FROM points AS p USING tracks_groups AS t, undigest_groups AS g
+        WHERE p.track_id = t.track_id AND t.group_id = g.uid""",
+    ),
+    (
+        "points",
+        "DELETE FROM points AS p USING undigest_groups AS g WHERE p.group_id = g.uid",
+    ),
+    (
+        "tracks_groups",
+        "DELETE FROM tracks_groups AS t USING undigest_groups AS g WHERE t.group_id = g.uid",
+    ),
+    ("images", _shared_step("images", "groups_images", "image_id")),
+    ("glfs", _shared_step("glfs", "groups_glfs", "glf_id")),
+    ("pgdfs", _shared_step("pgdfs", "groups_pgdfs", "pgdf_id")),
+    ("groups", "DELETE FROM groups AS gr USING undigest_groups AS g WHERE gr.uid = g.uid"),
+    (
+        "points",
+        """DELETE FROM points AS p WHERE p.group_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM groups AS gr WHERE gr.uid = p.group_id)""",
+    ),
+]
+
+
+def del_by_sqlite(self, sqlite: str, dry_run=False) -> dict:
     """ Delete all the records that were imported from a particular database.
-    Effectively an 'undo' of an ingest.
+    Effectively an 'undo' of an ingest. This is a handful of set based
+    DELETE statements (see UNDIGEST_STEPS) in a single transaction, or
+    as part of the current unit_of_work.
+    Points left without a group, from any ingest, are removed too.
 
     Args:
         sqlite (str): the name of the sqlite file used in the initial import.
+        dry_run (bool): count what would be deleted, then roll back.
     
     Returns:
-        None
+        dict: the number of rows deleted (or that would be) from each table.
     """
     assert(sqlite is not None)
-
-    with Session(self.engine) as session:
-        groups = session.query(Groups).where(Groups.sqlite == sqlite).order_by(Groups.gid.asc()).all()
-
-        for group in groups:
-            # Track groups list, then remove the points on these tracks first before the tracks themselves
-            tracks = session.query(TrackGroup).where(TrackGroup.group_id == group.uid).all()
-
-            for track in tracks:
-                # Start deleting points
-                points = session.query(Points).where(Points.track_id == track.track_id).all()
-            
-                for point in points:
-                    session.delete(point)
-
-                session.delete(track)
-
-            # Now go with images. This is a many to many so we can only delete these
-            # that are only on this group (probably most of them)
-            images = session.query(Images).join(Groups, Images.groups).filter(Groups.uid == group.uid)
-
-            for image in images:
-                del_image = True
-
-                # If all groups are in this image then delete
-                for ig in image.groups:
-                    if ig not in groups:
-                        del_image = False
-                    else:
-                        image.groups.remove(ig) # Remove from the list forces ORM to remove from the intermediate table
-
-                if del_image: 
-                    session.delete(image)
-            
-
-            # GLFS
-            glfs = session.query(GLFS).join(Groups, GLFS.groups).filter(Groups.uid == group.uid)
-
-            for glf in glfs:
-                del_glf = True
-
-                # If all groups are in this image then delete
-                for ig in glf.groups:
-                    if ig not in groups:
-                        del_glf = False
-                    else:
-                        glf.groups.remove(ig)
-                
-                if del_glf: 
-                    session.delete(glf)
-
-
-            # PGDFs
-            pgdfs = session.query(PGDFS).join(Groups, PGDFS.groups).filter(Groups.uid == group.uid)
-
-            for pgdf in pgdfs:
-                del_pgdf = True
-
-                # If all groups are in this image then delete
-                for ig in pgdf.groups:
-                    if ig not in groups:
-                        del_pgdf = False
-                    else:
-                        pgdf.groups.remove(ig)
-                
-                if del_pgdf: 
-                    session.delete(pgdf)
-        
-        # Finally delete the groups
-        groups = session.query(Groups).where(Groups.sqlite == sqlite).order_by(Groups.gid.asc()).all()
-        
-        for group in groups:
-            session.delete(group)
-
-        # Actually finally - delete any orphaned points. These may be around despite the groups having
-        # been deleted
-        subquery = session.query(Groups.uid)
-        points = session.query(Points).where(~Points.group_id.in_(subquery))
-        
-        for point in points:
-            session.delete(point)
-
-        session.commit()
\ No newline at end of file
+    counts = {}
+
+    with self._write_session() as session:
+        # A savepoint, so a dry run inside a unit_of_work only rolls back
+        # the undigest.
+        savepoint = session.begin_nested()
+        session.execute(text("DROP TABLE IF EXISTS pg_temp.undigest_groups"))
+        session.execute(
+            text(
+                "CREATE TEMP TABLE undigest_groups ON COMMIT DROP AS "
+                "SELECT uid FROM groups WHERE sqlite = :sqlite"
+            ),
+            {"sqlite": sqlite},
+        )
+
+        for name, sql in UNDIGEST_STEPS:
+            result = session.execute(text(sql))
+            counts[name] = counts.get(name, 0) + result.rowcount
+
+        logging.info("Undigest of %s: %s", sqlite, counts)
+
+        if dry_run:
+            savepoint.rollback()
+        else:
+            savepoint.commit()
+
+    return counts
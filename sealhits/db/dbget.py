@@ -22,6 +22,7 @@ __all__ = [
     "get_points_group",
     "get_image_points_by_filename",
     "get_image_points_by_filename_group",
+    "get_group_image_bbs",
     "get_image_groups_by_filename",
     "get_images_group_sonarid",
     "get_tracks_group_uid",
@@ -29,17 +30,21 @@ __all__ = [
     "get_images_group",
     "get_image_uid",
     "get_img_fname",
+    "STREAM_SIZE",
+    "iter_groups",
+    "iter_groups_filters",
+    "iter_pgdfs",
+    "iter_tracks_groups",
+    "iter_images",
+    "iter_points",
 ]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 import uuid
-from typing import List, Union
-from sqlalchemy import select
+from typing import Dict, Iterator, List, Tuple, Union
+from sqlalchemy import Row, select
 
-from sqlalchemy.orm import (
-    Session,
-)
 from sealhits.db.dbschema import (
     groups_images,
     Points,
@@ -51,6 +56,7 @@ from sealhits.db.dbschema import (
 )
 
 from sqlalchemy.exc import IntegrityError, NoResultFound, MultipleResultsFound
+from sealhits.bbox import BearBox, points_to_bb
 
 
 def get_groups(self, code=None) -> List[Groups]:
@@ -65,7 +71,7 @@ def get_groups(self, code=None) -> List[Groups]:
 
     """
     results = []
-    with Session(self.engine) as session:
+    with self.session() as session:
         if code is not None:
             results = (
                 session.query(Groups)
@@ -94,7 +100,7 @@ def get_groups_filters(self, filters) -> List[Groups]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         q = session.query(Groups).filter(*filters).all()
         results = q
 
@@ -118,7 +124,7 @@ def get_num_groups(self, code=None, originals=False) -> int:
     """
     res = 0
     # TODO - this is a bit verbose. Maybe compose where clauses?
-    with Session(self.engine) as session:
+    with self.session() as session:
         if code is not None:
             if originals:
                 res = int(
@@ -149,7 +155,7 @@ def get_pgdfs(self, limit=-1) -> List[PGDFS]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         if limit > 0:
             results = (
                 session.query(PGDFS).order_by(PGDFS.startdate.asc()).limit(limit).all()
@@ -169,7 +175,7 @@ def get_pgdfs_distinct(self) -> List[PGDFS]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = session.query(PGDFS).order_by(PGDFS.startdate.asc()).distinct().all()
 
     return results
@@ -187,7 +193,7 @@ def get_pgdf_filename(self, fname: str) -> Union[PGDFS | None]:
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         stmt = select(PGDFS).where(PGDFS.filename == fname)
         result = session.scalars(stmt).one_or_none()
 
@@ -206,7 +212,7 @@ def get_glf_filename(self, fname: str) -> Union[GLFS | None]:
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         stmt = select(GLFS).where(GLFS.filename == fname)
         result = session.scalars(stmt).one_or_none()
 
@@ -241,7 +247,7 @@ def get_group_uid(self, uid: uuid.uuid4) -> Union[Groups | None]:
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         result = session.execute(
             select(Groups).where(Groups.uid == uid)
         ).scalar_one_or_none()
@@ -262,7 +268,7 @@ def get_group_huid(self, huid: str) -> Union[Groups | None]:
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         result = session.execute(
             select(Groups).where(Groups.huid == huid)
         ).scalar_one_or_none()
@@ -282,7 +288,7 @@ def get_group_track(self, track_id: uuid.uuid4) -> Union[Groups | None]:
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         result = session.execute(
             select(Groups)
             .join(TrackGroup)
@@ -314,7 +320,7 @@ def get_group_gid_sqlite_id_split(
     """
     result = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         result = session.execute(
             select(Groups)
             .where(Groups.gid == gid)
@@ -344,7 +350,7 @@ def get_group_gid_sqlite_id(
     """
     results = None
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = session.execute(
             select(Groups)
             .where(Groups.gid == gid)
@@ -370,7 +376,7 @@ def get_images_groups(self, sonar_id: int) -> List[Groups]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = session.execute(
             select(Images, Groups.uid)
             .join(Images.groups)
@@ -391,7 +397,7 @@ def get_tracks_groups(self) -> List[TrackGroup]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         stmt = select(TrackGroup)
         results = session.scalars(stmt).all()
 
@@ -414,7 +420,7 @@ def get_tracks_groups_groups_binfile(
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         q = (
             session.query(TrackGroup)
             .filter(TrackGroup.group_id.in_(group_uids))
@@ -446,7 +452,7 @@ def get_points_group(self, group_id: Union[uuid.UUID, str]) -> List[Points]:
         g = self.get_group_huid(group_id)
         group_uid = g.uid
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         q = session.query(Points).filter(Points.group_id == group_uid).all()
         results = q
 
@@ -460,7 +466,7 @@ def get_sqlites(self) -> List[str]:
        List[str]: List of sqlites in the database as strings.
     """
     results = []
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = session.execute(select(Groups.sqlite).distinct()).scalars().all()
 
     return results
@@ -477,7 +483,7 @@ def get_image_points_by_filename(self, imagefile: str) -> List[Points]:
 
     """
     results = []
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = (
             session.execute(
                 select(Points)
@@ -518,7 +524,7 @@ def get_image_points_by_filename_group(
     else:
         filters.append(Groups.huid == group_id)
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         results = (
             session.execute(
                 select(Points)
@@ -538,6 +544,58 @@ def get_image_points_by_filename_group(
     return results
 
 
+def get_group_image_bbs(
+    self, group_id: Union[uuid.UUID, str], sonarid=None
+) -> Dict[Tuple[str, int], Tuple[List[Points], BearBox]]:
+    """Get all the points in an annotated group, matched to their images, in
+    a single query. This replaces calling get_image_points_by_filename_group
+    for every image in a group. Images without any points are not included.
+
+    Args:
+        group_id (Union[uuid.UUID, str]): group to match against, either with a uuid or huid string.
+        sonarid (int): optionally, only return the images from this sonar.
+
+    Returns:
+       Dict[Tuple[str, int], Tuple[List[Points], BearBox]]: the points and their bounding box, keyed by image filename and sonar id.
+
+    """
+    results = {}
+    filters = []
+
+    if type(group_id) is uuid.UUID:
+        filters.append(Groups.uid == group_id)
+    else:
+        filters.append(Groups.huid == group_id)
+
+    if sonarid is not None:
+        filters.append(Images.sonarid == sonarid)
+
+    with self.session() as session:
+        rows = session.execute(
+            select(Images.filename, Images.sonarid, Images.range, Points)
+            .join_from(Groups, Points)
+            .join_from(Groups, groups_images)
+            .join_from(groups_images, Images)
+            .filter(*filters)
+            .filter(Points.group_id == Groups.uid)
+            .filter(Points.time == Images.time)
+            .filter(Points.sonarid == Images.sonarid)
+            .order_by(Images.time, Images.filename)
+        ).all()
+
+    ranges = {}
+
+    for filename, img_sonarid, img_range, point in rows:
+        key = (filename, img_sonarid)
+        results.setdefault(key, []).append(point)
+        ranges[key] = img_range
+
+    return {
+        key: (points, points_to_bb(points, ranges[key]))
+        for key, points in results.items()
+    }
+
+
 def get_image_groups_by_filename(self, filename: str) -> List[Groups]:
     """Return a list of all the groups in the image with this filename.
 
@@ -550,7 +608,7 @@ def get_image_groups_by_filename(self, filename: str) -> List[Groups]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         try:
             results = (
                 session.execute(
@@ -588,7 +646,7 @@ def get_tracks_group_uid(self, group_id: Union[uuid.UUID, str]) -> List[TrackGro
         g = self.get_group_huid(group_id)
         group_uid = g.uid
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         try:
             q = session.query(TrackGroup).filter(TrackGroup.group_id == group_uid).all()
 
@@ -613,7 +671,7 @@ def get_points_from_track(self, track_uid: uuid.UUID) -> List[Points]:
     """
     results = []
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         try:
             q = session.query(Points).filter(Points.track_id == track_uid).all()
 
@@ -645,7 +703,7 @@ def get_images_group(self, group_id:Union[str, uuid.UUID]) -> Union[List[Images]
     else:
         filters.append(Groups.huid == group_id)
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         try:
             results = (
                 session.execute(
@@ -687,7 +745,7 @@ def get_images_group_sonarid(self, group_id, sonar_id: int) -> Union[List[Images
 
     filters.append(Images.sonarid == sonar_id)
 
-    with Session(self.engine) as session:
+    with self.session() as session:
         try:
             results = (
                 session.execute(
@@ -719,7 +777,7 @@ def get_image_uid(self, image_uid: uuid.uuid4) -> Union[Images | None]:
     result = None
 
     try:
-        with Session(self.engine) as session:
+        with self.session() as session:
             result = session.query(Images).where(Images.uid == image_uid).first()
 
     except IntegrityError as e:
@@ -741,7 +799,7 @@ def get_img_fname(self, image_fname: str) -> Union[Images, None]:
     result = None
 
     try:
-        with Session(self.engine) as session:
+        with self.session() as session:
             result = session.query(Images).where(Images.filename == image_fname).first()
 
     except MultipleResultsFound as e:
@@ -752,3 +810,147 @@ def get_img_fname(self, image_fname: str) -> Union[Images, None]:
         print("get_img_fname failed", e)
 
     return result
+
+
+# How many rows the iter_ functions fetch from the server at a time.
+STREAM_SIZE = 1000
+
+
+def _select(entity, rows: bool):
+    """Select either the ORM objects or just the column values of a table."""
+    if rows:
+        return select(*entity.__table__.columns)
+
+    return select(entity)
+
+
+def _stream(self, stmt, rows: bool, yield_per: int) -> Iterator:
+    """Run a select with a server-side cursor, yielding the results as they
+    are fetched, yield_per at a time. The session (and its connection) is held
+    until the iterator is exhausted or closed."""
+    with self.session() as session:
+        result = session.execute(stmt, execution_options={"yield_per": yield_per})
+
+        if not rows:
+            result = result.scalars()
+
+        try:
+            for item in result:
+                yield item
+
+        finally:
+            result.close()
+
+
+def iter_groups(
+    self, code=None, rows=False, yield_per=STREAM_SIZE
+) -> Iterator[Union[Groups, Row]]:
+    """Iterate over all the groups, ordered by the pamguard sqlite uid ascending,
+    in constant memory. Optionally a search can be made using a code. The
+    groups are fetched with a server-side cursor, yield_per at a time.
+
+    Args:
+        code (str): a string to match against the 'code' field on groups.
+        rows (bool): yield lightweight rows of the column values rather than 'Groups'.
+        yield_per (int): how many groups to fetch at a time.
+
+    Returns:
+        Iterator[Union[Groups, Row]]: the groups, or their rows.
+
+    """
+    stmt = _select(Groups, rows)
+
+    if code is not None:
+        stmt = stmt.where(Groups.code == code)
+
+    return _stream(self, stmt.order_by(Groups.gid.asc()), rows, yield_per)
+
+
+def iter_groups_filters(
+    self, filters, rows=False, yield_per=STREAM_SIZE
+) -> Iterator[Union[Groups, Row]]:
+    """Iterate over the groups matching a number of filters, in constant memory.
+    As with get_groups_filters, filters must be a list or tuple.
+
+    Args:
+        filters (List[]): as list of 'filters' such as 'Groups.mammal > 1'
+        rows (bool): yield lightweight rows of the column values rather than 'Groups'.
+        yield_per (int): how many groups to fetch at a time.
+
+    Returns:
+        Iterator[Union[Groups, Row]]: the groups, or their rows.
+
+    """
+    return _stream(self, _select(Groups, rows).filter(*filters), rows, yield_per)
+
+
+def iter_pgdfs(self, rows=False, yield_per=STREAM_SIZE) -> Iterator[Union[PGDFS, Row]]:
+    """Iterate over all the PGDFs, ordered by start date, in constant memory.
+
+    Args:
+        rows (bool): yield lightweight rows of the column values rather than 'PGDFS'.
+        yield_per (int): how many PGDFs to fetch at a time.
+
+    Returns:
+        Iterator[Union[PGDFS, Row]]: the PGDFs, or their rows.
+    """
+    stmt = _select(PGDFS, rows).order_by(PGDFS.startdate.asc())
+    return _stream(self, stmt, rows, yield_per)
+
+
+def iter_tracks_groups(
+    self, rows=False, yield_per=STREAM_SIZE
+) -> Iterator[Union[TrackGroup, Row]]:
+    """Iterate over all the TrackGroups in constant memory.
+
+    Args:
+        rows (bool): yield lightweight rows of the column values rather than 'TrackGroup'.
+        yield_per (int): how many tracks to fetch at a time.
+
+    Returns:
+        Iterator[Union[TrackGroup, Row]]: the tracks, or their rows.
+    """
+    return _stream(self, _select(TrackGroup, rows), rows, yield_per)
+
+
+def iter_images(
+    self, sonar_id=None, rows=False, yield_per=STREAM_SIZE
+) -> Iterator[Union[Images, Row]]:
+    """Iterate over all the images, ordered by time, in constant memory.
+
+    Args:
+        sonar_id (int): optionally, only the images from this sonar.
+        rows (bool): yield lightweight rows of the column values rather than 'Images'.
+        yield_per (int): how many images to fetch at a time.
+
+    Returns:
+        Iterator[Union[Images, Row]]: the images, or their rows.
+    """
+    stmt = _select(Images, rows)
+
+    if sonar_id is not None:
+        stmt = stmt.where(Images.sonarid == sonar_id)
+
+    return _stream(self, stmt.order_by(Images.time.asc()), rows, yield_per)
+
+
+def iter_points(
+    self, group_id=None, rows=False, yield_per=STREAM_SIZE
+) -> Iterator[Union[Points, Row]]:
+    """Iterate over all the points, or those of one group, ordered by time,
+    in constant memory.
+
+    Args:
+        group_id (uuid.UUID): optionally, only the points of this group.
+        rows (bool): yield lightweight rows of the column values rather than 'Points'.
+        yield_per (int): how many points to fetch at a time.
+
+    Returns:
+        Iterator[Union[Points, Row]]: the points, or their rows.
+    """
+    stmt = _select(Points, rows)
+
+    if group_id is not None:
+        stmt = stmt.where(Points.group_id == group_id)
+
+    return _stream(self, stmt.order_by(Points.time.asc()), rows, yield_per)
@@ -0,0 +1,105 @@
+"""
+dbindex.py - The indexes for the hot query shapes.
+
+The unique constraints already index images.filename,
+points ("time", sonarid, ...), tracks_groups (track_pam_id, binfile)
+and groups (gid, sqliteid, split, sqlite). These are the other indexes the getters, the
+ingest and undigest rely on, along with a check that a query
+is planned without sequential scans.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "INDEXES",
+    "create_indexes",
+    "seq_scans",
+]
+
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import json
+from typing import Set
+from sqlalchemy import Engine, text
+from sqlalchemy.orm import (
+    Session,
+)
+
+# Index name, table and columns.
+INDEXES = [
+    # Points by track, when undigesting or diffing a model.
+    ("points_track_id_idx", "points", "track_id"),
+    # Tracks by group.
+    ("tracks_groups_group_id_idx", "tracks_groups", "group_id"),
+    # Groups by sqlite file, when modelling or undigesting an ingest.
+    ("groups_sqlite_idx", "groups", "sqlite"),
+    # The primary keys of the link tables lead with the other id.
+    ("groups_images_group_id_idx", "groups_images", "group_id"),
+    ("groups_glfs_group_id_idx", "groups_glfs", "group_id"),
+    ("groups_pgdfs_group_id_idx", "groups_pgdfs", "group_id"),
+]
+
+
+def create_indexes(engine: Engine, concurrently=True):
+    """Create any of the INDEXES that don't exist yet, then analyze the
+    tables. CREATE INDEX CONCURRENTLY doesn't lock the tables against
+    writes, but can't run in a transaction, so each index is created
+    in autocommit mode.
+
+    Args:
+        engine (Engine): the SQLAlchemy engine.
+        concurrently (bool): build the indexes without locking out writes (default: True).
+    """
+    how = "CONCURRENTLY " if concurrently else ""
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as con:
+        for name, table, columns in INDEXES:
+            con.execute(
+                text(
+                    "CREATE INDEX " + how + "IF NOT EXISTS " + name +
+                    " ON public." + table + " USING btree (" + columns + ")"
+                )
+            )
+
+        for table in sorted(set(table for _, table, _ in INDEXES)):
+            con.execute(text("ANALYZE public." + table))
+
+
+def _plan_scans(plan: dict, found: Set[str]):
+    if plan.get("Node Type", "") == "Seq Scan":
+        found.add(plan["Relation Name"])
+
+    for child in plan.get("Plans", []):
+        _plan_scans(child, found)
+
+
+def seq_scans(session: Session, sql: str, params=None) -> Set[str]:
+    """Return the tables a query would scan sequentially. Sequential scans
+    are discouraged while planning, so on small tables (where they would be
+    cheaper) this still shows whether an index can be used. The setting only
+    lasts for the current transaction, which is rolled back afterwards, so
+    call this outside of any work that needs committing.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        sql (str): the query to check.
+        params (dict): the query parameters.
+
+    Returns:
+        Set[str]: the names of the tables scanned sequentially.
+    """
+    found = set()
+
+    try:
+        session.execute(text("SET LOCAL enable_seqscan = off"))
+        result = session.execute(text("EXPLAIN (FORMAT JSON) " + sql), params or {}).scalar()
+
+    finally:
+        session.rollback()
+
+    if isinstance(result, str):
+        result = json.loads(result)
+
+    _plan_scans(result[0]["Plan"], found)
+    return found
@@ -12,11 +12,26 @@ __all__ = ["DBModel", "gen_model", "diff_models"]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
+from typing import Iterable, List
+from sqlalchemy import select
 from sqlalchemy.orm import (
     Session,
 )
 
-from sealhits.db.dbschema import GLFS, PGDFS, Groups, Images, Points, TrackGroup
+from sealhits.db.dbschema import (
+    GLFS,
+    PGDFS,
+    Groups,
+    Images,
+    Points,
+    TrackGroup,
+    groups_glfs,
+    groups_images,
+    groups_pgdfs,
+)
+
+QUERY_CHUNK = 1000  # Maximum number of values in one IN clause
+
 
 class DBModel:
     """ Simmple struct like class to hold the model."""
@@ -29,10 +44,22 @@ class DBModel:
         self.track_groups = []
 
 
+def _in_groups(assoc, column, sqlname: str):
+    """A subquery selecting the ids in an association table that belong
+    to the groups of an sqlite file."""
+    return (
+        select(column)
+        .join(Groups, Groups.uid == assoc.c.group_id)
+        .where(Groups.sqlite == sqlname)
+    )
+
+
 def gen_model(session: Session, sqlname: str) -> DBModel:
     """ Return the objects in our ORM model for a particular sqlname, 
     within a session. Mostly this is used to compare against a recent 
-    ingest to see what needs to be deleted.
+    ingest to see what needs to be deleted. Each kind of object is
+    loaded with a single query, selecting on the groups of the sqlite
+    file, rather than walking the groups one at a time.
 
     Args:
         session (Session): the current sqlalchemy session.
@@ -43,37 +70,73 @@ def gen_model(session: Session, sqlname: str) -> DBModel:
 
     """
     model = DBModel()
+    group_uids = select(Groups.uid).where(Groups.sqlite == sqlname)
 
     with session.no_autoflush:
         model.groups = session.query(Groups).filter(Groups.sqlite == sqlname).all()
+        model.images = (
+            session.query(Images)
+            .filter(
+                Images.uid.in_(
+                    _in_groups(groups_images, groups_images.c.image_id, sqlname)
+                )
+            )
+            .all()
+        )
+        model.pgdfs = (
+            session.query(PGDFS)
+            .filter(
+                PGDFS.uid.in_(_in_groups(groups_pgdfs, groups_pgdfs.c.pgdf_id, sqlname))
+            )
+            .all()
+        )
+        model.glfs = (
+            session.query(GLFS)
+            .filter(
+                GLFS.uid.in_(_in_groups(groups_glfs, groups_glfs.c.glf_id, sqlname))
+            )
+            .all()
+        )
+        model.track_groups = (
+            session.query(TrackGroup).filter(TrackGroup.group_id.in_(group_uids)).all()
+        )
+        model.points = (
+            session.query(Points).filter(Points.group_id.in_(group_uids)).all()
+        )
+
+    return  model
 
-        for group in model.groups:
-            model.images += group.images
-            model.pgdfs += group.pgdfs
-            model.glfs += group.glfs
 
-            tg = (
-                session.query(TrackGroup)
-                .filter(TrackGroup.group_id == group.uid)
-                .all()
-            )
+def _uids(objs, attr="uid") -> set:
+    """The set of uids of a model's objects. A collection with its own uids
+    method (such as a PointStore) gives them without making objects."""
+    if hasattr(objs, "uids"):
+        return objs.uids()
+
+    return {getattr(o, attr) for o in objs}
+
 
-            model.track_groups += tg
+def _load_by_uid(session: Session, table, column, uids: Iterable) -> List:
+    """Load the objects with these uids in chunked IN queries."""
+    uids = list(uids)
+    found = []
 
-            tp = (
-                session.query(Points)
-                .filter(Points.group_id == group.uid)
+    with session.no_autoflush:
+        for i in range(0, len(uids), QUERY_CHUNK):
+            found += (
+                session.query(table)
+                .filter(column.in_(uids[i : i + QUERY_CHUNK]))
                 .all()
             )
 
-            model.points += tp
-
-    return  model
+    return found
 
 
 def diff_models(session: Session, model_a: DBModel, model_b: DBModel) -> DBModel:
     """ Compare two models - find the objects that do not exist in model_b
      but do exist in model_a and therefore should be removed from model_a.
+     The differences are taken between sets of uids, then the objects to
+     remove are loaded in a few bulk queries.
      
     Args:
         session (Session): the current sqlalchemy session.
@@ -87,89 +150,26 @@ def diff_models(session: Session, model_a: DBModel, model_b: DBModel) -> DBModel
     
     model_diff = DBModel()
 
-    # Start with groups
-    groups_a = {a.uid for a in model_a.groups}
-    groups_b = {b.uid for b in model_b.groups}
-
-    groups_diff = groups_a - groups_b
+    groups_diff = _uids(model_a.groups) - _uids(model_b.groups)
+    model_diff.groups = _load_by_uid(session, Groups, Groups.uid, groups_diff)
 
-    for uid in groups_diff:
-        tt = (
-                session.query(Groups)
-                .filter(Groups.uid == uid)
-                .one()
-            )
-        model_diff.groups.append(tt)
-    
-    # Now Points
-    points_a = {a.uid for a in model_a.points}
-    points_b = {b.uid for b in model_b.points}
-
-    points_diff = points_a - points_b
-
-    for uid in points_diff:
-        tt = (
-                session.query(Points)
-                .filter(Points.uid == uid)
-                .one()
-            )
-        model_diff.points.append(tt)
-
-    # Images
-    images_a = {a.uid for a in model_a.images}
-    images_b = {b.uid for b in model_b.images}
-
-    images_diff = images_a - images_b
-
-    for uid in images_diff:
-        tt = (
-                session.query(Images)
-                .filter(Images.uid == uid)
-                .one()
-            )
-        model_diff.images.append(tt)
+    points_diff = _uids(model_a.points) - _uids(model_b.points)
+    model_diff.points = _load_by_uid(session, Points, Points.uid, points_diff)
 
-    # PGDFS
-    pgdfs_a = {a.uid for a in model_a.pgdfs}
-    pgdfs_b = {b.uid for b in model_b.pgdfs}
+    images_diff = _uids(model_a.images) - _uids(model_b.images)
+    model_diff.images = _load_by_uid(session, Images, Images.uid, images_diff)
 
-    pgdfs_diff = pgdfs_a - pgdfs_b
+    pgdfs_diff = _uids(model_a.pgdfs) - _uids(model_b.pgdfs)
+    model_diff.pgdfs = _load_by_uid(session, PGDFS, PGDFS.uid, pgdfs_diff)
 
-    for uid in pgdfs_diff:
-        tt = (
-                session.query(PGDFS)
-                .filter(PGDFS.uid == uid)
-                .one()
-            )
-        model_diff.pgdfs.append(tt)
-
-    # GLFS
-    glfs_a = {a.uid for a in model_a.glfs}
-    glfs_b = {b.uid for b in model_b.glfs}
-
-    glfs_diff = glfs_a - glfs_b
-
-    for uid in glfs_diff:
-        tt = (
-                session.query(GLFS)
-                .filter(GLFS.uid == uid)
-                .one()
-            )
-        model_diff.glfs.append(tt)
+    glfs_diff = _uids(model_a.glfs) - _uids(model_b.glfs)
+    model_diff.glfs = _load_by_uid(session, GLFS, GLFS.uid, glfs_diff)
 
-
-    # TrackGroups
-    tg_a = {a.track_id for a in model_a.track_groups}
-    tg_b = {b.track_id for b in model_b.track_groups}
-
-    tg_diff = tg_a - tg_b
-
-    for uid in tg_diff:
-        tt = (
-                session.query(TrackGroup)
-                .filter(TrackGroup.track_id == uid)
-                .one()
-            )
-        model_diff.track_groups.append(tt)
+    tg_diff = _uids(model_a.track_groups, "track_id") - _uids(
+        model_b.track_groups, "track_id"
+    )
+    model_diff.track_groups = _load_by_uid(
+        session, TrackGroup, TrackGroup.track_id, tg_diff
+    )
 
     return model_diff
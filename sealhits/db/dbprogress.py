@@ -0,0 +1,140 @@
+"""
+dbprogress.py - Ingest progress records.
+
+Long ingests commit their work in small units. Each committed
+unit is recorded in the ingest_progress table, in the same
+transaction as the work itself, so an interrupted ingest can
+skip the units that are already in the database.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "STAGE_GROUPS",
+    "STAGE_GLFS",
+    "UNIT_ALL",
+    "get_completed",
+    "mark_completed",
+    "clear_progress",
+    "checkpoint_glfs",
+]
+
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import datetime
+import pytz
+from typing import Callable, List, Set
+
+from sqlalchemy import delete, inspect, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import (
+    Session,
+    make_transient_to_detached,
+)
+
+from sealhits.db.dbcopy import IMAGE_COLUMNS, copy_groups_images, copy_images
+from sealhits.db.dbschema import GLFS, Groups, Images, IngestProgress
+
+STAGE_GROUPS = "groups"  # Groups, tracks, PGDFs and points
+STAGE_GLFS = "glfs"  # Images and GLFs, one unit per group
+UNIT_ALL = "all"  # The unit name for a stage committed in one go
+
+
+def get_completed(session: Session, sqlite: str, stage: str) -> Set[str]:
+    """Return the units already completed for a stage of an ingest.
+
+    Args:
+        session (Session): the current sqlalchemy session.
+        sqlite (str): The name of the sqlite file being ingested.
+        stage (str): The stage of the ingest.
+
+    Returns:
+        Set[str]: the names of the completed units.
+    """
+    q = select(IngestProgress.unit).where(
+        IngestProgress.sqlite == sqlite, IngestProgress.stage == stage
+    )
+
+    return set(session.scalars(q).all())
+
+
+def mark_completed(session: Session, sqlite: str, stage: str, units: List[str]):
+    """Record units of an ingest as completed. Nothing is committed here;
+    the records should be committed along with the work they describe.
+
+    Args:
+        session (Session): the current sqlalchemy session.
+        sqlite (str): The name of the sqlite file being ingested.
+        stage (str): The stage of the ingest.
+        units (List[str]): The names of the completed units.
+    """
+    if len(units) == 0:
+        return
+
+    now = datetime.datetime.now(pytz.UTC)
+    rows = [
+        {"sqlite": sqlite, "stage": stage, "unit": unit, "completed": now}
+        for unit in units
+    ]
+    session.execute(insert(IngestProgress).values(rows).on_conflict_do_nothing())
+
+
+def clear_progress(session: Session, sqlite: str):
+    """Forget all the progress recorded for a sqlite file, either because a
+    fresh ingest is starting or because the ingest has finished.
+
+    Args:
+        session (Session): the current sqlalchemy session.
+        sqlite (str): The name of the sqlite file being ingested.
+    """
+    session.execute(delete(IngestProgress).where(IngestProgress.sqlite == sqlite))
+
+
+def checkpoint_glfs(
+    session: Session, sqlite: str
+) -> Callable[[List[Groups], List[GLFS], List[Images]], None]:
+    """Return the function process_glfs calls after each batch of groups. It
+    adds the new GLFs to the session, writes the new images and their links
+    to the groups with COPY (see dbcopy), records the groups as done and
+    commits, so an interrupted ingest only loses the current batch.
+
+    Args:
+        session (Session): the current sqlalchemy session.
+        sqlite (str): The name of the sqlite file being ingested.
+
+    Returns:
+        Callable[[List[Groups], List[GLFS], List[Images]], None]: the checkpoint function.
+    """
+
+    def checkpoint(groups: List[Groups], glfs: List[GLFS], images: List[Images]):
+        session.add_all(glfs)
+        images = list({id(image): image for image in images}.values())
+        new_images = [image for image in images if inspect(image).transient]
+        links = {(g.uid, image.filename) for image in images for g in image.groups}
+
+        # The links are written by COPY, so the ORM mustn't write them again.
+        for group in {g for image in images for g in image.groups}:
+            session.expire(group, ["images"])
+
+        for image in images:
+            if not inspect(image).transient:
+                session.expire(image, ["groups"])
+
+        copy_images(
+            session, ({c: getattr(i, c) for c in IMAGE_COLUMNS} for i in new_images)
+        )
+        copy_groups_images(
+            session, ({"group_id": g, "filename": f} for g, f in links)
+        )
+
+        # The new images are now in the database, so they join the session
+        # as if they had been loaded.
+        for image in new_images:
+            make_transient_to_detached(image)
+            session.add(image)
+
+        mark_completed(session, sqlite, STAGE_GLFS, [str(g.uid) for g in groups])
+        session.commit()
+
+    return checkpoint
@@ -15,6 +15,7 @@ __all__ = [
     "GLFS",
     "PGDFS",
     "TrackGroup",
+    "IngestProgress",
 ]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
@@ -192,3 +193,21 @@ class TrackGroup(Base):
 
     def __repr__(self) -> str:
         return f"TrackGroup(track_id={self.track_id!r}, group_id={self.group_id!r})"
+
+
+class IngestProgress(Base):
+    """Records the units of an ingest that have been committed, so an
+    interrupted ingest can be resumed. A unit is identified by the sqlite
+    file, the stage of the ingest and a name within that stage
+    (usually a group uid)."""
+
+    __tablename__ = "ingest_progress"
+
+    sqlite: Mapped[str] = mapped_column(primary_key=True)
+    stage: Mapped[str] = mapped_column(primary_key=True)
+    unit: Mapped[str] = mapped_column(primary_key=True)
+    completed: Mapped[datetime.datetime]
+
+    def __repr__(self) -> str:
+        return f"IngestProgress(sqlite={self.sqlite!r}, stage={self.stage!r}, \
+        unit={self.unit!r}, completed={self.completed})"
@@ -18,15 +18,11 @@ __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 import datetime
 import uuid
 
-from sqlalchemy.orm import (
-    Session,
-)
 from sealhits.db.dbschema import (
     Points,
     Groups,
 )
 
-from sqlalchemy.exc import IntegrityError
 
 # TODO - why not just pass a group object instead of the uid?
 def set_group_timestart(
@@ -38,14 +34,10 @@ def set_group_timestart(
         group_uid (uuid.uuid4): uid of the group
         new_timestart (datetime.datetime): the new datetime for the group start.
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Groups).filter(Groups.uid == group_uid).update(
-                {"timestart": new_timestart}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_group_timeend failed", e)
+    with self._write_session("set_group_timestart") as session:
+        session.query(Groups).filter(Groups.uid == group_uid).update(
+            {"timestart": new_timestart}
+        )
 
 
 def set_group_timeend(self, group_uid: uuid.uuid4, new_timeend: datetime.datetime):
@@ -55,14 +47,10 @@ def set_group_timeend(self, group_uid: uuid.uuid4, new_timeend: datetime.datetim
         group_uid (uuid.uuid4): uid of the group
         new_timeend (datetime.datetime): the new datetime for the group end.
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Groups).filter(Groups.uid == group_uid).update(
-                {"timeend": new_timeend}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_group_timeend failed", e)
+    with self._write_session("set_group_timeend") as session:
+        session.query(Groups).filter(Groups.uid == group_uid).update(
+            {"timeend": new_timeend}
+        )
 
 
 def set_group_huid(self, group_uid: uuid.uuid4, new_huid: str):
@@ -72,14 +60,10 @@ def set_group_huid(self, group_uid: uuid.uuid4, new_huid: str):
         new_huid(str): the new human readable ID (huid) 
     
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Groups).filter(Groups.uid == group_uid).update(
-                {"huid": new_huid}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_group_huid failed", e)
+    with self._write_session("set_group_huid") as session:
+        session.query(Groups).filter(Groups.uid == group_uid).update(
+            {"huid": new_huid}
+        )
 
 
 def set_group_split(self, group_uid: uuid.uuid4, new_split: int):
@@ -89,14 +73,10 @@ def set_group_split(self, group_uid: uuid.uuid4, new_split: int):
         group_uid (uuid.uuid4): uid of the group
         new_split (int): the new datetime for the group start.
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Groups).filter(Groups.uid == group_uid).update(
-                {"split": new_split}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_group_split failed", e)
+    with self._write_session("set_group_split") as session:
+        session.query(Groups).filter(Groups.uid == group_uid).update(
+            {"split": new_split}
+        )
 
 
 def set_point_track(self, point_uid: uuid.uuid4, new_track: uuid.uuid4):
@@ -107,14 +87,10 @@ def set_point_track(self, point_uid: uuid.uuid4, new_track: uuid.uuid4):
         new_track (uuid.uuid4): the new track this point belongs to.
 
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Points).filter(Points.uid == point_uid).update(
-                {"track_id": new_track}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_point_track failed", e)
+    with self._write_session("set_point_track") as session:
+        session.query(Points).filter(Points.uid == point_uid).update(
+            {"track_id": new_track}
+        )
 
 
 def set_point_group(self, point_id: uuid.uuid4, new_group: uuid.uuid4):
@@ -125,11 +101,7 @@ def set_point_group(self, point_id: uuid.uuid4, new_group: uuid.uuid4):
         new_group (uuid.uuid4): the new group this point belongs to.
     
     """
-    with Session(self.engine) as session:
-        try:
-            session.query(Points).filter(Points.uid == point_id).update(
-                {"group_id": new_group}
-            )
-            session.commit()
-        except IntegrityError as e:
-            print("set_point_group failed", e)
+    with self._write_session("set_point_group") as session:
+        session.query(Points).filter(Points.uid == point_id).update(
+            {"group_id": new_group}
+        )
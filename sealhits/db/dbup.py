@@ -15,9 +15,6 @@ __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 
-from sqlalchemy.orm import (
-    Session,
-)
 from sqlalchemy import select
 
 from sealhits.db.dbschema import (
@@ -31,7 +28,7 @@ def update_group(self, new_group: Groups):
     Args:
         new_group (Groups): the new Groups data. We update based on the uid.
     """
-    with Session(self.engine) as session:
+    with self._write_session() as session:
         exist_group = session.execute(
             select(Groups).where(Groups.uid == new_group.uid)
         ).scalar_one_or_none()
@@ -51,8 +48,6 @@ def update_group(self, new_group: Groups):
             exist_group.split = new_group.split
             exist_group.timestart = new_group.timestart
             exist_group.timeend = new_group.timeend
-        
-            session.commit()
             
 
         
@@ -0,0 +1,393 @@
+"""
+catalogue.py - the time ranges of the data files on a disk.
+
+A TimeCatalogue records the start and end times of every GLF
+and PGDF under a data root, whether or not an ingest has needed
+them yet. It is kept in a local SQLite file with an index on the
+times, so the files covering a time span can be found without
+reading any headers. Only new or changed files (according to the
+FileInventory) are read when the catalogue is refreshed, and only
+their headers for GLFs. The number of frames from each sonar in a
+GLF needs a full read, so is only counted when a frame estimate
+asks for it, then kept until the GLF changes.
+"""
+
+from __future__ import annotations
+
+__all__ = ["CATALOGUE_DIR", "TimeCatalogue"]
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import os
+import sqlite3
+import hashlib
+import logging
+import datetime
+import pytz
+from typing import List, Tuple, Union
+from pytritech.glf import GLF
+from pytritech.glftimes import glf_times
+from sealhits.sources.files import pgdf_date_range
+from sealhits.sources.inventory import INVENTORY_DIR, FileInventory
+from sealhits.utils import pool_map
+
+# Where the catalogues are kept by default.
+CATALOGUE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sealhits", "catalogue")
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+# Catalogues with an older schema are rebuilt.
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        path TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        ftype TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime INTEGER NOT NULL,
+        startdate INTEGER,
+        enddate INTEGER,
+        counted INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS files_time_idx ON files (ftype, startdate, enddate);
+    CREATE INDEX IF NOT EXISTS files_name_idx ON files (name);
+    CREATE TABLE IF NOT EXISTS frames (
+        path TEXT NOT NULL,
+        sonarid INTEGER NOT NULL,
+        frames INTEGER NOT NULL,
+        PRIMARY KEY (path, sonarid)
+    );
+"""
+
+
+def _to_us(t: Union[datetime.datetime, None]) -> Union[int, None]:
+    """Convert a datetime to microseconds since the epoch. Naive datetimes
+    are assumed to be UTC."""
+    if t is None:
+        return None
+
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=pytz.UTC)
+
+    return (t - EPOCH) // MICROSECOND
+
+
+def _from_us(t: int) -> datetime.datetime:
+    """Convert microseconds since the epoch to a UTC datetime."""
+    return EPOCH + datetime.timedelta(microseconds=t)
+
+
+def _read_glf_range(
+    path: str,
+) -> Tuple[str, Union[datetime.datetime, None], Union[datetime.datetime, None]]:
+    """Read the time range of a GLF from its header."""
+    try:
+        start, end = glf_times(path)
+        return (path, start, end)
+
+    except Exception as e:
+        logging.error("Could not read the times of GLF %s: %s", path, e)
+
+    return (path, None, None)
+
+
+def _read_pgdf_range(
+    path: str,
+) -> Tuple[str, Union[datetime.datetime, None], Union[datetime.datetime, None]]:
+    """Read the time range of a PGDF from its objects."""
+    result = pgdf_date_range(path)
+
+    if result is None:
+        return (path, None, None)
+
+    return result
+
+
+def _count_glf_frames(path: str) -> Tuple[str, dict]:
+    """Count the frames from each sonar in a GLF, from the image records
+    (without decoding them). This reads the whole GLF."""
+    frames = {}
+
+    try:
+        with GLF(path) as gf:
+            for image_rec in gf.images:
+                sonar_id = int(image_rec.header.device_id)
+                frames[sonar_id] = frames.get(sonar_id, 0) + 1
+
+    except Exception as e:
+        logging.error("Could not count the frames of GLF %s: %s", path, e)
+
+    return (path, frames)
+
+
+READERS = {"glf": _read_glf_range, "pgdf": _read_pgdf_range}
+
+
+class TimeCatalogue(object):
+    """The time ranges of the GLF and PGDF files under a data root.
+    Call refresh to bring it up to date with the disk."""
+
+    def __init__(
+        self, root: str, catalogue_dir=CATALOGUE_DIR, inventory_dir=INVENTORY_DIR
+    ):
+        """Open (or create) the catalogue for a data root.
+
+        Args:
+            root (str): the data root, usually the mount point of a disk.
+            catalogue_dir (str): the directory the catalogue files are kept in.
+            inventory_dir (str): the directory the file inventories are kept in.
+        """
+        self.root = os.path.abspath(root)
+        self.inventory_dir = inventory_dir
+        name = hashlib.sha1(self.root.encode("utf-8")).hexdigest() + ".sqlite3"
+        os.makedirs(catalogue_dir, exist_ok=True)
+        self.path = os.path.join(catalogue_dir, name)
+        self.con = sqlite3.connect(self.path)
+
+        if self.con.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.con.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS frames;")
+            self.con.execute("PRAGMA user_version = " + str(SCHEMA_VERSION))
+
+        self.con.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def refresh(self, ftypes=("glf", "pgdf"), workers=None, restat=False) -> TimeCatalogue:
+        """Bring the catalogue up to date with the disk. Files that are new, or
+        whose size or mtime has changed, have their times read. PGDFs are read
+        in parallel worker processes. Files that have gone are removed.
+
+        Args:
+            ftypes (Tuple[str]): the types of file to catalogue - 'glf' and/or 'pgdf'.
+            workers (int): the number of worker processes (default: the number of CPUs).
+            restat (bool): stat every file, to find files rewritten in place in
+                directories that haven't otherwise changed (default: False).
+
+        Returns:
+            TimeCatalogue: this catalogue, for chaining.
+        """
+        inventory = FileInventory(self.root, self.inventory_dir).refresh()
+
+        for ftype in ftypes:
+            known = {
+                path: (size, mtime)
+                for path, size, mtime in self.con.execute(
+                    "SELECT path, size, mtime FROM files WHERE ftype = ?", (ftype,)
+                )
+            }
+            on_disk = {f["path"]: f for f in inventory.files(ftype, restat)}
+
+            gone = [(path,) for path in known.keys() if path not in on_disk]
+            self.con.executemany("DELETE FROM files WHERE path = ?", gone)
+            self.con.executemany("DELETE FROM frames WHERE path = ?", gone)
+
+            to_read = [
+                path
+                for path, f in on_disk.items()
+                if known.get(path, None) != (f["size"], f["mtime"])
+            ]
+            logging.info(
+                "Catalogue of %s: %s %s files, reading the times of %s.",
+                self.root,
+                len(on_disk),
+                ftype,
+                len(to_read),
+            )
+
+            if ftype == "pgdf":
+                results = pool_map(READERS[ftype], to_read, workers)
+            else:
+                results = (READERS[ftype](path) for path in to_read)
+
+            rows = []
+
+            # Files we can't read are still recorded, without times, so they
+            # aren't read again until they change. Their frames are counted
+            # again when next asked for.
+            for path, start, end in results:
+                f = on_disk[path]
+                rows.append(
+                    (
+                        path,
+                        os.path.basename(path),
+                        ftype,
+                        f["size"],
+                        f["mtime"],
+                        _to_us(start),
+                        _to_us(end),
+                    )
+                )
+
+            self.con.executemany(
+                "DELETE FROM frames WHERE path = ?", [(path,) for path in to_read]
+            )
+            self.con.executemany(
+                "INSERT OR REPLACE INTO files "
+                "(path, name, ftype, size, mtime, startdate, enddate) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.con.commit()
+
+        return self
+
+    def overlapping(
+        self, ftype: str, start_t: datetime.datetime, end_t: datetime.datetime
+    ) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+        """Return the files whose time range overlaps start_t to end_t (inclusive).
+
+        Args:
+            ftype (str): the type of file - 'glf' or 'pgdf'.
+            start_t (datetime.datetime): the start of the span.
+            end_t (datetime.datetime): the end of the span.
+
+        Returns:
+            List[Tuple[str, datetime.datetime, datetime.datetime]]: the path, start and end of each file, ordered by start.
+        """
+        q = self.con.execute(
+            "SELECT path, startdate, enddate FROM files "
+            "WHERE ftype = ? AND startdate <= ? AND enddate >= ? "
+            "ORDER BY startdate, path",
+            (ftype, _to_us(end_t), _to_us(start_t)),
+        )
+
+        return [(path, _from_us(start), _from_us(end)) for path, start, end in q]
+
+    def _count_frames(self, start_us: int, end_us: int, workers=None):
+        """Count the frames of the GLFs overlapping a span that haven't been
+        counted since they were last catalogued."""
+        to_count = [
+            path
+            for (path,) in self.con.execute(
+                "SELECT path FROM files WHERE ftype = 'glf' AND counted = 0 "
+                "AND startdate <= ? AND enddate >= ?",
+                (end_us, start_us),
+            )
+        ]
+
+        if len(to_count) == 0:
+            return
+
+        logging.info("Counting the frames of %s GLFs.", len(to_count))
+
+        for path, frames in pool_map(_count_glf_frames, to_count, workers):
+            self.con.execute("DELETE FROM frames WHERE path = ?", (path,))
+            self.con.executemany(
+                "INSERT INTO frames VALUES (?, ?, ?)",
+                [(path, sonar_id, n) for sonar_id, n in frames.items()],
+            )
+            self.con.execute("UPDATE files SET counted = 1 WHERE path = ?", (path,))
+
+        self.con.commit()
+
+    def estimate_frames(
+        self,
+        start_t: datetime.datetime,
+        end_t: datetime.datetime,
+        sonar_id=None,
+        workers=None,
+    ) -> int:
+        """Estimate the number of GLF frames from start_t to end_t, from the
+        frame counts of the GLFs that overlap it. The frames are assumed to be
+        spread evenly through each GLF. GLFs that haven't been counted yet are
+        read in full, in parallel worker processes, and their counts kept.
+
+        Args:
+            start_t (datetime.datetime): the start of the span.
+            end_t (datetime.datetime): the end of the span.
+            sonar_id (int): optionally, only count the frames from this sonar.
+            workers (int): the number of worker processes (default: the number of CPUs).
+
+        Returns:
+            int: the estimated number of frames.
+        """
+        sql = (
+            "SELECT f.startdate, f.enddate, SUM(c.frames) FROM files AS f "
+            "JOIN frames AS c ON c.path = f.path "
+            "WHERE f.ftype = 'glf' AND f.startdate <= ? AND f.enddate >= ?"
+        )
+        start_us = _to_us(start_t)
+        end_us = _to_us(end_t)
+        params = [end_us, start_us]
+        self._count_frames(start_us, end_us, workers)
+
+        if sonar_id is not None:
+            sql += " AND c.sonarid = ?"
+            params.append(sonar_id)
+
+        total = 0.0
+
+        for start, end, frames in self.con.execute(sql + " GROUP BY f.path", params):
+            if end <= start:
+                total += frames
+                continue
+
+            overlap = min(end, end_us) - max(start, start_us)
+            total += frames * max(0, overlap) / (end - start)
+
+        return int(round(total))
+
+    def ranges(self, ftype: str) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
+        """Return every file of a type that has a time range.
+
+        Args:
+            ftype (str): the type of file - 'glf' or 'pgdf'.
+
+        Returns:
+            List[Tuple[str, datetime.datetime, datetime.datetime]]: the path, start and end of each file, ordered by start.
+        """
+        q = self.con.execute(
+            "SELECT path, startdate, enddate FROM files "
+            "WHERE ftype = ? AND startdate IS NOT NULL AND enddate IS NOT NULL "
+            "ORDER BY startdate, path",
+            (ftype,),
+        )
+
+        return [(path, _from_us(start), _from_us(end)) for path, start, end in q]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="Seal Hits - Catalogue",
+        description="Catalogue the times of the GLF and PGDF files on a disk",
+        epilog="SMRU St Andrews",
+    )
+
+    parser.add_argument("path", help="The data root to catalogue.")
+
+    parser.add_argument(
+        "-s", "--start", help="Optionally, list the files from this datetime."
+    )
+
+    parser.add_argument(
+        "-e", "--end", help="Optionally, list the files up to this datetime."
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with TimeCatalogue(args.path) as catalogue:
+        catalogue.refresh()
+
+        if args.start is not None and args.end is not None:
+            start_t = datetime.datetime.fromisoformat(args.start).replace(tzinfo=pytz.UTC)
+            end_t = datetime.datetime.fromisoformat(args.end).replace(tzinfo=pytz.UTC)
+
+            for ftype in ("glf", "pgdf"):
+                for path, start, end in catalogue.overlapping(ftype, start_t, end_t):
+                    print(path, start, end)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,129 +7,152 @@ and the tracks we are looking for.
 from __future__ import annotations
 
 import datetime
+import logging
 import os
-from typing import Tuple, List
+from typing import Tuple, List, Union
+import numpy as np
 from pypam import pgdf
-from pypam.module import PGObject
-
-__all__ = ["glf_files_avail", "pgdfs_paths", "bin_files_avail", "get_tracks"]
+from sealhits.sources.inventory import INVENTORY_DIR, FileInventory
+from sealhits.sources.points import points_array
+from sealhits.utils import pool_map
+
+__all__ = [
+    "glf_files_avail",
+    "pgdfs_paths",
+    "pgdf_date_range",
+    "bin_files_avail",
+    "get_tracks",
+]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 
-def glf_files_avail(glf_path: str) -> List[str]:
+def glf_files_avail(glf_path: str, inventory_dir=INVENTORY_DIR) -> List[str]:
     """Given a starting path, find all the possible glf files.
+    The files found are cached, so later calls only look at the
+    directories that have changed.
     
     Args:
         glf_path (str): the path to the GLF files.
+        inventory_dir (str): where the cached file inventories are kept.
     
     Returns:
        List[str]: A list of full paths to all found GLF files.
     
     """
-    full_paths = []
-
-    for root, _, files in os.walk(glf_path, topdown=False):
-        for name in files:
-            _, file_extension = os.path.splitext(name)
-            if file_extension.lower() == ".glf":
-                full_paths.append(os.path.join(root, name))
+    return FileInventory(glf_path, inventory_dir).refresh().paths("glf")
 
-    return full_paths
 
-
-def pgdfs_to_full_paths(pgdf_path: str, pgdfs: List[str]) -> List[str]:
+def pgdfs_to_full_paths(
+    pgdf_path: str, pgdfs: List[str], inventory_dir=INVENTORY_DIR
+) -> List[str]:
     """Fill out the pgdf filenames with their full paths.
 
     Args:
         pgdf_path (str): the path to the PGDFS files.
         pgdfs (List[str]): a list of PGDF names to look for
+        inventory_dir (str): where the cached file inventories are kept.
     
     Returns:
        List[str]: A list of full paths to the PGDFS in the pgdfs list.
     """
-    full_paths = []
-
-    for root, _, files in os.walk(pgdf_path, topdown=False):
-        for name in files:
-            if name in pgdfs:
-                fpath = os.path.join(root, name)
-                full_paths.append(fpath)
+    wanted = set(pgdfs)
 
-    return full_paths
+    return [
+        fpath
+        for fpath in pgdfs_paths(pgdf_path, inventory_dir)
+        if os.path.basename(fpath) in wanted
+    ]
 
 
-def pgdfs_paths(pgdf_path: str)  -> List[str]:
-    """ Find all PGDFs under a given path.
+def pgdfs_paths(pgdf_path: str, inventory_dir=INVENTORY_DIR) -> List[str]:
+    """ Find all PGDFs under a given path. The files found are cached,
+    so later calls only look at the directories that have changed.
     
     Args:
         pgdf_path (str): the path to the PGDF files.
+        inventory_dir (str): where the cached file inventories are kept.
     
     Returns:
        List[str]: A list of full paths to all found PGDF files.
     """
-    full_paths = []
+    return FileInventory(pgdf_path, inventory_dir).refresh().paths("pgdf")
 
-    for root, _, files in os.walk(pgdf_path, topdown=False):
-        for name in files:
-            _, file_extension = os.path.splitext(name)
 
-            if file_extension.lower() == ".pgdf":
-                fpath = os.path.join(root, name)
-                full_paths.append(fpath)
+def pgdf_date_range(
+    fpath: str,
+) -> Union[Tuple[str, datetime.datetime, datetime.datetime], None]:
+    """Read a PGDF, returning its path and date range, or None if it
+    can't be read or has no objects. Safe to run in a worker process.
+
+    Args:
+        fpath (str): the path to the PGDF.
+
+    Returns:
+       Union[Tuple[str, datetime.datetime, datetime.datetime], None]: the path with the start and end datetimes, or None.
+    """
+    try:
+        logging.debug("Opening pgdf: %s", fpath)
+        tp = pgdf.PGDF(fpath)
 
-    return full_paths
+        if len(tp.module.objects) > 0:
+            date_min = None
+            date_max = None
+
+            for pamobj in tp.module.objects:
+                tdate = pamobj.pam.date
+                assert tdate is not None
+
+                if date_min is None:
+                    date_min = tdate
+                elif date_min > tdate:
+                    date_min = tdate
+
+                if date_max is None:
+                    date_max = tdate
+                elif date_max < tdate:
+                    date_max = tdate
+
+            logging.debug("Adding pgdf: %s", fpath)
+            return (fpath, date_min, date_max)
+        else:
+            logging.debug("PGDF %s has no module objects.", fpath)
+    except Exception as e:
+        logging.error("Could not read %s: %s", fpath, e)
+
+    return None
 
 
 # TODO - we need to double check which Sonar we are reading. We have two remember? Tracks will list a sonar.
 def bin_files_avail(
     pdir: str,
+    workers=None,
 ) -> List[Tuple[str, datetime.datetime, datetime.datetime]]:
     """Return a list of binary PGDF files with the corresponding date range.
+    The files are read in parallel worker processes.
     
     Args:
         pdir (str): the path to the gemini binary files.
+        workers (int): the number of worker processes (default: the number of CPUs).
     
     Returns:
        List[Tuple[str, datetime.datetime, datetime.datetime]]: A list of paths to the pgdf including the start and end datetimes
     
     """
-    efiles = []
+    fpaths = []
 
     for root, _, files in os.walk(pdir, topdown=False):
         for name in files:
-            fpath = os.path.join(root, name)
             _, file_extension = os.path.splitext(name)
 
-            try:
-                if "pgdf" in file_extension.lower():
-                    print("Opening pgdf:", fpath)
-                    tp = pgdf.PGDF(fpath)
-
-                    if len(tp.module.objects) > 0:
-                        date_min = None
-                        date_max = None
-
-                        for pamobj in tp.module.objects:
-                            tdate = pamobj.pam.date
-                            assert tdate is not None
+            if "pgdf" in file_extension.lower():
+                fpaths.append(os.path.join(root, name))
 
-                            if date_min is None:
-                                date_min = tdate
-                            elif date_min > tdate:
-                                date_min = tdate
-
-                            if date_max is None:
-                                date_max = tdate
-                            elif date_max < tdate:
-                                date_max = tdate
-
-                        print("Adding pgdf:", fpath)
-                        efiles.append((fpath, date_min, date_max))
-                    else:
-                        print("PGDF has no module objects.")
-            except Exception as e:
-                print("Could not read", fpath, e)
+    efiles = [
+        efile
+        for efile in pool_map(pgdf_date_range, fpaths, workers)
+        if efile is not None
+    ]
 
     # Sort the efile bases on the dates
     efiles.sort(key=lambda ef: ef[1])
@@ -137,15 +160,36 @@ def bin_files_avail(
     return efiles
 
 
-def get_tracks(bin_files: List[str]) -> List[PGObject]:
+def _read_tracks(fb: str) -> List[Tuple[int, datetime.datetime, np.ndarray]]:
+    """Read the tracks from one PGDF in a worker process, returning plain
+    arrays of their points rather than the PGObjects, which are slow to
+    send back to the main process."""
+    logging.debug("Reading bin file: %s", fb)
+    pbin = pgdf.PGDF(fb)
+    assert pbin.header.module_type == "Gemini Threshold Detector"
+
+    return [
+        (
+            pamobj.pam.UID,
+            pamobj.data.track.time_start,
+            points_array(pamobj.data.track.points),
+        )
+        for pamobj in pbin.module.objects
+    ]
+
+
+def get_tracks(
+    bin_files: List[str], workers=None
+) -> List[Tuple[int, datetime.datetime, np.ndarray]]:
     """Read the found PGDF files and generate the tracks for our eventual
-    dataset.
+    dataset. The files are read in parallel worker processes.
     
     Args:
         bin_files (str): the path to the PGDF files.
+        workers (int): the number of worker processes (default: the number of CPUs).
     
     Returns:
-       List[PGObject]: A list of PGObject representing tracks from PAMGuard.
+       List[Tuple[int, datetime.datetime, np.ndarray]]: for each track from PAMGuard, its UID, its start time and its points (see POINT_DTYPE), in order of start time.
 
     """
     tracks = []
@@ -157,14 +201,9 @@ def get_tracks(bin_files: List[str]) -> List[PGObject]:
     # UID in the track group is different to the UID in the Track group children.
     # Trackgroup children UID *should* match the UID in the pgdf
 
-    for fb in bin_files:
-        print("Reading bin file:", fb)
-        pbin = pgdf.PGDF(fb)
-        assert pbin.header.module_type == "Gemini Threshold Detector"
-
-        for obj in pbin.module.objects:
-            tracks.append(obj)
+    for file_tracks in pool_map(_read_tracks, bin_files, workers):
+        tracks += file_tracks
 
     # Sort tracks in order of time if not already
-    tracks = sorted(tracks, key=lambda track: track.data.track.time_start)
+    tracks = sorted(tracks, key=lambda track: track[1])
     return tracks
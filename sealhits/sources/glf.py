@@ -9,7 +9,7 @@ files.
 
 from __future__ import annotations
 
-import functools
+import bisect
 import traceback
 import os
 import uuid
@@ -20,10 +20,9 @@ from astropy.io import fits
 from typing import Tuple, List, Union
 from pytritech.glf import GLF
 from sealhits.db.dbschema import GLFS, Groups, Images, Points
-from pytritech.glftimes import glf_times
 from pytritech.util.range import calculate_range
 from pytritech.image import ImageRecord
-from sealhits.sources.files import glf_files_avail
+from sealhits.sources.catalogue import CATALOGUE_DIR, TimeCatalogue
 from sealhits.compress import compress
 from sqlalchemy.orm import (
     Session,
@@ -39,6 +38,8 @@ __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 NUM_THREADS = 16
+PLAN_TOLERANCE = datetime.timedelta(seconds=1)  # Largest gap in existing images
+QUERY_CHUNK = 1000  # Filenames per IN query
 
 class GDat(object):
     """An internal object that holds all the details we want on
@@ -57,6 +58,51 @@ class GDat(object):
         self.full_path = full_path
 
 
+class GDatIndex(object):
+    """An interval index over the GLF time ranges. The GDats are held in
+    start order alongside a running maximum of the end times, so the GLFs
+    overlapping a time range can be found with two binary searches rather
+    than a scan over every GLF."""
+
+    def __init__(self, gdats: List[GDat]):
+        self.gdats = sorted(gdats, key=lambda x: x.start_date)
+        self.starts = [g.start_date for g in self.gdats]
+        self.max_ends = []
+        max_end = None
+
+        for gdat in self.gdats:
+            if max_end is None or gdat.end_date > max_end:
+                max_end = gdat.end_date
+
+            self.max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.gdats)
+
+    def __iter__(self):
+        return iter(self.gdats)
+
+    def overlapping(
+        self, start_t: datetime.datetime, end_t: datetime.datetime
+    ) -> List[GDat]:
+        """Return the GDats whose time range overlaps start_t to end_t inclusive,
+        in start order.
+
+        Args:
+            start_t (datetime.datetime): the start of the time range.
+            end_t (datetime.datetime): the end of the time range.
+
+        Returns:
+           List[GDat]: the overlapping GDats.
+        """
+        # Everything before lo finishes before start_t and everything
+        # from hi onwards starts after end_t.
+        lo = bisect.bisect_left(self.max_ends, start_t)
+        hi = bisect.bisect_right(self.starts, end_t)
+
+        return [g for g in self.gdats[lo:hi] if g.end_date >= start_t]
+
+
 def has_track(session: Session, image_time: datetime.datetime, sonar_id: int) -> bool:
     """Look in the database to see if this image has a track.
     
@@ -88,16 +134,6 @@ def has_track(session: Session, image_time: datetime.datetime, sonar_id: int) ->
     return False
 
 
-def _get_glf_times(glf_file):
-    try:
-        times = glf_times(glf_file)
-        assert times is not None
-        return (times, glf_file)
-    except Exception as e:
-        print(e)
-        return ((None, None), None)
-
-
 def sort_times(a, b):
     """Sort GDat by start date"""
     s0 = a.start_date
@@ -107,9 +143,9 @@ def sort_times(a, b):
         return -1
 
     if s0 == s1:
-        return 1
+        return 0
 
-    return 0
+    return 1
 
 
 def sort_times_group(a, b):
@@ -121,41 +157,66 @@ def sort_times_group(a, b):
         return -1
 
     if s0 == s1:
-        return 1
+        return 0
 
-    return 0
+    return 1
 
 
-def _find_glf_times_db(session: Session, glffiles: List[str]):
-    """See if our GLFS are already in the database. Take the full path,
-    look in the DB and return the times as well as the glf files that aren't
-    in the db. This search is likely to be a bit slow? Newsflash! It is!
+def _find_glfs_db(session: Session, glfnames: List[str]) -> dict:
+    """Load the GLFS already in the database with these filenames, in
+    chunked IN queries, returning a dictionary of GLFS by filename.
+
+    Args:
+        session (Session): current SQLAlchemy session.
+        glfnames (List[str]): the GLF filenames we care about.
 
+    Returns:
+       dict: the existing GLFS objects keyed by filename.
     """
-    glfs_in_db = []
+    dictg = {}
+    glfnames = list(set(glfnames))
 
     with session.no_autoflush:
-        glfs_in_db = session.query(GLFS).all()
+        for idx in range(0, len(glfnames), QUERY_CHUNK):
+            chunk = glfnames[idx : idx + QUERY_CHUNK]
 
-    # Convert to a dictionary for speed
-    dictg = {}
+            for gd in session.query(GLFS).filter(GLFS.filename.in_(chunk)).all():
+                dictg[gd.filename] = gd
 
-    for gd in glfs_in_db:
-        dictg[gd.filename] = gd
+    return dictg
 
-    missing = []
-    times = []  # ((start, end), filename)
 
-    for gf in glffiles:
-        gname = os.path.basename(gf)
+def _find_images_db(
+    session: Session, start_t: datetime.datetime, end_t: datetime.datetime
+) -> dict:
+    """Load all the Images already in the database between two times in one
+    query, returning a dictionary of Images by filename. This replaces a query
+    per frame when checking if an image already exists.
 
-        try:
-            gd = dictg[gname]
-            times.append(((gd.startdate, gd.enddate), gf))
-        except KeyError:
-            missing.append(gf)
+    Args:
+        session (Session): current SQLAlchemy session.
+        start_t (datetime.datetime): the earliest image time we care about.
+        end_t (datetime.datetime): the latest image time we care about.
+
+    Returns:
+       dict: the existing Images objects keyed by filename.
+
+    """
+    images_in_db = []
+
+    with session.no_autoflush:
+        images_in_db = (
+            session.query(Images)
+            .filter(Images.time >= start_t, Images.time <= end_t)
+            .all()
+        )
+
+    dicti = {}
+
+    for image in images_in_db:
+        dicti[image.filename] = image
 
-    return (times, missing)
+    return dicti
 
 
 def get_times(gpath: str) -> Union[Tuple[datetime.datetime, datetime.datetime], None]: 
@@ -227,6 +288,33 @@ def glf_times_range(gpath: str, start_t: datetime.datetime, end_t: datetime.date
         raise IOError
 
 
+def _glf_records_range(gpath: str, start_t: datetime.datetime, end_t: datetime.datetime):
+    """Like glf_times_range but yields the open GLF alongside each image record,
+    so images can be extracted without opening and parsing the GLF a second time.
+    The sonar range is not calculated. This is an iterator function.
+
+    Args:
+        gpath (str): path to a single GLF file.
+        start_t (datetime.datetime): the start datetime.
+        end_t (datetime.datetime): the end datetime.
+
+    Returns:
+       Tuple[GLF, ImageRecord]: the open GLF and an image record within the time range.
+    """
+    try:
+        with GLF(gpath) as gf:
+            for image_rec in gf.images:
+                image_time = image_rec.db_tx_time
+
+                if image_time >= start_t and image_time <= end_t:
+                    yield (gf, image_rec)
+
+    except Exception as e:
+        logging.error("_glf_records_range failed to read glf: %s", gpath)
+        logging.error("Exception %s", e)
+        raise IOError
+
+
 def glf_get_image(gpath: str, image_rec) -> Tuple[bytes, Tuple[int, int]]:
     """
     Get an image from a GLF file using the given record
@@ -254,20 +342,164 @@ def glf_get_image(gpath: str, image_rec) -> Tuple[bytes, Tuple[int, int]]:
         return None
 
 
+def _frame_fname(image_time: datetime.datetime, sonar_id: int) -> str:
+    """Return the FITS filename for a frame; a combination of time and sonar id.
+
+    Args:
+        image_time (datetime.datetime): the time of the frame.
+        sonar_id (int): the sonar id.
+
+    Returns:
+       str: the filename (without the .lz4 extension).
+    """
+    milli = int(image_time.microsecond / 1000)
+
+    return (
+        image_time.strftime("%Y_%m_%d_%H_%M_%S_")
+        + f"{milli:03d}"
+        + "_"
+        + str(sonar_id)
+        + ".fits"
+    )
+
+
+def _existing_outputs(outpath: str, day: str, out_dirs: dict) -> set:
+    """Return the set of files already in the output directory for a
+    particular day, listing the directory only the first time we see that day.
+    A directory that doesn't exist yet has no files; it is created when the
+    first image is written to it.
+
+    Args:
+        outpath (str): where the output images are saved.
+        day (str): the day subdirectory in the form YYYY_MM_DD.
+        out_dirs (dict): the cache of day to the set of filenames. Altered by this function.
+
+    Returns:
+       set: the filenames in the day directory.
+    """
+    if day not in out_dirs.keys():
+        subdir = os.path.join(outpath, day)
+
+        if os.path.exists(subdir):
+            out_dirs[day] = set(os.listdir(subdir))
+        else:
+            out_dirs[day] = set()
+
+    return out_dirs[day]
+
+
+def _images_by_glf(fname_lookup: dict) -> dict:
+    """Index a lookup of existing Images by the GLF they came from,
+    each list sorted by time.
+
+    Args:
+        fname_lookup (dict): Images keyed by filename.
+
+    Returns:
+       dict: a dictionary of GLF filename to a time sorted list of Images.
+    """
+    by_glf = {}
+
+    for image in fname_lookup.values():
+        by_glf.setdefault(image.glf, []).append(image)
+
+    for images in by_glf.values():
+        images.sort(key=lambda x: x.time)
+
+    return by_glf
+
+
+def _plan_glf(
+    group: Groups, gdat: GDat, existing_by_glf: dict, outpath: str, out_dirs: dict
+) -> Union[List[Images], None]:
+    """Work out, before any decoding, whether this GLF needs to be read for this group.
+    If a previous ingest already linked this GLF to the group, the existing images
+    from each of the GLF's sonars cover the overlapping time period without gaps,
+    and all of their FITS files are on disk, we return these existing images.
+    Otherwise we return None and the GLF must be read. The GLF's sonars are those
+    of every image previously extracted from it.
+
+    Args:
+        group (Groups): the Group we are currently looking at.
+        gdat (GDat): the GLF that overlaps this group.
+        existing_by_glf (dict): the existing Images by GLF filename (see _images_by_glf).
+        outpath (str): where the output images are saved.
+        out_dirs (dict): the cache of existing output files by day.
+
+    Returns:
+       Union[List[Images], None]: the existing images to use, or None if we must decode.
+    """
+    if gdat.gobj not in group.glfs:
+        return None
+
+    overlap_start = max(group.timestart, gdat.start_date)
+    overlap_end = min(group.timeend, gdat.end_date)
+    images = [
+        image
+        for image in existing_by_glf.get(gdat.gobj.filename, [])
+        if image.time >= group.timestart and image.time <= group.timeend
+    ]
+
+    if len(images) == 0:
+        return None
+
+    # Each sonar's images must reach (near enough) to the ends of the overlap,
+    # otherwise the group times have changed since the last ingest, and
+    # mustn't have any holes, where an earlier ingest didn't finish.
+    sonars = set(image.sonarid for image in existing_by_glf[gdat.gobj.filename])
+
+    for sonar_id in sonars:
+        times = [image.time for image in images if image.sonarid == sonar_id]
+
+        if len(times) == 0:
+            return None
+
+        if (
+            times[0] - overlap_start > PLAN_TOLERANCE
+            or overlap_end - times[-1] > PLAN_TOLERANCE
+        ):
+            return None
+
+        if any(b - a > PLAN_TOLERANCE for a, b in zip(times[:-1], times[1:])):
+            return None
+
+    for image in images:
+        day = image.time.strftime("%Y_%m_%d")
+
+        if image.filename + ".lz4" not in _existing_outputs(outpath, day, out_dirs):
+            return None
+
+    return images
+
+
 def process_glf_by_group(
-    session: Session, group: Groups, fname_lookup, gdats: List[GDat], max_glf: int, outpath: str
+    session: Session,
+    group: Groups,
+    fname_lookup,
+    gdats: GDatIndex,
+    max_glf: int,
+    outpath: str,
+    existing_by_glf=None,
+    out_dirs=None,
 ) -> Tuple[List[Images], dict]:
     """Process a single group, outputting all of the images from both sonars for the
     time period of this group. fname_lookup is altered by the function, storing the new
-    image objects by the filename.
+    image objects by the filename. It should be pre-filled with the Images already in
+    the database (see _find_images_db) as no per-image database lookups are made here.
+
+    Each overlapping GLF is first planned with _plan_glf. GLFs that were fully
+    processed by an earlier ingest are not decoded at all. The rest are opened once,
+    and only the frames without an existing FITS file are extracted.
     
     Args:
         session (Session): the current SQLAlchemy session.
         group (Groups): the Group we are currently looking at.
-        fname_lookup (dict):  a lookup of images by filename. Can be an empty dict.
-        gdats (List[GDat]): a list of GDat objects.
+        fname_lookup (dict):  a lookup of images by filename, both existing and new.
+        gdats (GDatIndex): the index of GDat objects.
         max_glf (int): the maximum number of images to consider.
         outpath (str): where to save the output images.
+        existing_by_glf (dict): existing Images by GLF filename (see _images_by_glf). Optional.
+        out_dirs (dict): a cache of existing output files by day. Optional and altered by this function.
     
     Returns:
        Tuple[List[Images], dict]: A list of the new Images objects created and the dict mapping filenames onto these images objects.
@@ -279,6 +511,12 @@ def process_glf_by_group(
     group_image_count = 0
     new_images = []
 
+    if existing_by_glf is None:
+        existing_by_glf = {}
+
+    if out_dirs is None:
+        out_dirs = {}
+
     # We need a check here on the length of the group as there are some erroneous
     # SUPER long groups we can't ingest really. Anything longer than 2 minutes ignore
     # TODO - could potentialy ingest *up-to* this seconds amount?
@@ -294,139 +532,120 @@ def process_glf_by_group(
 
     found_gdat = False
 
-    for gdat in gdats:
+    for gdat in gdats.overlapping(group_start, group_end):
         glfname = gdat.gobj.filename
 
-        # If our start is greater, we've already passed it as gdats is ordered.
-        # probably doesn't save us too much time.
-        if gdat.start_date > group_end:
-            break
+        # Plan before we link, as the existing link tells us this GLF
+        # was processed for this group before.
+        with session.no_autoflush:
+            planned = _plan_glf(group, gdat, existing_by_glf, outpath, out_dirs)
 
-        if group_start <= gdat.end_date and group_end >= gdat.start_date:
             # Link GLF to group.
-            with session.no_autoflush:
-                # Check it doesn't exist already as sometimes we get duplicates
-                if group not in gdat.gobj.groups:
-                    gdat.gobj.groups.append(group)
-
-            # Now fully read in the GLF
-            # We read one frame at a time because it will use a lot of memory
-            # TODO - could we check to see if the FITS already exists BEFORE the call to _glf_times?
-            try:
-                for image_rec, srange in glf_times_range(
-                    gdat.full_path, group_start, group_end
-                ):
-                    found_gdat = True
-
-                    image_time = image_rec.db_tx_time
-                    sonar_id = image_rec.header.device_id
-                    milli = int(image_time.microsecond / 1000)
-                    ext = ".fits"
-
-                    # Setup the FITS filename; a combination of time and sonar id.
-                    fname = (
-                        image_time.strftime("%Y_%m_%d_%H_%M_%S_")
-                        + f"{milli:03d}"
-                        + "_"
-                        + str(sonar_id)
-                        + ext
-                    )
+            # Check it doesn't exist already as sometimes we get duplicates
+            if group not in gdat.gobj.groups:
+                gdat.gobj.groups.append(group)
+
+        if planned is not None:
+            # Nothing to extract so skip the decode entirely.
+            found_gdat = True
+
+            for new_image in planned:
+                group_image_count += 1
+                fname_lookup[new_image.filename] = new_image
+
+                if group not in new_image.groups:
+                    new_image.groups.append(group)
 
-                    fname_compressed = fname + ".lz4"
-                    subdir = os.path.join(outpath, image_time.strftime("%Y_%m_%d"))
-
-                    if not os.path.exists(subdir):
-                        os.mkdir(subdir)
-
-                    # Check to see if this image already exists. It might if groups overlap
-                    full_fits_path = os.path.join(subdir, fname_compressed)
-
-                    if not os.path.exists(full_fits_path):
-                        # TODO - remove this I think or fire up an error to ignore this GLF
-                        # as looping around is not ideal!
-                        # For some reason, this can fail too but the file seems fine.
-                        # Therefore, we should loop around again till it reads correctly
-                        res = glf_get_image(gdat.full_path, image_rec)
-                        image_data, image_size = res
-
-                        try:
-                            image_np = np.frombuffer(image_data, dtype=np.uint8).reshape(
-                                (image_size[1], image_size[0])
-                            )
-
-                            hdr = fits.Header()
-                            hdr["SONARID"] = sonar_id
-                            hdr["WIDTH"] = image_size[0]
-                            hdr["HEIGHT"] = image_size[1]
-                            hdr["YEAR"] = image_time.year
-                            hdr["MONTH"] = image_time.month
-                            hdr["DAY"] = image_time.day
-                            hdr["HOUR"] = image_time.hour
-                            hdr["MINUTE"] = image_time.minute
-                            hdr["SECOND"] = image_time.second
-                            hdr["MILLI"] = int(image_time.microsecond / 1000)
-                            # hdr = fits.PrimaryHDU(image_np, header=hdr)
-                            # hdul = fits.HDUList([hdr])
-                            # hdul.writeto(full_fits_path)
-                            compress(image_np, hdr, full_fits_path)
-
-                            del image_data
-                            del image_np
-                            del hdr
-
-                            logging.info(
-                                "Generated %s from %s", full_fits_path, gdat.full_path
-                            )
-
-                        except Exception as e:
-                            logging.error(
-                                "Could not generate FITS: %s, %s",
-                                fname,
-                                e,
-                            )
-                            logging.error("Traceback %s", traceback.format_exc())
-
-                    # else:
-                    #    logging.info("File %s already exists for group %s", full_fits_path, group.huid)
-
-                    # Now create the DB objects. We create new image objects, or
-                    # we find the existing one and modify it. We return all images
-                    # and hope our transaction does the right thing in adding or
-                    # updating.
-                    group_image_count += 1
-                    new_image = None
-
-                    with session.no_autoflush:
-                        q = session.query(Images).filter(Images.filename == fname)
-                        new_image = q.one_or_none()
-
-                    # It's also possible that we already have this image ready to be committed to the
-                    # DB but it gets pulled in again for a different group so we must check
-                    if fname in fname_lookup.keys():
-                        new_image = fname_lookup[fname]
-
-                    if new_image is None:
-                        ht = has_track(session, image_time, sonar_id)
-
-                        new_image = Images(
-                            uid=uuid.uuid4(),
-                            filename=fname,
-                            hastrack=ht,
-                            glf=glfname,
-                            time=image_time,
-                            sonarid=sonar_id,
-                            range=srange,
+                new_images.append(new_image)
+
+            continue
+
+        # Now fully read in the GLF, once, extracting only the frames we are missing.
+        try:
+            for gf, image_rec in _glf_records_range(
+                gdat.full_path, group_start, group_end
+            ):
+                found_gdat = True
+                image_time = image_rec.db_tx_time
+                sonar_id = image_rec.header.device_id
+                fname = _frame_fname(image_time, sonar_id)
+                fname_compressed = fname + ".lz4"
+                day = image_time.strftime("%Y_%m_%d")
+                existing_outputs = _existing_outputs(outpath, day, out_dirs)
+
+                # Check to see if this image already exists. It might if groups overlap
+                full_fits_path = os.path.join(outpath, day, fname_compressed)
+
+                if fname_compressed not in existing_outputs:
+                    try:
+                        image_data, image_size = gf.extract_image(image_rec)
+                        image_np = np.frombuffer(image_data, dtype=np.uint8).reshape(
+                            (image_size[1], image_size[0])
                         )
 
-                    fname_lookup[fname] = new_image
+                        hdr = fits.Header()
+                        hdr["SONARID"] = sonar_id
+                        hdr["WIDTH"] = image_size[0]
+                        hdr["HEIGHT"] = image_size[1]
+                        hdr["YEAR"] = image_time.year
+                        hdr["MONTH"] = image_time.month
+                        hdr["DAY"] = image_time.day
+                        hdr["HOUR"] = image_time.hour
+                        hdr["MINUTE"] = image_time.minute
+                        hdr["SECOND"] = image_time.second
+                        hdr["MILLI"] = int(image_time.microsecond / 1000)
+                        os.makedirs(os.path.join(outpath, day), exist_ok=True)
+                        compress(image_np, hdr, full_fits_path)
+                        existing_outputs.add(fname_compressed)
+
+                        del image_data
+                        del image_np
+                        del hdr
+
+                        logging.info(
+                            "Generated %s from %s", full_fits_path, gdat.full_path
+                        )
+
+                    except Exception as e:
+                        logging.error(
+                            "Could not generate FITS: %s, %s",
+                            fname,
+                            e,
+                        )
+                        logging.error("Traceback %s", traceback.format_exc())
+
+                # Now create the DB objects. We create new image objects, or
+                # we find the existing one and modify it. We return all images
+                # and hope our transaction does the right thing in adding or
+                # updating.
+                # The lookup holds both the images already in the DB and any
+                # we've made already for a different (overlapping) group.
+                group_image_count += 1
+                new_image = fname_lookup.get(fname, None)
+
+                if new_image is None:
+                    ht = has_track(session, image_time, sonar_id)
+                    srange = int(round(calculate_range(image_rec)))
+
+                    new_image = Images(
+                        uid=uuid.uuid4(),
+                        filename=fname,
+                        hastrack=ht,
+                        glf=glfname,
+                        time=image_time,
+                        sonarid=sonar_id,
+                        range=srange,
+                    )
 
-                    if group not in new_image.groups:
-                        new_image.groups.append(group)
+                fname_lookup[fname] = new_image
 
-                    new_images.append(new_image)
+                if group not in new_image.groups:
+                    new_image.groups.append(group)
 
-            except IOError:
-                logging.Error("Failed to read GLF %s. Skipping...", glfname)
+                new_images.append(new_image)
+
+        except IOError:
+            logging.error("Failed to read GLF %s. Skipping...", glfname)
 
     if not found_gdat:
         logging.error("Found no GDATS for group %s ", group.huid)
@@ -438,7 +657,13 @@ def process_glf_by_group(
 
 
 def process_glfs(
-    session: Session, groups: List[Groups], glfpath: str, outpath: str, max_glf: int
+    session: Session,
+    groups: List[Groups],
+    glfpath: str,
+    outpath: str,
+    max_glf: int,
+    checkpoint=None,
+    catalogue_dir=CATALOGUE_DIR,
 ) -> Tuple[List[GLFS], List[Images]]:
     """Once the PGDFs and SQLITE are processed, we can
     begin to look for the GLF files we need. We want each new group
@@ -453,53 +678,53 @@ def process_glfs(
         glfpath (str): the path to the GLF fules
         max_glf (int): the maximum number of images to consider.
         outpath (str): where to save the output images.
+        checkpoint (Callable): optional function called after each batch of groups
+            with the groups, the GLFs they overlap and the images they now hold, so
+            the caller can commit the batch.
+        catalogue_dir (str): the directory the GLF time catalogues are kept in.
     
     Returns:
        Tuple[List[GLFS], List[Images]]: Two lists - the new GLFS objects to save to the DB and the new Images objects to save to the DB.
     
     """
     new_glfs = []
-    logging.info("Finding available GLF files...")
-    glf_files = glf_files_avail(glfpath)
-
-    # Go through all GLFs and get the times of each.
-    # Check the database first for the times we already have and
-    # only grab the times for GLFs we don't have
-    # There might be duplicates due to directory renaming or similar and rsync.
-    times, glf_files_missing = _find_glf_times_db(session, glf_files)
-    logging.info("Retrieving GLF Times (this may take a while)...")
-
-    if len(glf_files_missing) > 0:
-        logging.info("GLFs missing from DB: %s", len(glf_files_missing))
-        # commented out due to errors on hdd5 for some reason?
-        # with ThreadPool(NUM_THREADS) as pool:
-        # times += pool.map(_get_glf_times, glf_files_missing, chunksize=NUM_THREADS)
-        for glf_file in glf_files_missing:
-            new_times = _get_glf_times(glf_file)
-
-            if new_times[1] is not None:
-                times.append(new_times)
+
+    # The times of every GLF on disk come from the catalogue, which only
+    # reads the headers (via glf_times) of GLFs it hasn't seen before, or
+    # that have changed. It doesn't count their frames, which we don't need.
+    logging.info("Cataloguing GLF times (this may take a while the first time)...")
+
+    with TimeCatalogue(glfpath, catalogue_dir) as catalogue:
+        times = [
+            ((glf_start, glf_end), glf_path)
+            for glf_path, glf_start, glf_end in catalogue.refresh(("glf",)).ranges(
+                "glf"
+            )
+        ]
+
+    glfs_in_db = _find_glfs_db(
+        session, [os.path.basename(glf_path) for _, glf_path in times]
+    )
+    logging.info("GLFs on disk: %s, in the DB: %s", len(times), len(glfs_in_db))
 
     # Add the GLFS regardless of whether or not they are used.
     # times_glfs is the list of all the info we need.
     # gdats are just a struct that holds the times, database
     # object and path together.
     gdats = []
+    new_glfs_by_name = {}
 
     for (glf_start, glf_end), glf_path in times:
         glfname = os.path.basename(glf_path)
-        new_glf = None
-
-        with session.no_autoflush:
-            q = session.query(GLFS).filter(GLFS.filename == glfname)
-            new_glf = q.one_or_none()
 
         # It's possible (for some reason) that GLFS might get double
-        # counted in the addition phase, so make sure it doesn't exist
-        # in the new_glfs already
-        for ng in new_glfs:
-            if ng.filename == glfname:
-                new_glf = ng
+        # counted, due to directory renaming or rsync, so keep just the
+        # first path we find for each filename.
+        if glfname in new_glfs_by_name.keys():
+            logging.info("Duplicate GLF %s at %s. Skipping...", glfname, glf_path)
+            continue
+
+        new_glf = glfs_in_db.get(glfname, None)
 
         if new_glf is None:
             new_glf = GLFS(
@@ -510,21 +735,19 @@ def process_glfs(
                 groups=[],
             )
 
+        new_glfs_by_name[glfname] = new_glf
         new_glfs.append(new_glf)
         gdats.append(GDat(glf_start, glf_end, new_glf, glf_path))
 
     # Make sure there are no errored entries and organise by time
-    # Sorting by time makes the FITS export a little quicker.
-    gdats = sorted(gdats, key=functools.cmp_to_key(sort_times))
+    # in an interval index, so each group can find its GLFs quickly.
+    gdats = GDatIndex(gdats)
     logging.info("Number of initial time ranges: %s", len(gdats))
-    gdat_latest = gdats[-1].end_date
-
-    for gd in gdats:
-        if gd.end_date > gdat_latest:
-            gdat_latest = gd.end_date
 
     logging.info(
-        "GDats earliest %s and latest %s.", str(gdats[0].start_date), str(gdat_latest)
+        "GDats earliest %s and latest %s.",
+        str(gdats.starts[0]),
+        str(gdats.max_ends[-1]),
     )
 
     sofar = 0
@@ -532,10 +755,13 @@ def process_glfs(
 
     logging.info("Number of groups: %s", len(groups))
 
+    if len(groups) == 0:
+        return (new_glfs, [])
+
     # The goal at this stage is to match up new group times with GLF times
     # and only process the files we need to, even if we've recorded a whole
     # batch of GLFs for a time period.
-    groups = sorted(groups, key=functools.cmp_to_key(sort_times_group))
+    groups = sorted(groups, key=lambda x: x.timestart)
     group_earliest = groups[0].timestart
     group_latest = groups[0].timeend
 
@@ -548,21 +774,46 @@ def process_glfs(
         "Groups earliest %s and latest %s.", str(group_earliest), str(group_latest)
     )
 
+    # Load the existing images for the whole time span in one go, rather
+    # than querying for each frame we extract.
     new_images = []
-    new_images_by_fname = {}  # Fast lookup
+    new_images_by_fname = _find_images_db(session, group_earliest, group_latest)
+    logging.info("Existing images in this time span: %s", len(new_images_by_fname))
+    existing_by_glf = _images_by_glf(new_images_by_fname)
+    out_dirs = {}  # Existing output files by day directory
 
     # Start off the threads, chunking up the IDs then submitting to the threaded function.
     while len(groups) > 0:
         while len(groups) > 0 and len(tlist) < NUM_THREADS:
             tlist.append(groups.pop())
 
+        tlist_images = []
+
         for group in tlist:
             ni, nf = process_glf_by_group(
-                session, group, new_images_by_fname, gdats, max_glf, outpath
+                session,
+                group,
+                new_images_by_fname,
+                gdats,
+                max_glf,
+                outpath,
+                existing_by_glf,
+                out_dirs,
             )
-            new_images += ni
+            tlist_images += ni
             new_images_by_fname = nf
 
+        new_images += tlist_images
+
+        if checkpoint is not None:
+            tlist_glfs = {}
+
+            for group in tlist:
+                for gdat in gdats.overlapping(group.timestart, group.timeend):
+                    tlist_glfs[gdat.gobj.filename] = gdat.gobj
+
+            checkpoint(tlist, list(tlist_glfs.values()), tlist_images)
+
         sofar += len(tlist)
         tlist = []
         logging.info("Processed %s. %s remaining.", sofar, len(groups))
@@ -2,62 +2,188 @@
 glfextract.py - extract numpy arrays from GLF files.
 
 A short utility function to extract numpy arrays
-from a GLF file within a particular time range."""
+from a GLF file within a particular time range, and a streaming
+frame source for consumers that don't want every frame in memory."""
 
 import datetime
+import logging
 import os
+import queue
+import threading
 import pytz
 import numpy as np
 from tqdm import tqdm
-from typing import Union
+from typing import Union, List
 from pytritech.glf import GLF
+from pytritech.image import ImageRecord
+
+__all__ = ["extract", "glf_frames"]
+
+PREFETCH = 8
+
+
+def _in_range(
+    image_rec: ImageRecord,
+    start_t: datetime.datetime,
+    end_t: datetime.datetime,
+    sonar_id: Union[int, None],
+    end_inclusive=True,
+) -> bool:
+    """Is this image record within the time range and from the sonar we want?"""
+    image_time = image_rec.db_tx_time
+
+    if image_time < start_t or image_time > end_t:
+        return False
+
+    if not end_inclusive and image_time == end_t:
+        return False
+
+    if sonar_id is not None and image_rec.header.device_id != sonar_id:
+        return False
+
+    return True
+
+
+def _put(frame_queue: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put an item on the queue, giving up if the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+
+def _frame_worker(
+    gpaths: List[str],
+    start_t: datetime.datetime,
+    end_t: datetime.datetime,
+    sonar_id: Union[int, None],
+    frame_queue: queue.Queue,
+    stop: threading.Event,
+):
+    """Decode the frames in the background, handing them over through
+    the bounded queue. A GLF that can't be read is logged and skipped.
+    Any other exception is passed on to the consumer and the final item
+    on the queue is always None."""
+    try:
+        for gpath in gpaths:
+            try:
+                with GLF(gpath) as gf:
+                    for image_rec in gf.images:
+                        if stop.is_set():
+                            return
+
+                        if not _in_range(image_rec, start_t, end_t, sonar_id, False):
+                            continue
+
+                        image_data, image_size = gf.extract_image(image_rec)
+                        image_np = np.frombuffer(image_data, dtype=np.uint8).reshape(
+                            (image_size[1], image_size[0])
+                        )
+
+                        if not _put(frame_queue, (image_rec, image_np), stop):
+                            return
+
+            except Exception as e:
+                logging.error("Could not read GLF %s: %s", gpath, e)
+
+    except Exception as e:
+        _put(frame_queue, e, stop)
+
+    _put(frame_queue, None, stop)
+
+
+def glf_frames(
+    gpaths: List[str],
+    start_t: datetime.datetime,
+    end_t: datetime.datetime,
+    sonar_id=None,
+    prefetch=PREFETCH,
+):
+    """Given a list of paths to GLF files, a start and end time and optionally a
+    sonar id, yield the image record and the numpy frame for each matching image,
+    in file order. Frames are decoded in a background thread, at most prefetch
+    frames ahead of the consumer, so memory use does not grow with the time range.
+    GLFs that can't be read are logged and skipped.
+    This is an iterator function.
+
+    Args:
+        gpaths (List[str]): The paths to the GLF files.
+        start_t (datetime.datetime): The starting date time (inclusive).
+        end_t (datetime.datetime): The ending date time (exclusive).
+        sonar_id (int): Optionally, only yield frames from this sonar.
+        prefetch (int): The maximum number of decoded frames waiting to be consumed.
+
+    Returns:
+        Tuple[ImageRecord, np.array]: the image record and its frame.
+    """
+    frame_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    worker = threading.Thread(
+        target=_frame_worker,
+        args=(gpaths, start_t, end_t, sonar_id, frame_queue, stop),
+        daemon=True,
+    )
+    worker.start()
+
+    try:
+        while True:
+            item = frame_queue.get()
+
+            if item is None:
+                break
+
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+
+    finally:
+        stop.set()
+        worker.join()
 
 
 def extract(gpath: str, start_t: datetime.datetime, end_t: datetime.datetime) -> Union[None, np.array]:
     """ Given a path to a GLF file, a start and end time, return a 3D numpy
-    array of images within that time frame.
-    
+    array of images within that time frame. The array is allocated once
+    and filled a frame at a time.
+
     Args:
         gpath (str): The path to a GLF file.
         start_t (datetime.datetime): The starting date time.
         end_t (datetime.datetime): The ending date time.
-    
+
     Returns:
         Union[None, np.array]: either None, or an np.array of frames
     """
     try:
         with GLF(gpath) as gf:
-            time_start = None
-            time_end = None
-            frames = []
-
-            for image_rec in tqdm(gf.images, desc="Ingesting Images"):
-                image_time = image_rec.db_tx_time
-
-                if time_start is None:
-                    time_start = image_time
-                elif image_time < time_start:
-                    time_start = image_time
-
-                if time_end is None:
-                    time_end = image_time
-                elif image_time > time_end:
-                    time_end = image_time
-
-                if image_time >= start_t and image_time <= end_t:
-                    image_data, image_size = gf.extract_image(image_rec)
-                    image_np = np.frombuffer(
-                        image_data, dtype=np.uint8
-                    ).reshape((image_size[1], image_size[0]))
-
-                    frames.append(image_np)
-        
-        frames = np.array(frames)
+            image_recs = [
+                image_rec
+                for image_rec in gf.images
+                if _in_range(image_rec, start_t, end_t, None)
+            ]
+
+            if len(image_recs) == 0:
+                return np.array([])
+
+            width, height = image_recs[0].image_dim
+            frames = np.empty((len(image_recs), height, width), dtype=np.uint8)
+
+            for idx, image_rec in enumerate(tqdm(image_recs, desc="Ingesting Images")):
+                image_data, image_size = gf.extract_image(image_rec)
+                frames[idx] = np.frombuffer(
+                    image_data, dtype=np.uint8
+                ).reshape((image_size[1], image_size[0]))
+
         return frames
 
     except Exception as e:
         print(e)
-    
+
     return None
 
 
@@ -14,8 +14,10 @@ import uuid
 import logging
 from human_id import generate_id
 from tqdm import tqdm
-from typing import List, Tuple
+import numpy as np
+from typing import List, Tuple, Union
 from sealhits.db.dbschema import Groups, Points, TrackGroup
+from sealhits.sources.points import PointStore, from_datetime64, to_datetime64
 
 from sqlalchemy.orm import (
     Session,
@@ -29,6 +31,67 @@ __all__ = ["find_group_objects", "split_groups", "fix_group_times"]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
+QUERY_CHUNK = 1000  # Maximum number of values in one IN clause
+
+
+def _pgdf_name(binary_file: str) -> str:
+    """Make sure the binary file is a single filename with the pgdf extension."""
+    binary_file = os.path.basename(binary_file)
+
+    if binary_file[-5:] != ".pgdf":
+        binary_file += ".pgdf"
+
+    return binary_file
+
+
+def _find_groups_db(session: Session, sqlalias: str) -> dict:
+    """Load the unsplit (or first split) Groups already in the database for
+    this sqlite file in one query, keyed by their (gid, sqliteid).
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        sqlalias (str): The sqlite name the groups were ingested under.
+
+    Returns:
+        dict: the existing Groups by (gid, sqliteid).
+    """
+    with session.no_autoflush:
+        groups = (
+            session.query(Groups)
+            .filter(
+                or_(Groups.split == -1, Groups.split == 0),
+                Groups.sqlite == sqlalias,
+            )
+            .all()
+        )
+
+    return {(g.gid, g.sqliteid): g for g in groups}
+
+
+def _find_tracks_db(session: Session, binfiles: List[str]) -> dict:
+    """Load the TrackGroups already in the database for these binary files,
+    in chunked IN queries, keyed by their (track_pam_id, binfile).
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        binfiles (List[str]): The PGDF filenames.
+
+    Returns:
+        dict: the existing TrackGroups by (track_pam_id, binfile).
+    """
+    tracks = {}
+
+    with session.no_autoflush:
+        for i in range(0, len(binfiles), QUERY_CHUNK):
+            q = session.query(TrackGroup).filter(
+                TrackGroup.binfile.in_(binfiles[i : i + QUERY_CHUNK])
+            )
+
+            for t in q.all():
+                tracks[(t.track_pam_id, t.binfile)] = t
+
+    return tracks
+
 
 def find_group_objects(
     session: Session, sqldb: sqlpam.SQLPAM, sqlname: str, sqlalias: str, max_secs=800
@@ -51,13 +114,22 @@ def find_group_objects(
     Returns:
          Tuple[List[Groups], List[TrackGroup]]: Two lists, the new Groups objects and the TrackGroup objects.
     """
-    group_list = sqldb.track_groups
     found_groups = []
     found_tracks = []
 
+    # Load everything that might already exist up front, so matching
+    # the SQLite groups against the database needs no more queries.
+    groups_db = _find_groups_db(session, sqlalias)
+    binfiles = sorted(set(_pgdf_name(b) for b in sqldb.binary_files()))
+    tracks_db = _find_tracks_db(session, binfiles)
+    logging.info(
+        "Existing Groups: %s, existing Tracks: %s", len(groups_db), len(tracks_db)
+    )
+
     logging.info("Reading Groups...")
 
-    for g in tqdm(group_list, desc="Reading Groups"):
+    # Stream the groups rather than reading them all up front.
+    for g in tqdm(sqldb.iter_groups(), total=sqldb.num_groups(), desc="Reading Groups"):
         interaction = g.interaction
         code = "none"
 
@@ -69,17 +141,7 @@ def find_group_objects(
         # return that instead of a new thing. Means we can use
         # merge later on to do easy updates.
         # split can be -1 or 0. If it's not been split or it's been split and it's the first one.
-        new_group = None
-
-        with session.no_autoflush:
-            q = session.query(Groups).filter(
-                Groups.gid == g.uid,
-                Groups.sqliteid == g.id,
-                or_(Groups.split == -1, Groups.split == 0),
-                Groups.sqlite == sqlalias,
-            )
-
-            new_group = q.one_or_none()
+        new_group = groups_db.get((g.uid, g.id), None)
 
         if new_group is None:
             huid = generate_id()
@@ -131,23 +193,9 @@ def find_group_objects(
         # We also add the track_id to the tracks_groups table
         # using our own UUID instead of the gids
         for c in g.children:
-            binary_file = c.binary_file
-            # Make sure the binary file is a single filename
-            # with the pgdf extension
-            binary_file = os.path.basename(binary_file)
-
-            if binary_file[-5:] != ".pgdf":
-                binary_file += ".pgdf"
-
-            new_track = None
-
-            with session.no_autoflush:
-                q = session.query(TrackGroup).filter(
-                    TrackGroup.track_pam_id == c.uid,
-                    #TrackGroup.group_id == new_group.uid, # Commented as it's pam and binary that are unique identifiers before we add uids
-                    TrackGroup.binfile == binary_file,
-                )
-                new_track = q.one_or_none()
+            binary_file = _pgdf_name(c.binary_file)
+            # It's pam and binary that are unique identifiers before we add uids
+            new_track = tracks_db.get((c.uid, binary_file), None)
 
             if new_track is None:
                 new_track = TrackGroup(
@@ -186,8 +234,11 @@ def find_group_objects(
 
 
 def split_groups(
-    session: Session, new_groups: List[Groups], new_points: List[Points], buffer_gap=4
-) -> Tuple[List[Groups], List[Points]]:
+    session: Session,
+    new_groups: List[Groups],
+    new_points: Union[PointStore, List[Points]],
+    buffer_gap=4,
+) -> Tuple[List[Groups], PointStore]:
     """It is possible that some groups may have large gaps with no
     tracks. Such groups need to be split, creating new groups .
     This function returns a new list of all the groups including the
@@ -208,15 +259,22 @@ def split_groups(
     Args:
         session (Session): The current SQLAlchemy session.
         new_groups (List[Groups]): The latest groups we want to split.
-        new_points (List[Points]): The latest points we want to re-assign.
+        new_points (Union[PointStore, List[Points]]): The latest points we want to re-assign.
         buffer_gap (int): The number of seconds for the start and end buffer. Also, the minimum gap between points in a track before we split.
 
     Returns:
-        Tuple[List[Groups], List[Points]]: The new_groups and new_point with the new split-off groups and reassigned points.
+        Tuple[List[Groups], PointStore]: The new_groups and new_point with the new split-off groups and reassigned points.
     """
     return_groups = []
-    return_points = []
+    return_indices = []
     buffer = datetime.timedelta(seconds=buffer_gap)
+    buffer_us = buffer // datetime.timedelta(microseconds=1)
+
+    if not isinstance(new_points, PointStore):
+        new_points = PointStore.from_points(new_points)
+
+    points_by_group = new_points.indices_by_group()
+    times = new_points.data["time"]
 
     for group in tqdm(new_groups, desc="Splitting new groups."):
         # Check to see if this group has already been split?
@@ -241,11 +299,7 @@ def split_groups(
 
         # It hasn't been split, so check if it needs to be
         # First, get all the points and their times from each track.
-        group_points = []
-
-        for point in new_points:
-            if point.group_id == group.uid:
-                group_points.append(point)
+        group_points = points_by_group.get(group.uid, [])
 
         # This should never happen but thanks to issues with data not where it should be
         # (disks 33 and 35) it does :/ Needs a fix at some point.
@@ -256,13 +310,15 @@ def split_groups(
         #assert len(group_points) > 0
 
         # We need to order times, and points, tpamids into ascending order of time
-        group_points = sorted(group_points, key=lambda x: x.time)
+        group_points = group_points[np.argsort(times[group_points], kind="stable")]
+        group_times = times[group_points]
+        group_ts = group_times.astype(np.int64)  # Microseconds
 
         # Alter the start and end times of the groups to match the ones found
         # from the tracks. This is a 'belt-and-braces' sort of check given the one
         # problem group found in riverseals.
-        new_group_start = group_points[0].time
-        new_group_end = group_points[-1].time
+        new_group_start = from_datetime64(group_times[0])
+        new_group_end = from_datetime64(group_times[-1])
 
         assert(new_group_start >= group.timestart)
         assert(new_group_end <= group.timeend)
@@ -270,34 +326,29 @@ def split_groups(
         # Splits will contain the indices on which to split the
         # points into new tracks and the groups into new groups.
         # Group splits are the new group uids we've made.
-        splits = []
         group_splits = []
 
-        # Find the gaps and mark them up
-        for tidx in range(len(group_points) - 2):
-            t0 = group_points[tidx].time
-            t1 = group_points[tidx + 1].time
-            td = t1 - t0
-
-            if td > buffer:
-                splits.append(tidx + 1)
+        # Find the gaps and mark them up. As ever, the gap before the
+        # final point is not considered.
+        gaps = np.diff(group_ts[:-1])
+        splits = (np.flatnonzero(gaps > buffer_us) + 1).tolist()
 
         group_time_end = group.timeend
 
         if len(splits) > 0:
             # Redo the first group - setting it's time end to the correct one.
-            group_time_end = group_points[splits[0] - 1].time
+            group_time_end = from_datetime64(group_times[splits[0] - 1])
             group.timeend = group_time_end
             group.split = 0
             group_splits.append(group)
 
             # Now create new groups with the same gid but new times
             for sidx, split in enumerate(splits):
-                timestart = group_points[split].time
-                timeend = group_points[-1].time  # Set to the last time for now
+                timestart = from_datetime64(group_times[split])
+                timeend = from_datetime64(group_times[-1])  # Set to the last time for now
 
                 if sidx + 1 < len(splits):
-                    timeend = group_points[splits[sidx + 1] - 1].time
+                    timeend = from_datetime64(group_times[splits[sidx + 1] - 1])
 
                 # Add the buffer times for the new group
                 timestart -= buffer
@@ -343,27 +394,43 @@ def split_groups(
                 return_groups.append(new_group)
                 group_splits.append(new_group)
 
-            # We look at each point in turn, assigning it to a new group
-            for point in group_points:
-                for sgroup in group_splits:
-                    if point.time >= sgroup.timestart and point.time <= sgroup.timeend:
-                        point.group_id = sgroup.uid
-                        break
+            # Assign each point to the first split group whose times cover it.
+            # The points are sorted so each group covers a contiguous run of them.
+            # Going backwards means earlier groups win where groups overlap.
+            assignment = np.full(len(group_points), -1)
+
+            for sidx in reversed(range(len(group_splits))):
+                sgroup = group_splits[sidx]
+                lo = np.searchsorted(
+                    group_ts, to_datetime64(sgroup.timestart).astype(np.int64), "left"
+                )
+                hi = np.searchsorted(
+                    group_ts, to_datetime64(sgroup.timeend).astype(np.int64), "right"
+                )
+                assignment[lo:hi] = sidx
+
+            for sidx, sgroup in enumerate(group_splits):
+                new_points.set_group(group_points[assignment == sidx], sgroup.uid)
 
         return_groups.append(group) # Original group is always returned
-        return_points += group_points
-    
-    return (return_groups, return_points)
+        return_indices.append(group_points)
+
+    if len(return_indices) == 0:
+        return (return_groups, new_points.subset(np.empty(0, dtype=np.int64)))
+
+    return (return_groups, new_points.subset(np.concatenate(return_indices)))
 
 
-def fix_group_times(new_groups: List[Groups], new_points: List[Points]) -> List[Groups]:
+def fix_group_times(
+    new_groups: List[Groups], new_points: Union[PointStore, List[Points]]
+) -> List[Groups]:
     """PAMGuard SQLITE file reports incorrect group times. We therefore
     look at all the tracks and find the earliest and latest times and
     set the group times to match these.
     
     Args:
         new_groups (List[Groups]): The latest groups we want to split.
-        new_points (List[Points]): The latest points we want to re-assign.
+        new_points (Union[PointStore, List[Points]]): The latest points we want to re-assign.
 
     Returns:
         List[Groups]: The corrected groups.
@@ -372,24 +439,22 @@ def fix_group_times(new_groups: List[Groups], new_points: List[Points]) -> List[
     logging.info("Fixing group times...")
     fixed_groups = []
 
+    if not isinstance(new_points, PointStore):
+        new_points = PointStore.from_points(new_points)
+
+    # The bounds of every group at once, rather than a search per group.
+    bounds = new_points.time_bounds()
+
     for group in tqdm(new_groups, desc="Groups fixed"):
         min_time = datetime.datetime.now().astimezone(tz=pytz.UTC)
         max_time = datetime.datetime(2000, 1, 1).astimezone(tz=pytz.UTC)
 
         # Check to see if we have points directly on this group
         # if we do then we can use these as the groups is
-        points = []
-        for point in new_points:
-            if point.group_id == group.uid:
-                points.append(point)
-
-        if len(points) > 0:
-            for point in points:
-                if point.time < min_time:
-                    min_time = point.time
-
-                if point.time > max_time:
-                    max_time = point.time
+        group_bounds = bounds.get(group.uid, None)
+
+        if group_bounds is not None:
+            min_time, max_time = group_bounds
 
         group.timestart = min_time
         group.timeend = max_time
@@ -0,0 +1,189 @@
+"""
+inventory.py - a cached list of the data files on a disk.
+
+Walking a whole USB HDD for GLF and PGDF files takes a long
+time. A FileInventory keeps the files found under a data root
+(name, size, mtime and type) in a local cache file. When it is
+refreshed, only directories whose mtime has changed are listed
+again; the rest are taken from the cache without touching the disk.
+Rewriting or appending to a file doesn't change its directory's
+mtime, so callers that need to see that can ask files() to stat
+the files they get back.
+"""
+
+from __future__ import annotations
+
+__all__ = ["FILE_TYPES", "INVENTORY_DIR", "FileInventory"]
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import List
+
+# The files we keep track of, by their lower case extension.
+FILE_TYPES = {".glf": "glf", ".pgdf": "pgdf"}
+
+# Where the inventories are kept by default.
+INVENTORY_DIR = os.path.join(os.path.expanduser("~"), ".cache", "sealhits", "inventory")
+
+# Directories changed this recently (in nanoseconds) are listed again next
+# time, as some filesystems (FAT, exFAT) only keep mtimes to 2 seconds.
+MTIME_SLACK = 2 * 10**9
+
+
+class FileInventory(object):
+    """The GLF and PGDF files under a data root, cached between runs.
+    Call refresh before use to bring it up to date with the disk."""
+
+    def __init__(self, root: str, inventory_dir=INVENTORY_DIR):
+        """Load the inventory for a data root, if we have one.
+
+        Args:
+            root (str): the data root, usually the mount point of a disk.
+            inventory_dir (str): the directory the inventory files are kept in.
+        """
+        self.root = os.path.abspath(root)
+        name = hashlib.sha1(self.root.encode("utf-8")).hexdigest() + ".json"
+        self.path = os.path.join(inventory_dir, name)
+        self._dirs = {}
+
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+
+            if saved.get("root") == self.root:
+                self._dirs = saved["dirs"]
+
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def refresh(self) -> FileInventory:
+        """Bring the inventory up to date with the disk and save it.
+
+        Returns:
+            FileInventory: this inventory, for chaining.
+        """
+        old_dirs = self._dirs
+        new_dirs = {}
+        stack = [""]
+        scanned = 0
+
+        while len(stack) > 0:
+            rel = stack.pop()
+            full = os.path.join(self.root, rel)
+
+            try:
+                dir_mtime = os.stat(full).st_mtime_ns
+                cached = old_dirs.get(rel, None)
+
+                if cached is not None and cached["mtime"] == dir_mtime:
+                    entry = cached
+                else:
+                    entry = self._scan_dir(full, dir_mtime)
+                    scanned += 1
+
+            except OSError as e:
+                logging.warning("Could not scan %s: %s", full, e)
+                continue
+
+            new_dirs[rel] = entry
+
+            for subdir in entry["subdirs"]:
+                stack.append(os.path.join(rel, subdir))
+
+        logging.info(
+            "Inventory of %s: %s directories, %s listed again.",
+            self.root,
+            len(new_dirs),
+            scanned,
+        )
+        self._dirs = new_dirs
+        self.save()
+        return self
+
+    def _scan_dir(self, full: str, dir_mtime: int) -> dict:
+        """List one directory with os.scandir."""
+        files = {}
+        subdirs = []
+
+        with os.scandir(full) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    _, ext = os.path.splitext(entry.name)
+                    ftype = FILE_TYPES.get(ext.lower(), None)
+
+                    if ftype is not None:
+                        st = entry.stat()
+                        files[entry.name] = [st.st_size, st.st_mtime_ns, ftype]
+
+        # Don't trust an mtime we might not see change.
+        if time.time_ns() - dir_mtime < MTIME_SLACK:
+            dir_mtime = None
+
+        return {"mtime": dir_mtime, "files": files, "subdirs": sorted(subdirs)}
+
+    def save(self):
+        """Write the inventory to its cache file. Failing to save only
+        means the next run has to scan the whole disk."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+
+            with open(tmp_path, "w") as f:
+                json.dump({"root": self.root, "dirs": self._dirs}, f)
+
+            os.replace(tmp_path, self.path)
+
+        except OSError as e:
+            logging.warning("Could not save the file inventory %s: %s", self.path, e)
+
+    def files(self, ftype: str, restat=False) -> List[dict]:
+        """Return the files of one type. The size and mtime are those seen when
+        the file's directory was last listed, unless restat is set.
+
+        Args:
+            ftype (str): the type of file - 'glf' or 'pgdf'.
+            restat (bool): stat each file for its current size and mtime, picking up
+                files rewritten in place and dropping any that have gone (default: False).
+
+        Returns:
+            List[dict]: the path, size and mtime of each file, sorted by path.
+        """
+        found = []
+
+        for rel in sorted(self._dirs.keys()):
+            for name, (size, mtime, file_type) in sorted(self._dirs[rel]["files"].items()):
+                if file_type != ftype:
+                    continue
+
+                path = os.path.join(self.root, rel, name)
+
+                if restat:
+                    try:
+                        st = os.stat(path)
+
+                    except FileNotFoundError:
+                        continue
+
+                    size, mtime = st.st_size, st.st_mtime_ns
+
+                found.append({"path": path, "size": size, "mtime": mtime})
+
+        return found
+
+    def paths(self, ftype: str) -> List[str]:
+        """Return the full paths of the files of one type, sorted.
+
+        Args:
+            ftype (str): the type of file - 'glf' or 'pgdf'.
+
+        Returns:
+            List[str]: the full paths.
+        """
+        return [f["path"] for f in self.files(ftype)]
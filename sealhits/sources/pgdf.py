@@ -7,24 +7,33 @@ Functions for processing the PGDFs as part of the ingest.
 from __future__ import annotations
 
 import os
-import pytz
 import datetime
 import uuid
 import logging
+import numpy as np
 from tqdm import tqdm
 from typing import List, Tuple
 from sealhits.db.dbschema import Groups, TrackGroup, PGDFS, Points
 from sealhits.sources.files import pgdfs_to_full_paths
+from sealhits.sources.points import (
+    KEY_FIELDS,
+    PointStore,
+    point_key,
+    points_array,
+)
+from sealhits.utils import pool_map
 from pypam import pgdf
 
 from sqlalchemy.orm import (
     Session,
 )
 
-__all__ = ["tracks_to_pgdfs", "process_pgdfs"]
+__all__ = ["tracks_to_pgdfs", "process_pgdfs", "read_pgdf_points"]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
+QUERY_CHUNK = 1000  # Maximum number of values in one IN clause
+
 
 def tracks_to_pgdfs(tracks: List[TrackGroup]) -> List[str]:
     """Take the created TrackGroup list and return the PGDFs we need.
@@ -46,15 +55,106 @@ def tracks_to_pgdfs(tracks: List[TrackGroup]) -> List[str]:
     return pgdfs_required
 
 
+def _find_points_db(session: Session, track_ids: List[uuid.UUID]) -> dict:
+    """Load the existing points for a list of tracks, keyed by track_id
+    then by point_key.
+
+    Args:
+        session (Session): The current SQLAlchemy session.
+        track_ids (List[uuid.UUID]): The track_ids of the tracks of interest.
+
+    Returns:
+        dict: for each track_id, a dict of its Points objects by their natural key.
+    """
+    existing = {}
+
+    with session.no_autoflush:
+        for i in range(0, len(track_ids), QUERY_CHUNK):
+            q = session.query(Points).filter(
+                Points.track_id.in_(track_ids[i : i + QUERY_CHUNK])
+            )
+
+            for p in q.all():
+                key = point_key(
+                    p.time,
+                    p.sonarid,
+                    p.minbearing,
+                    p.maxbearing,
+                    p.minrange,
+                    p.maxrange,
+                    p.peakbearing,
+                    p.maxvalue,
+                    p.occupancy,
+                    p.objsize,
+                )
+                existing.setdefault(p.track_id, {})[key] = p
+
+    return existing
+
+
+# The tracks each worker process extracts points for. Set once per
+# worker by _init_pgdf_worker so it isn't sent with every file.
+_worker_tracks = set()
+
+
+def _init_pgdf_worker(track_pam_ids: set):
+    global _worker_tracks
+    _worker_tracks = track_pam_ids
+
+
+def read_pgdf_points(
+    pgpath: str,
+) -> Tuple[str, datetime.datetime, datetime.datetime, List[Tuple[int, np.ndarray]]]:
+    """Decode a PGDF file, returning its date range and, for each track we
+    want, a compact array of its points (see POINT_DTYPE). This runs in the
+    worker processes of process_pgdfs, so it returns plain data rather than
+    ORM objects.
+
+    Args:
+        pgpath (str): The path to the PGDF.
+
+    Returns:
+        Tuple[str, datetime.datetime, datetime.datetime, List[Tuple[int, np.ndarray]]]: the path, the earliest and latest dates and a list of track PAMGuard UIDs with their points.
+    """
+    tp = pgdf.PGDF(pgpath)
+    date_min = None
+    date_max = None
+    track_points = []
+
+    for pamobj in tp.module.objects:
+        tdate = pamobj.pam.date
+        assert tdate is not None
+
+        if date_min is None or date_min > tdate:
+            date_min = tdate
+
+        if date_max is None or date_max < tdate:
+            date_max = tdate
+
+        pam_track_uid = pamobj.pam.UID
+
+        # Only tracks that reference the tracks_groups table are wanted.
+        if pam_track_uid not in _worker_tracks:
+            continue
+
+        track_points.append((pam_track_uid, points_array(pamobj.data.track.points)))
+
+    return (pgpath, date_min, date_max, track_points)
+
+
 def process_pgdfs(
     session: Session,
     pgdf_path: str,
     pgdfs: List[str],
     groups: List[Groups],
     tracks: List[TrackGroup],
-) -> Tuple[List[PGDFS], List[Points]]:
+    workers=None,
+) -> Tuple[List[PGDFS], PointStore]:
     """Build up the PGDFS, Points and groups_pgdfs tables
-    from the list of PGDFs provided.
+    from the list of PGDFs provided. The PGDFs are decoded in
+    parallel worker processes; the PGDFS objects and the
+    columnar store of points are built here as the results
+    come back, in file order.
     
     Args:
         session (Session): The current SQLAlchemy session.
@@ -62,9 +162,10 @@ def process_pgdfs(
         pgdfs (List[str]): The list of PGDF files we want.
         groups (List[Groups]): The list of Groups from the current session.
         tracks (List[TrackGroup]): The list of TrackGroup in the current session.
+        workers (int): The number of worker processes (default: the number of CPUs).
 
     Returns:
-        Tuple[List[PGDFS], List[Points]]: The new PGDFS objects and the new Points objects.
+        Tuple[List[PGDFS], PointStore]: The new PGDFS objects and the store of new and existing points.
 
     """
     # TODO - this should be a set of transactions that we apply to the db
@@ -75,47 +176,56 @@ def process_pgdfs(
     logging.info("Creating pgdf -> group...")
     full_paths = pgdfs_to_full_paths(pgdf_path, pgdfs)
     new_pgdfs = []
-    new_points = []
+    new_points = PointStore()
+
+    # Load the points we already have for these tracks in one go, rather
+    # than querying for each point we read.
+    logging.info("Loading existing points...")
+    existing_points = _find_points_db(session, [tg.track_id for tg in tracks])
+    points_seen = {}  # The keys of the points read so far, by track_id
+
+    # Build the track lookup once for the whole ingest.
+    # We don't use the pamguard id but a distinct-across-pgdf-files uid
+    # of our own, so we need a lookup from one to the other.
+    logging.info("Creating tracks lookup...")
+    track_pam_to_track = {}
+
+    for tg in tracks:
+        assert(tg.track_pam_id not in track_pam_to_track.keys())
+        track_pam_to_track[tg.track_pam_id] = tg
+
+    groups_by_uid = {g.uid: g for g in groups}
+
+    # The PGDFs we already have, by filename.
+    pgdf_names = [os.path.basename(pgpath) for pgpath in full_paths]
+    pgdfs_in_db = {}
+
+    with session.no_autoflush:
+        for i in range(0, len(pgdf_names), QUERY_CHUNK):
+            q = session.query(PGDFS).filter(
+                PGDFS.filename.in_(pgdf_names[i : i + QUERY_CHUNK])
+            )
 
-    # Read all the PGDFs to get the start & end times
-    for pgpath in tqdm(full_paths, desc="Reading PGDFs"):
+            for pgdf_entry in q.all():
+                pgdfs_in_db[pgdf_entry.filename] = pgdf_entry
+
+    # Read each PGDF once, finding the start & end times as we read the points.
+    results = pool_map(
+        read_pgdf_points,
+        full_paths,
+        workers,
+        _init_pgdf_worker,
+        (set(track_pam_to_track.keys()),),
+    )
+
+    for pgpath, date_min, date_max, track_points in tqdm(
+        results, total=len(full_paths), desc="Reading PGDFs"
+    ):
         fgname = os.path.basename(pgpath)
-        tp = pgdf.PGDF(pgpath)
-        date_min = None
-        date_max = None
-
-        for pamobj in tp.module.objects:
-            tdate = pamobj.pam.date
-            assert tdate is not None
-
-            if date_min is None:
-                date_min = tdate
-            elif date_min > tdate:
-                date_min = tdate
-
-            if date_max is None:
-                date_max = tdate
-            elif date_max < tdate:
-                date_max = tdate
-
-        # Find the tracks_groups for the groups and file we are currently processing
-        logging.info("Creating tracks lookup for file %s", pgpath)
-
-        # Create a second dictionary for fast checking of tracks_groups
-        # Dictionaries have O(1) access time apparently. Hashtable like I bet.
-        tracks_used = {}
-        # We also don't use the pamguard id but a distinct-across-pgdf-files uid
-        # of our own, so we need that lookup too.
-        track_pam_to_track = {}
-
-        for tg in tracks:
-            assert(tg.track_pam_id not in tracks_used.keys())
-            tracks_used[tg.track_pam_id] = 0
-            track_pam_to_track[tg.track_pam_id] = tg
-
-        # Create a PGDF and add it to the new list
-        q = session.query(PGDFS).filter(PGDFS.filename == fgname)
-        pgdf_entry = q.one_or_none()
+
+        # Create a PGDF and add it to the new list, or update
+        # the one we have with the new details.
+        pgdf_entry = pgdfs_in_db.get(fgname, None)
 
         if pgdf_entry is None:
             pgdf_entry = PGDFS(
@@ -125,101 +235,40 @@ def process_pgdfs(
                 enddate=date_max,
             )
         else:
-            # Update PGDF with new details
-            pgdf_entry.startdate = date_min,
+            pgdf_entry.startdate = date_min
             pgdf_entry.enddate = date_max
 
         new_pgdfs.append(pgdf_entry)
 
-        # Now, we read the points in this PGDF but we must
-        # only include these that reference the tracks_groups table.
-        # We can safely assume the tracks table is not as stupidly
-        # large as the number of annotations is small.
-        for pamobj in tp.module.objects:
-            pam_track = pamobj.data
-            pam_track_uid = pamobj.pam.UID
-
-            try:
-                track = pam_track.track
-                track_obj = track_pam_to_track[pam_track_uid]
-                group = None
-
-                for g in groups:
-                    if g.uid == track_obj.group_id:
-                        group = g
-                        break
-                # Should never happen but apparently, HDD 35 and 33 are sort of
-                # mixed. Not sure what happened here but we just log and ignore
-                if group is None:
-                    logging.error("Missing group %s for trackgroup on pgdf %s", track_obj.group_id, fgname)
-                    break 
-                
-                #assert(group is not None)
-
-                # Create the link between the group and pgdf if not already
-                if group not in pgdf_entry.groups:
-                    pgdf_entry.groups.append(group)
-
-                # Now insert all the points into the database for this known
-                # track.
-                for point in track.points:
-                    q = session.query(Points).filter(
-                        Points.time == point.time,
-                        Points.sonarid == point.sonar_id,
-                        Points.minbearing == point.min_bearing,
-                        Points.maxbearing == point.max_bearing,
-                        Points.minrange == point.min_range,
-                        Points.maxrange == point.max_range,
-                        Points.peakbearing == point.peak_bearing,
-                        Points.maxvalue == point.max_value,
-                        Points.occupancy == point.occupancy,
-                        Points.objsize == point.obj_size,
-                        Points.track_id == track_obj.track_id,
-                    )
-                    new_point = q.one_or_none()
-                    # No need to run an update existing point as a point
-                    # is unique if any of it's attributes are different.
-    
-                    if new_point is None:
-                        new_point = Points(
-                            uid=uuid.uuid4(),
-                            time=point.time,
-                            sonarid=point.sonar_id,
-                            minbearing=point.min_bearing,
-                            maxbearing=point.max_bearing,
-                            minrange=point.min_range,
-                            maxrange=point.max_range,
-                            peakbearing=point.peak_bearing,
-                            peakrange=point.peak_range,
-                            maxvalue=point.max_value,
-                            occupancy=point.occupancy,
-                            objsize=point.obj_size,
-                            track_id=track_obj.track_id,
-                            group_id=group.uid
-                        )
-
-                    else:
-                        # Make sure this point has it's group_uid changed!
-                        new_point.time=point.time
-                        new_point.sonarid=point.sonar_id
-                        new_point.minbearing=point.min_bearing
-                        new_point.maxbearing=point.max_bearing
-                        new_point.minrange=point.min_range
-                        new_point.maxrange=point.max_range
-                        new_point.peakbearing=point.peak_bearing
-                        new_point.peakrange=point.peak_range
-                        new_point.maxvalue=point.max_value
-                        new_point.occupancy=point.occupancy
-                        new_point.objsize=point.obj_size
-                        new_point.track_id=track_obj.track_id
-                        new_point.group_id=group.uid
-
-                    new_points.append(new_point)
-
-            except KeyError:
-                # This track isn't important so skip
-                # print(e)
-                # TODO - this try except thing is a bit naughty!
-                pass
-
-    return (new_pgdfs, new_points)
\ No newline at end of file
+        for pam_track_uid, tpoints in track_points:
+            track_obj = track_pam_to_track[pam_track_uid]
+            group = groups_by_uid.get(track_obj.group_id, None)
+
+            # Should never happen but apparently, HDD 35 and 33 are sort of
+            # mixed. Not sure what happened here but we just log and ignore
+            if group is None:
+                logging.error("Missing group %s for trackgroup on pgdf %s", track_obj.group_id, fgname)
+                continue
+
+            # Create the link between the group and pgdf if not already
+            if group not in pgdf_entry.groups:
+                pgdf_entry.groups.append(group)
+
+            # Now add the points for this known track, matching them against
+            # the points we already have. The same point can turn up more than once.
+            seen = points_seen.setdefault(track_obj.track_id, set())
+            track_existing = existing_points.get(track_obj.track_id, {})
+            keep = []
+            existing = []
+
+            for idx, key in enumerate(tpoints[KEY_FIELDS].tolist()):
+                if key in seen:
+                    continue
+
+                seen.add(key)
+                keep.append(idx)
+                existing.append(track_existing.get(key, None))
+
+            new_points.append(tpoints[keep], track_obj.track_id, group.uid, existing)
+
+    return (new_pgdfs, new_points)
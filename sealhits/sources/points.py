@@ -0,0 +1,439 @@
+"""
+points.py - a columnar store for the points of an ingest.
+
+An ingest can read millions of points. Rather than an ORM object
+per point, the points are held in NumPy structured arrays while
+the groups are fixed and split. ORM objects, or rows for a bulk
+write, are only made when the points are written.
+"""
+
+from __future__ import annotations
+
+__all__ = [
+    "POINT_DTYPE",
+    "KEY_FIELDS",
+    "STORE_DTYPE",
+    "PointStore",
+    "point_key",
+    "points_array",
+    "to_datetime64",
+    "from_datetime64",
+]
+__version__ = "0.7.0"
+__author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
+
+import datetime
+import uuid
+import pytz
+import numpy as np
+from typing import Iterator, List, Union
+from sealhits.db.dbschema import Points
+
+# The values of a point, as read from a PGDF.
+POINT_DTYPE = np.dtype(
+    [
+        ("time", "datetime64[us]"),
+        ("sonarid", np.int32),
+        ("minbearing", np.float32),
+        ("maxbearing", np.float32),
+        ("minrange", np.float32),
+        ("maxrange", np.float32),
+        ("peakbearing", np.float32),
+        ("peakrange", np.float32),
+        ("maxvalue", np.float32),
+        ("occupancy", np.float32),
+        ("objsize", np.float32),
+    ]
+)
+
+# The fields that, along with the track, make up the natural key of a
+# point - the points_un constraint.
+KEY_FIELDS = [
+    "time",
+    "sonarid",
+    "minbearing",
+    "maxbearing",
+    "minrange",
+    "maxrange",
+    "peakbearing",
+    "maxvalue",
+    "occupancy",
+    "objsize",
+]
+
+# A point in the store - its values, its uid and indices into the
+# store's lists of track and group uids.
+STORE_DTYPE = np.dtype(
+    POINT_DTYPE.descr
+    + [("uid", np.uint8, (16,)), ("track", np.int32), ("group", np.int32)]
+)
+
+
+def to_datetime64(t: datetime.datetime) -> np.datetime64:
+    """Convert a datetime to a numpy datetime64 in UTC. Naive datetimes
+    are assumed to be UTC already.
+
+    Args:
+        t (datetime.datetime): The datetime to convert.
+
+    Returns:
+        np.datetime64: the time in microseconds.
+    """
+    if t.tzinfo is not None:
+        t = t.astimezone(pytz.UTC).replace(tzinfo=None)
+
+    return np.datetime64(t, "us")
+
+
+def from_datetime64(t: np.datetime64) -> datetime.datetime:
+    """Convert a numpy datetime64 in UTC back to a timezone aware datetime.
+
+    Args:
+        t (np.datetime64): The time to convert.
+
+    Returns:
+        datetime.datetime: the UTC datetime.
+    """
+    return t.astype("datetime64[us]").astype(datetime.datetime).replace(tzinfo=pytz.UTC)
+
+
+def point_key(
+    time: datetime.datetime,
+    sonarid: int,
+    minbearing: float,
+    maxbearing: float,
+    minrange: float,
+    maxrange: float,
+    peakbearing: float,
+    maxvalue: float,
+    occupancy: float,
+    objsize: float,
+) -> tuple:
+    """Return the natural key of a point within its track as a hashable tuple.
+    The float columns are stored as reals so they are rounded to single precision.
+    The tuple is the same as the KEY_FIELDS of a POINT_DTYPE row from tolist(), so
+    points read back from the database can be matched against those read from a PGDF.
+
+    Returns:
+        tuple: the key.
+    """
+    return (
+        to_datetime64(time).astype(datetime.datetime),
+        int(sonarid),
+        float(np.float32(minbearing)),
+        float(np.float32(maxbearing)),
+        float(np.float32(minrange)),
+        float(np.float32(maxrange)),
+        float(np.float32(peakbearing)),
+        float(np.float32(maxvalue)),
+        float(np.float32(occupancy)),
+        float(np.float32(objsize)),
+    )
+
+
+def points_array(points) -> np.ndarray:
+    """Convert the points of a PAMGuard track (as read by pypam) to a
+    compact array with the POINT_DTYPE.
+
+    Args:
+        points (List): the points of the track.
+
+    Returns:
+        np.ndarray: the points.
+    """
+    tpoints = np.empty(len(points), dtype=POINT_DTYPE)
+
+    for idx, point in enumerate(points):
+        tpoints[idx] = (
+            to_datetime64(point.time),
+            point.sonar_id,
+            point.min_bearing,
+            point.max_bearing,
+            point.min_range,
+            point.max_range,
+            point.peak_bearing,
+            point.peak_range,
+            point.max_value,
+            point.occupancy,
+            point.obj_size,
+        )
+
+    return tpoints
+
+
+class PointStore(object):
+    """Holds the points of an ingest as one structured array (see STORE_DTYPE).
+    Track and group uids are held once, in lists, with each point holding an
+    index into them. Points that are already in the database keep their ORM
+    object in existing, by their index, so they can be updated.
+
+    Iterating over a store gives Points objects, made as they are needed.
+    """
+
+    def __init__(self):
+        self._data = np.empty(0, dtype=STORE_DTYPE)
+        self._chunks = []
+        self.track_ids = []
+        self._track_index = {}
+        self.group_ids = []
+        self._group_index = {}
+        self.existing = {}
+
+    def __len__(self) -> int:
+        return len(self._data) + sum(len(chunk) for chunk in self._chunks)
+
+    def __iter__(self) -> Iterator[Points]:
+        for idx in range(len(self)):
+            yield self.point(idx)
+
+    @property
+    def data(self) -> np.ndarray:
+        """The points as a single structured array."""
+        if len(self._chunks) > 0:
+            self._data = np.concatenate([self._data] + self._chunks)
+            self._chunks = []
+
+        return self._data
+
+    def track_index(self, track_id: uuid.UUID) -> int:
+        """Return the index of a track uid, adding it if it is new."""
+        idx = self._track_index.get(track_id, None)
+
+        if idx is None:
+            idx = len(self.track_ids)
+            self.track_ids.append(track_id)
+            self._track_index[track_id] = idx
+
+        return idx
+
+    def group_index(self, group_uid: uuid.UUID) -> int:
+        """Return the index of a group uid, adding it if it is new."""
+        idx = self._group_index.get(group_uid, None)
+
+        if idx is None:
+            idx = len(self.group_ids)
+            self.group_ids.append(group_uid)
+            self._group_index[group_uid] = idx
+
+        return idx
+
+    def append(
+        self,
+        points: np.ndarray,
+        track_id: uuid.UUID,
+        group_uid: uuid.UUID,
+        existing: List[Union[Points, None]],
+    ):
+        """Add the points of one track.
+
+        Args:
+            points (np.ndarray): The points, with the POINT_DTYPE.
+            track_id (uuid.UUID): The track_id of the TrackGroup they belong to.
+            group_uid (uuid.UUID): The uid of the group they belong to.
+            existing (List[Union[Points, None]]): for each point, the matching Points
+                object already in the database, or None if the point is new.
+        """
+        start = len(self)
+        chunk = np.empty(len(points), dtype=STORE_DTYPE)
+
+        for name in POINT_DTYPE.names:
+            chunk[name] = points[name]
+
+        chunk["track"] = self.track_index(track_id)
+        chunk["group"] = self.group_index(group_uid)
+
+        for idx, point in enumerate(existing):
+            if point is None:
+                uid = uuid.uuid4()
+            else:
+                uid = point.uid
+                self.existing[start + idx] = point
+
+            chunk["uid"][idx] = np.frombuffer(uid.bytes, dtype=np.uint8)
+
+        self._chunks.append(chunk)
+
+    def set_group(self, indices: np.ndarray, group_uid: uuid.UUID):
+        """Move points to another group."""
+        self.data["group"][indices] = self.group_index(group_uid)
+
+    def indices_by_group(self) -> dict:
+        """Return the indices of the points of each group, in the store's order,
+        by group uid."""
+        data = self.data
+        order = np.argsort(data["group"], kind="stable")
+        groups = data["group"][order]
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        index = {}
+
+        for indices in np.split(order, bounds):
+            if len(indices) > 0:
+                index[self.group_ids[data["group"][indices[0]]]] = indices
+
+        return index
+
+    def time_bounds(self) -> dict:
+        """Return the earliest and latest point time of each group in one pass,
+        sorting the points by group once and reducing each run of times.
+
+        Returns:
+            dict: (earliest, latest) as UTC datetimes, by group uid.
+        """
+        data = self.data
+
+        if len(data) == 0:
+            return {}
+
+        order = np.argsort(data["group"], kind="stable")
+        groups = data["group"][order]
+        times = data["time"][order].view(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1))
+        earliest = np.minimum.reduceat(times, starts).view("datetime64[us]")
+        latest = np.maximum.reduceat(times, starts).view("datetime64[us]")
+
+        return {
+            self.group_ids[group]: (from_datetime64(start), from_datetime64(end))
+            for group, start, end in zip(groups[starts], earliest, latest)
+        }
+
+    def subset(self, indices: np.ndarray) -> PointStore:
+        """Return a new store holding just these points, in this order. The
+        lists of track and group uids are shared with this store."""
+        store = PointStore()
+        store.track_ids = self.track_ids
+        store._track_index = self._track_index
+        store.group_ids = self.group_ids
+        store._group_index = self._group_index
+        store._data = self.data[indices]
+
+        for new_idx, idx in enumerate(indices):
+            point = self.existing.get(int(idx), None)
+
+            if point is not None:
+                store.existing[new_idx] = point
+
+        return store
+
+    def uids(self) -> set:
+        """Return the uids of all the points, without making Points objects."""
+        raw = np.ascontiguousarray(self.data["uid"]).tobytes()
+        return {uuid.UUID(bytes=raw[i : i + 16]) for i in range(0, len(raw), 16)}
+
+    def row(self, idx: int) -> dict:
+        """Return the column values of a point, ready for a bulk write."""
+        point = self.data[idx]
+
+        return {
+            "uid": uuid.UUID(bytes=point["uid"].tobytes()),
+            "time": from_datetime64(point["time"]),
+            "sonarid": int(point["sonarid"]),
+            "minbearing": float(point["minbearing"]),
+            "maxbearing": float(point["maxbearing"]),
+            "minrange": float(point["minrange"]),
+            "maxrange": float(point["maxrange"]),
+            "peakbearing": float(point["peakbearing"]),
+            "peakrange": float(point["peakrange"]),
+            "maxvalue": float(point["maxvalue"]),
+            "occupancy": float(point["occupancy"]),
+            "objsize": float(point["objsize"]),
+            "track_id": self.track_ids[point["track"]],
+            "group_id": self.group_ids[point["group"]],
+        }
+
+    def rows(self, new_only=False) -> Iterator[dict]:
+        """Yield the column values of each point, ready for a bulk write.
+
+        Args:
+            new_only (bool): skip the points already in the database.
+
+        Returns:
+            Iterator[dict]: the values of each point.
+        """
+        for idx in range(len(self)):
+            if new_only and idx in self.existing:
+                continue
+
+            yield self.row(idx)
+
+    def point(self, idx: int) -> Points:
+        """Return a point as a Points object. A point already in the database
+        is its existing object, attached to its track and group here."""
+        point = self.existing.get(idx, None)
+
+        if point is None:
+            return Points(**self.row(idx))
+
+        self._attach(idx, point)
+        return point
+
+    def _attach(self, idx: int, point: Points) -> bool:
+        """Move an existing point to the track and group held here. Its other
+        values match by its key, so they are left alone, and an unmoved point
+        isn't marked as changed.
+
+        Returns:
+            bool: whether the point was moved.
+        """
+        data = self.data[idx]
+        track_id = self.track_ids[data["track"]]
+        group_id = self.group_ids[data["group"]]
+        moved = False
+
+        if point.track_id != track_id:
+            point.track_id = track_id
+            moved = True
+
+        if point.group_id != group_id:
+            point.group_id = group_id
+            moved = True
+
+        return moved
+
+    def attach_existing(self) -> int:
+        """Move the points already in the database to the tracks and groups
+        held here - the groups in particular, after a split. Only the points
+        that move are changed, so only they are written when the session
+        is flushed.
+
+        Returns:
+            int: the number of points moved.
+        """
+        return sum(
+            self._attach(idx, point) for idx, point in sorted(self.existing.items())
+        )
+
+    @classmethod
+    def from_points(cls, points: List[Points]) -> PointStore:
+        """Build a store from a list of Points objects. Each point keeps its
+        object, so iterating the store gives the same objects back.
+
+        Args:
+            points (List[Points]): The points.
+
+        Returns:
+            PointStore: the new store.
+        """
+        store = cls()
+        data = np.empty(len(points), dtype=STORE_DTYPE)
+
+        for idx, point in enumerate(points):
+            data[idx] = (
+                to_datetime64(point.time),
+                point.sonarid,
+                point.minbearing,
+                point.maxbearing,
+                point.minrange,
+                point.maxrange,
+                point.peakbearing,
+                point.peakrange,
+                point.maxvalue,
+                point.occupancy,
+                point.objsize,
+                np.frombuffer(point.uid.bytes, dtype=np.uint8),
+                store.track_index(point.track_id),
+                store.group_index(point.group_id),
+            )
+            store.existing[idx] = point
+
+        store._data = data
+        return store
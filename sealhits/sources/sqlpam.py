@@ -13,29 +13,85 @@ Examples:
     >>> assert os.path.exists(sqlitepath)
     >>> sqlpam = SQLPAM(sqlitepath)
     >>> print(sqlpam.tables)
+    >>> for track_group in sqlpam.iter_groups():
+    ...     print(track_group.uid, len(track_group.children))
 
 """
 from __future__ import annotations
 
-__all__ = ["SQLPAM", "TrackGroup"]
+__all__ = ["SQLPAM", "TrackGroup", "TrackChild", "parse_utc_times"]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 import sqlite3
 import pytz
+import numpy as np
+from contextlib import closing
 from datetime import datetime
+from typing import Iterator, List, Tuple, Union
 from pypam.util import checks
 
+
+def _as_utc(t: Union[str, datetime]) -> datetime:
+    """Parse a time string from the SQLite file as UTC, unless it has
+    been parsed already (see parse_utc_times)."""
+    if isinstance(t, str):
+        return pytz.utc.localize(datetime.fromisoformat(t))
+
+    return t
+
+
+def _read_columns(sqlite_path: str, table: str, rowid: int, columns: Tuple[str]) -> tuple:
+    """Read a few columns of a single row from the SQLite file."""
+    with closing(sqlite3.connect(sqlite_path)) as con:
+        row = con.execute(
+            "SELECT " + ", ".join(columns) + " FROM " + table + " WHERE rowid = ?",
+            (rowid,),
+        ).fetchone()
+
+    if row is None:
+        return (None,) * len(columns)
+
+    return row
+
+
+def _fix_binary_file(binary_file: str) -> str:
+    """Fix for the bug in pamguard with the binary file name."""
+    if binary_file[:2] == "i_":
+        return "Gemin" + binary_file
+
+    return binary_file
+
+
 # TODO - could we use a nice database shim library abstraction here?
 class TrackChild:
     """The class representing the individual track from the PAMGUARD
     pgdf binary file. It contains a UID link to the gemini object from
-    the PGDF."""
+    the PGDF.
+
+    There can be hundreds of thousands of these, so they are slotted.
+    The columns we never use are only read from the SQLite file if
+    they are asked for."""
+
+    __slots__ = (
+        "uid",
+        "utc",
+        "channel_bitmap",
+        "parent_id",
+        "parent_uid",
+        "binary_file",
+        "parent",
+        "_extra",
+        "_path",
+        "_rowid",
+    )
+
+    LAZY_COLUMNS = ("PCLocalTime", "PCTime", "LongDataName")
 
     def __init__(
         self,
         uid: int,
-        utc: str,
+        utc: Union[str, datetime],
         pc_local: str,
         pc_time: str,
         channel: int,
@@ -43,12 +99,14 @@ class TrackChild:
         parent_uid: int,
         long_data_name: str,
         binary_file: str,
+        path=None,
+        rowid=None,
     ):
         """Initialise our TrackChild Object.
 
         Args:
             uid (int): a unique identifier matching the PGDF binary track.
-            utc (str): a string representing the time in UTC.
+            utc (Union[str, datetime]): the time in UTC, as a string or already parsed.
             pc_local (str): the local time on the pc recording.
             pc_time (str): the time on the pc recording.
             channel (int): unknown.
@@ -56,22 +114,44 @@ class TrackChild:
             parent_uid (int): The UID of the TrackGroup to which this child belongs.
             long_data_name (str): unknown.
             binary_file (str): The filename of the PGDF that holds this track.
+            path (str): Optional. The SQLite file to read pc_local, pc_time and
+                long_data_name from when needed, instead of passing them in.
+            rowid (int): Optional. The rowid of this child in that SQLite file.
         """
         self.uid = uid
-        self.utc = datetime.fromisoformat(utc)
-        self.utc = pytz.utc.localize(self.utc)
-        self.pc_local_time = pc_local
-        self.pc_time = pc_time
+        self.utc = _as_utc(utc)
         self.channel_bitmap = channel
         self.parent_id = parent_id
         self.parent_uid = parent_uid
-        self.long_data_name = long_data_name
         self.parent = None
+        self._path = path
+        self._rowid = rowid
+        self._extra = None
+
+        if path is None:
+            self._extra = (pc_local, pc_time, long_data_name)
+
+        self.binary_file = _fix_binary_file(binary_file)
+
+    def _lazy(self, idx: int):
+        if self._extra is None:
+            self._extra = _read_columns(
+                self._path, "Track_Groups_Children", self._rowid, self.LAZY_COLUMNS
+            )
+
+        return self._extra[idx]
 
-        # Fix for the bug in pamguard with the binary file
-        if binary_file[:2] == "i_":
-            self.binary_file = "Gemin" + binary_file
+    @property
+    def pc_local_time(self) -> str:
+        return self._lazy(0)
 
+    @property
+    def pc_time(self) -> str:
+        return self._lazy(1)
+
+    @property
+    def long_data_name(self) -> str:
+        return self._lazy(2)
 
     def _add_parent(self, parent: TrackGroup):
         self.parent = parent
@@ -99,17 +179,39 @@ class TrackChild:
 
 
 class TrackGroup:
-    """A group of TrackChild that may have annotations."""
+    """A group of TrackChild that may have annotations. Slotted, with
+    the unused columns read lazily, as with TrackChild."""
+
+    __slots__ = (
+        "id",
+        "uid",
+        "utc",
+        "channel_bitmap",
+        "end_time",
+        "data_count",
+        "track_type",
+        "comment",
+        "mammal",
+        "fish",
+        "bird",
+        "interaction",
+        "children",
+        "_extra",
+        "_path",
+        "_rowid",
+    )
+
+    LAZY_COLUMNS = ("PCLocalTime", "PCTime")
 
     def __init__(
         self,
         id : int,
         uid: int,
-        utc: str,
+        utc: Union[str, datetime],
         pc_local: str,
         pc_time: str,
         channel: int,
-        end_time: str,
+        end_time: Union[str, datetime],
         dc: int,
         track_type: str,
         comment: str,
@@ -117,18 +219,20 @@ class TrackGroup:
         fish: int,
         bird: int,
         interact: bool,
+        path=None,
+        rowid=None,
     ):
         """Initialise our TrackGroup Object.
 
         Args:
 
             uid (int): a unique identifier matching the PGDF binary track, although not that unique it seems :/
-            utc (str): a string representing the time in UTC.
+            utc (Union[str, datetime]): the time in UTC, as a string or already parsed.
             utc_milli (int): an int number of milliseconds since the epoch in utc.
             pc_local (str): the local time on the pc recording.
             pc_time (str): the time on the pc recording.
             channel (int): unknown.
-            end_time (str): When does the last Track in this group finish?
+            end_time (Union[str, datetime]): When does the last Track in this group finish?
             dc (int): unknown.
             track_type (str): unknown.
             comment (str):
@@ -136,16 +240,15 @@ class TrackGroup:
             fish (int): Was this trackgroup a fish?
             bird (int): Was this trackgroup a bird?
             interact (bool): Did this trackgroup interact with the turbine?
+            path (str): Optional. The SQLite file to read pc_local and pc_time
+                from when needed, instead of passing them in.
+            rowid (int): Optional. The rowid of this group in that SQLite file.
         """
         self.id = id
         self.uid = uid
-        self.utc = datetime.fromisoformat(utc)
-        self.utc = pytz.utc.localize(self.utc)
-        self.pc_local_time = pc_local
-        self.pc_time = pc_time
+        self.utc = _as_utc(utc)
         self.channel_bitmap = channel
-        self.end_time = datetime.fromisoformat(end_time)
-        self.end_time = pytz.utc.localize(self.end_time)
+        self.end_time = _as_utc(end_time)
         self.data_count = dc
         self.track_type = track_type  # TODO - enum
         self.comment = comment
@@ -154,6 +257,28 @@ class TrackGroup:
         self.bird = bird
         self.interaction = interact
         self.children = []
+        self._path = path
+        self._rowid = rowid
+        self._extra = None
+
+        if path is None:
+            self._extra = (pc_local, pc_time)
+
+    def _lazy(self, idx: int):
+        if self._extra is None:
+            self._extra = _read_columns(
+                self._path, "Track_Groups", self._rowid, self.LAZY_COLUMNS
+            )
+
+        return self._extra[idx]
+
+    @property
+    def pc_local_time(self) -> str:
+        return self._lazy(0)
+
+    @property
+    def pc_time(self) -> str:
+        return self._lazy(1)
 
     def __str__(self):
         return (
@@ -177,7 +302,7 @@ class TrackGroup:
             + ","
             + str(self.comment)
             + ","
-            + str(self.marine_mammal)
+            + str(self.mammal)
             + ","
             + str(self.fish)
             + ","
@@ -199,142 +324,225 @@ class TrackGroup:
         return self
 
 
+def parse_utc_times(values: List[Union[str, None]]) -> List[Union[datetime, None]]:
+    """Parse a batch of ISO format time strings from the SQLite file, all at once,
+    into timezone aware UTC datetimes. Missing times are returned as None.
+
+    Args:
+        values (List[Union[str, None]]): the time strings.
+
+    Returns:
+        List[Union[datetime, None]]: the UTC datetimes.
+    """
+    try:
+        parsed = np.array(values, dtype="datetime64[us]").tolist()
+    except ValueError:
+        # Not something numpy can read, so fall back to one at a time.
+        parsed = [None if v is None else datetime.fromisoformat(v) for v in values]
+
+    return [None if t is None else pytz.utc.localize(t) for t in parsed]
+
+
+def _clean_flags(mammal, fish, bird, interaction) -> Tuple[int, int, int, bool]:
+    """Tidy up the annotation columns of a Track_Groups row."""
+    # We need extra checks here to make sure
+    # numerics are indeed numerics. SQLLite DB has a number
+    # of mistakes.
+
+    if mammal is None or not checks.is_float(mammal):
+        mammal = -1
+
+    if fish is None or not checks.is_float(fish):
+        fish = -1
+
+    if bird is None or not checks.is_float(bird):
+        bird = -1
+
+    interact = False
+
+    # This is very annoying and silly
+    if interaction is not None:
+        if "1" in interaction:
+            interact = True
+
+        if "0" in interaction:
+            interact = False
+
+        elif not checks.is_float(interaction):
+            interact = False
+
+        elif interaction == 1:
+            interact = True
+
+        elif interaction == 0:
+            interact = False
+
+    return (mammal, fish, bird, interact)
+
+
+# The groups and their children in one query. Only id and uid combined are
+# unique, so both are used to join. Groups without children still appear,
+# with NULLs for the child columns. The columns we don't use (see
+# LAZY_COLUMNS) are left out and read by rowid if they are ever needed.
+GROUPS_CHILDREN_QUERY = """
+    SELECT g.rowid, g.ID, g.UID, g.UTC, g.ChannelBitmap, g.EndTime,
+        g.DataCount, g.Track_Type, g.Marine_Mammal, g.Fish, g.Bird,
+        g.Interaction_with_blades, g.Comment, c.rowid, c.UID, c.UTC,
+        c.ChannelBitmap, c.parentID, c.parentUID, c.BinaryFile
+    FROM Track_Groups AS g
+    LEFT JOIN Track_Groups_Children AS c
+        ON c.parentID = g.ID AND c.parentUID = g.UID AND c.BinaryFile IS NOT NULL
+    ORDER BY g.rowid, c.rowid
+"""
+
+# Rows fetched from SQLite at a time when streaming.
+FETCH_SIZE = 5000
+
+
 class SQLPAM:
     """The class that represents the data held in the SQLite
-    annotation database. This object will hold the TrackGroups and
-    TrackChilds."""
+    annotation database. The TrackGroups, with their TrackChilds,
+    can be streamed with iter_groups, or read all at once through
+    track_groups and track_children."""
 
     # TODO - just as with GLF, do we want to concat multiple files?
     # TODO - better checking for return values from the db (I.e missing)
 
     def __init__(self, sqlite_path):
-        """Initialise our SQLPAM object
+        """Initialise our SQLPAM object. Only the table names are read
+        here; the groups are read when first needed.
 
         Args:
             sqlite_path (str): full path and name of the sqlite_path file.
 
         """
-        con = sqlite3.connect(sqlite_path)
-        cur = con.cursor()
-        res = cur.execute("SELECT name FROM sqlite_master")
-        self.tables = [t[0] for t in res.fetchall()]
-
-        self.track_groups = []
-        self.track_children = []
-
-        res = cur.execute(
-            "SELECT ID, UID, UTC, PCLocalTime, PCTime, \
-            ChannelBitmap, EndTime, DataCount, Track_Type, \
-                Marine_Mammal, Fish, Bird, Interaction_with_blades, \
-                    Comment FROM Track_Groups"
-        )
-        tracks = res.fetchall()
-        id_uid_lookup = {}
-
-        # TODO - could do some inner join stuff here instead of python combine
-        # Read the track groups first off
-        for (
-            id,
-            uid,
-            utc,
-            pclocal,
-            pctime,
-            cbitmap,
-            endtime,
-            dcount,
-            ttype,
-            mammal,
-            fish,
-            bird,
-            interaction,
-            comment,
-        ) in tracks:
-
-            # We need extra checks here to make sure
-            # numerics are indeed numerics. SQLLite DB has a number
-            # of mistakes.
-
-            if mammal is None or not checks.is_float(mammal):
-                mammal = -1
-
-            if fish is None or not checks.is_float(fish):
-                fish = -1
-
-            if bird is None or not checks.is_float(bird):
-                bird = -1
+        self.sqlite_path = sqlite_path
+        self._track_groups = None
+        self._track_children = None
 
-            interact = False
+        with closing(sqlite3.connect(sqlite_path)) as con:
+            res = con.execute("SELECT name FROM sqlite_master")
+            self.tables = [t[0] for t in res.fetchall()]
 
-            # This is very annoying and silly
-            if interaction is not None:
-                if "1" in interaction:
-                    interact = True
-
-                if "0" in interaction:
-                    interact = False
-
-                elif not checks.is_float(interaction):
-                    interact = False
-
-                elif interaction == 1:
-                    interact = True
-            
-                elif interaction == 0:
-                    interact = False
-
-            tg = TrackGroup(
-                id,
-                uid,
-                utc,
-                pclocal,
-                pctime,
-                cbitmap,
-                endtime,
-                dcount,
-                ttype,
-                comment,
-                mammal,
-                fish,
-                bird,
-                interact,
-            )
+    @property
+    def track_groups(self) -> List[TrackGroup]:
+        """All the TrackGroups, read on first use."""
+        if self._track_groups is None:
+            self._load()
 
-            self.track_groups.append(tg)
+        return self._track_groups
 
-            # Use a composite key as only id and uid combined are unique
-            id_uid_lookup[str(tg.id) + "-" + str(tg.uid)] = tg
+    @property
+    def track_children(self) -> List[TrackChild]:
+        """All the TrackChilds, read on first use."""
+        if self._track_children is None:
+            self._load()
 
-        res = cur.execute(
-            "SELECT UID, UTC, PCLocalTime, PCTime, \
-            ChannelBitmap, parentID, parentUID, LongDataName, \
-                BinaryFile FROM Track_Groups_Children where \
-                    BinaryFile is not null"
-        )
-        children = res.fetchall()
-
-        # Read the track children, adding them to their parent
-        for (
-            uid,
-            utc,
-            pclocal,
-            pctime,
-            cbitmap,
-            parentid,
-            parentuid,
-            ldata,
-            bfile,
-        ) in children:
-            tc = TrackChild(
-                uid,
-                utc,
-                pclocal,
-                pctime,
-                cbitmap,
-                parentid,
-                parentuid,
-                ldata,
-                bfile,
+        return self._track_children
+
+    def _load(self):
+        self._track_groups = []
+        self._track_children = []
+
+        for tg in self.iter_groups():
+            self._track_groups.append(tg)
+            self._track_children += tg.children
+
+    def num_groups(self) -> int:
+        """Return the number of TrackGroups without reading them.
+
+        Returns:
+            int: the number of rows in Track_Groups.
+        """
+        with closing(sqlite3.connect(self.sqlite_path)) as con:
+            return con.execute("SELECT COUNT(*) FROM Track_Groups").fetchone()[0]
+
+    def binary_files(self) -> List[str]:
+        """Return the distinct binary files the TrackChilds refer to, without
+        reading the groups.
+
+        Returns:
+            List[str]: the binary file names, as they appear on TrackChild.binary_file.
+        """
+        with closing(sqlite3.connect(self.sqlite_path)) as con:
+            res = con.execute(
+                "SELECT DISTINCT BinaryFile FROM Track_Groups_Children \
+                    WHERE BinaryFile IS NOT NULL"
             )
-            self.track_children.append(tc)
-            parent = id_uid_lookup[str(tc.parent_id) + "-" + str(tc.parent_uid)]
-            parent.add_child(tc)
+
+            return sorted(set(_fix_binary_file(r[0]) for r in res.fetchall()))
+
+    def iter_groups(self, fetch_size=FETCH_SIZE) -> Iterator[TrackGroup]:
+        """Yield each TrackGroup, with its TrackChilds attached, in table order.
+        The join is done by SQLite and the rows are fetched and their times
+        parsed a batch at a time, so only the current batch is held in memory.
+
+        Args:
+            fetch_size (int): the number of rows to fetch at a time.
+
+        Returns:
+            Iterator[TrackGroup]: the TrackGroups.
+        """
+        with closing(sqlite3.connect(self.sqlite_path)) as con:
+            cur = con.execute(GROUPS_CHILDREN_QUERY)
+            current = None
+            current_rowid = None
+
+            while True:
+                rows = cur.fetchmany(fetch_size)
+
+                if len(rows) == 0:
+                    break
+
+                group_utcs = parse_utc_times([r[3] for r in rows])
+                group_ends = parse_utc_times([r[5] for r in rows])
+                child_utcs = parse_utc_times([r[15] for r in rows])
+
+                for idx, row in enumerate(rows):
+                    if row[0] != current_rowid:
+                        if current is not None:
+                            yield current
+
+                        mammal, fish, bird, interact = _clean_flags(*row[8:12])
+                        current_rowid = row[0]
+                        current = TrackGroup(
+                            row[1],
+                            row[2],
+                            group_utcs[idx],
+                            None,
+                            None,
+                            row[4],
+                            group_ends[idx],
+                            row[6],
+                            row[7],
+                            row[12],
+                            mammal,
+                            fish,
+                            bird,
+                            interact,
+                            path=self.sqlite_path,
+                            rowid=row[0],
+                        )
+
+                    # No child for this group
+                    if row[19] is None:
+                        continue
+
+                    current.add_child(
+                        TrackChild(
+                            row[14],
+                            child_utcs[idx],
+                            None,
+                            None,
+                            row[16],
+                            row[17],
+                            row[18],
+                            None,
+                            row[19],
+                            path=self.sqlite_path,
+                            rowid=row[13],
+                        )
+                    )
+
+            if current is not None:
+                yield current
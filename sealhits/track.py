@@ -14,7 +14,7 @@ __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
 from typing import List, Tuple
-from sealhits.bbox import XYBox, points_to_bb
+from sealhits.bbox import XYBox
 from sealhits.db.db import DB
 from sealhits.db.dbschema import Images
 
@@ -41,13 +41,16 @@ def get_bounding_boxes(
     group = db.get_group_huid(huid)
     uid = group.uid
 
+    # All the points and boxes for this group, in one query.
+    group_bbs = db.get_group_image_bbs(uid)
+
     for idx, img in enumerate(imgs):
-        points = db.get_image_points_by_filename_group(img.filename, uid)
+        found = group_bbs.get((img.filename, img.sonarid), None)
 
         if (
-            len(points) > 0
+            found is not None
         ):  # Since we have buffer start / end images and intermediates, 0 tracks are possible
-            bb = points_to_bb(points, img.range)
+            _, bb = found
 
             if fan_distort:
                 bbox = bb.to_xy(img_size)
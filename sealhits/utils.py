@@ -12,6 +12,7 @@ __all__ = [
     "fast_find",
     "get_fan_size",
     "create_dir",
+    "pool_map",
 ]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
@@ -19,7 +20,8 @@ __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 import os
 import fnmatch
 import math
-from typing import Tuple, List, Union
+import multiprocessing
+from typing import Callable, Iterator, Tuple, List, Union
 
 
 def dist_bearing_to_xy(
@@ -151,3 +153,45 @@ def create_dir(path: str) -> bool:
             return False
 
     return True
+
+
+def pool_map(
+    func: Callable,
+    items: List,
+    workers: Union[int, None] = None,
+    initializer: Union[Callable, None] = None,
+    initargs=(),
+) -> Iterator:
+    """Apply func to each item in a pool of worker processes, yielding the
+    results in the same order as items. Useful for CPU bound work, such as
+    decoding files, that would otherwise be held back by the GIL. With one
+    worker or one item, everything runs in this process instead.
+    This is an iterator function.
+
+    Args:
+       func (Callable): a module level function taking a single item.
+       items (List): the items to process.
+       workers (int): the number of processes. Defaults to the number of CPUs.
+       initializer (Callable): optional function each worker runs first, with initargs.
+       initargs (tuple): the arguments to the initializer.
+
+    Returns:
+       Iterator: the result of func for each item.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    workers = min(workers, len(items))
+
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+
+        for item in items:
+            yield func(item)
+
+        return
+
+    with multiprocessing.Pool(workers, initializer, initargs) as pool:
+        for result in pool.imap(func, items):
+            yield result
@@ -7,7 +7,7 @@ information.
 
 from __future__ import annotations
 
-__all__ = ["gen_video"]
+__all__ = ["gen_video", "gen_video_stream"]
 __version__ = "0.7.0"
 __author__ = "Benjamin Blundell <bjb8@st-andrews.ac.uk>"
 
@@ -16,7 +16,7 @@ import numpy as np
 from sealhits.image import normalise_image
 from sealhits.bbox import XYBox
 from PIL import Image, ImageDraw, ImageFont
-from typing import List, Tuple
+from typing import Iterable, List, Tuple
 from palettable.scientific.sequential import Batlow_20
 
 
@@ -82,3 +82,50 @@ def gen_video(
 
     ffmpegio.video.write(out_path, rate, coloured, overwrite=True, show_log=False)
     return out_path
+
+
+def gen_video_stream(
+    frames: Iterable[np.array],
+    text: str,
+    out_path=".",
+    colour_map=Batlow_20,
+    rate=4,
+) -> str:
+    """Like gen_video but the frames come from an iterator and are written to the
+    video one at a time, so the whole clip is never held in memory. As we cannot see
+    all the frames up-front, frames are coloured over the full 0 to 255 range rather
+    than normalised by the minimum and maximum of the clip. Bounding boxes are not drawn.
+
+    Args:
+        frames (Iterable[np.array]): the luminance frames that makeup the video, all the same size.
+        text (str): text to draw.
+        out_path (str): the full path to the video. Must end in a video type like '.mp4' or '.webm'.
+        colour_map (palettable.Palette): the colour palette to use.
+        rate (int): frames per second.
+
+    Returns:
+       str: path to the saved video.
+    """
+    font = ImageFont.truetype("./Hack-Regular.ttf", 16)
+    lut = [colour_map.mpl_colormap(x / 255.0) for x in range(256)]
+    lut = np.array([[int(x[0] * 255), int(x[1] * 255), int(x[2] * 255)] for x in lut], dtype=np.uint8)
+    np_text = None
+
+    with ffmpegio.open(out_path, "wv", rate_in=rate, overwrite=True, show_log=False) as writer:
+        for frame in frames:
+            # The text overlay is the same on every frame so only draw it once.
+            if np_text is None:
+                blank_image = Image.fromarray(
+                    np.full((frame.shape[0], frame.shape[1], 3), (0, 0, 0), np.uint8)
+                )
+                draw = ImageDraw.Draw(blank_image)
+
+                for i, line in enumerate(text.split("\n")):
+                    draw.text((10, i * 20), str(line), font=font)
+
+                np_text = np.array(blank_image)
+
+            coloured = np.take(lut, frame.astype(np.uint8), axis=0)
+            writer.write(np.maximum(coloured, np_text))
+
+    return out_path
@@ -0,0 +1,104 @@
+'''
+  ______  ______  ____    ____    __   _  ____    __   ______  
+ |   ___||   ___||    \  |    |  |  |_| ||    | _|  |_|   ___| 
+  `-.`-. |   ___||     \ |    |_ |   _  ||    ||_    _|`-.`-.  
+ |______||______||__|\__\|______||__| |_||____|  |__| |______|
+
+test_catalogue.py - test the file time catalogue.
+author: Benjamin Blundell (bjb8@st-andrews.ac.uk)
+
+Tests for the time catalogue. The GLF headers are faked
+so these don't need the test data.
+'''
+
+import os
+import datetime
+import pytz
+from sealhits.sources import catalogue
+from sealhits.sources.catalogue import TimeCatalogue
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        f.write("x")
+
+
+def test_catalogue(tmp_path, monkeypatch):
+    root = tmp_path / "disk"
+    inv_dir = str(tmp_path / "inventory")
+    cat_dir = str(tmp_path / "catalogue")
+    base = datetime.datetime(2023, 5, 1, 12, 0, 0, tzinfo=pytz.UTC)
+    starts = {"one.glf": 0, "two.glf": 10, "three.glf": 20}
+    reads = []
+    counts = []
+
+    def fake_range(path):
+        reads.append(os.path.basename(path))
+        start = starts.get(os.path.basename(path), None)
+
+        if start is None:
+            return (path, None, None)
+
+        return (
+            path,
+            base + datetime.timedelta(minutes=start),
+            base + datetime.timedelta(minutes=start + 10),
+        )
+
+    def fake_count(path):
+        counts.append(os.path.basename(path))
+        return (path, {854: 600, 853: 300})
+
+    monkeypatch.setitem(catalogue.READERS, "glf", fake_range)
+    monkeypatch.setattr(catalogue, "_count_glf_frames", fake_count)
+
+    for name in ["one.glf", "two.glf", "three.glf", "broken.glf"]:
+        _touch(str(root / name))
+
+    # The fake readers can't be sent to worker processes.
+    with TimeCatalogue(str(root), cat_dir, inv_dir) as cat:
+        cat.refresh(("glf",), workers=1)
+        assert sorted(reads) == ["broken.glf", "one.glf", "three.glf", "two.glf"]
+        assert counts == []
+        assert [os.path.basename(p) for p, _, _ in cat.ranges("glf")] == [
+            "one.glf",
+            "two.glf",
+            "three.glf",
+        ]
+
+        found = cat.overlapping(
+            "glf",
+            base + datetime.timedelta(minutes=12),
+            base + datetime.timedelta(minutes=15),
+        )
+        assert [os.path.basename(p) for p, _, _ in found] == ["two.glf"]
+        assert found[0][1] == base + datetime.timedelta(minutes=10)
+
+        # Touching the boundary counts as overlapping.
+        found = cat.overlapping(
+            "glf", base + datetime.timedelta(minutes=20), base + datetime.timedelta(minutes=40)
+        )
+        assert [os.path.basename(p) for p, _, _ in found] == ["two.glf", "three.glf"]
+
+        # Frames are estimated from the counts of the overlapping GLFs,
+        # which are only counted once they are asked for.
+        start = base + datetime.timedelta(minutes=5)
+        end = base + datetime.timedelta(minutes=15)
+        assert cat.estimate_frames(start, end, 854, workers=1) == 600
+        assert sorted(counts) == ["one.glf", "two.glf"]
+        counts.clear()
+        assert cat.estimate_frames(start, end, workers=1) == 900
+        assert counts == []
+
+    # A second refresh reads nothing, and notices a removed file.
+    reads.clear()
+    os.remove(str(root / "one.glf"))
+
+    with TimeCatalogue(str(root), cat_dir, inv_dir) as cat:
+        cat.refresh(("glf",), workers=1)
+        assert reads == []
+        assert len(cat.ranges("glf")) == 2
+        assert cat.estimate_frames(start, end, 854, workers=1) == 300
+        assert counts == []
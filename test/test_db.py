@@ -89,4 +89,287 @@ def test_db_sonar(get_data):
     
     finally:
         db.engine.dispose()
-        db_blank.engine.dispose()
\ No newline at end of file
+        db_blank.engine.dispose()
+
+@pytest.mark.integtest
+def test_db_progress(get_data):
+    from sqlalchemy.orm import Session
+    from sealhits.db.dbschema import Groups, IngestProgress
+    from sealhits.db.dbprogress import STAGE_GLFS, checkpoint_glfs, clear_progress, get_completed, mark_completed
+
+    try:
+        datapath, db, db_blank = get_data
+        IngestProgress.__table__.create(db_blank.engine, checkfirst=True)
+
+        with Session(db_blank.engine) as session:
+            mark_completed(session, "test.sqlite3", STAGE_GLFS, ["a", "b"])
+            mark_completed(session, "test.sqlite3", STAGE_GLFS, ["b", "c"])
+            session.commit()
+            assert(get_completed(session, "test.sqlite3", STAGE_GLFS) == {"a", "b", "c"})
+            assert(len(get_completed(session, "other.sqlite3", STAGE_GLFS)) == 0)
+
+            clear_progress(session, "test.sqlite3")
+            session.commit()
+            assert(len(get_completed(session, "test.sqlite3", STAGE_GLFS)) == 0)
+
+            # The checkpoint process_glfs calls records the batch of groups
+            group = Groups(uid=uuid.uuid4())
+            checkpoint_glfs(session, "test.sqlite3")([group], [], [])
+            assert(get_completed(session, "test.sqlite3", STAGE_GLFS) == {str(group.uid)})
+            clear_progress(session, "test.sqlite3")
+            session.commit()
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_copy(get_data):
+    from sqlalchemy.orm import Session
+    from sealhits.db.dbschema import Groups, Points
+    from sealhits.db.dbcopy import POINT_COLUMNS, copy_points
+
+    try:
+        datapath, db, db_blank = get_data
+
+        with Session(db.engine) as session:
+            group = session.query(Groups).first()
+            point = session.query(Points).filter(Points.track_id.isnot(None)).first()
+            base = {c: getattr(point, c) for c in POINT_COLUMNS}
+            rows = []
+
+            for i in range(10):
+                row = dict(base)
+                row["uid"] = uuid.uuid4()
+                row["time"] = point.time + datetime.timedelta(seconds=i + 1)
+                row["group_id"] = group.uid
+                rows.append(row)
+
+            # An existing point keeps its uid, but moves group
+            moved = dict(base)
+            moved["uid"] = uuid.uuid4()
+            moved["group_id"] = group.uid
+            rows.append(moved)
+
+            assert(copy_points(session, rows) == 11)
+            session.expire_all()
+
+            uids = [r["uid"] for r in rows[:10]]
+            assert(session.query(Points).filter(Points.uid.in_(uids)).count() == 10)
+            existing = session.query(Points).filter(Points.uid == point.uid).one()
+            assert(existing.group_id == group.uid)
+            session.rollback()
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_copy_images(get_data):
+    from sqlalchemy.orm import Session
+    from sealhits.db.dbschema import Groups, Images
+    from sealhits.db.dbcopy import copy_groups_images, copy_images
+
+    try:
+        datapath, db, db_blank = get_data
+
+        with Session(db.engine) as session:
+            group = session.query(Groups).first()
+            image = session.query(Images).first()
+            rows = [
+                {
+                    "uid": uuid.uuid4(),
+                    "filename": "copy_test_" + str(i) + ".fits",
+                    "hastrack": False,
+                    "glf": image.glf,
+                    "time": image.time,
+                    "sonarid": image.sonarid,
+                    "range": image.range,
+                }
+                for i in range(10)
+            ]
+
+            # An existing image keeps its uid
+            rows.append(
+                {
+                    "uid": uuid.uuid4(),
+                    "filename": image.filename,
+                    "hastrack": image.hastrack,
+                    "glf": image.glf,
+                    "time": image.time,
+                    "sonarid": image.sonarid,
+                    "range": image.range,
+                }
+            )
+
+            assert(copy_images(session, rows) == 11)
+            links = [{"group_id": group.uid, "filename": r["filename"]} for r in rows]
+            copy_groups_images(session, links)
+            session.expire_all()
+
+            group = session.query(Groups).filter(Groups.uid == group.uid).one()
+            filenames = [i.filename for i in group.images]
+            assert(all(r["filename"] in filenames for r in rows))
+            assert(session.query(Images).filter(Images.filename == image.filename).one().uid == image.uid)
+            session.rollback()
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_del_dry_run(get_data):
+    try:
+        datapath, db, db_blank = get_data
+        sqlite = db.get_sqlites()[0]
+        num_groups = len(db.get_groups())
+
+        counts = db.del_by_sqlite(sqlite, dry_run=True)
+        assert(counts["groups"] > 0)
+        assert(counts["points"] > 0)
+
+        # Nothing was actually removed
+        assert(len(db.get_groups()) == num_groups)
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_unit_of_work(get_data):
+    try:
+        datapath, db, db_blank = get_data
+        groups = db.get_groups()
+
+        with db.unit_of_work() as session:
+            with db.session() as inner:
+                assert(inner is session)
+
+            for group in groups:
+                db.get_images_group(group.uid)
+
+            assert(db.pool_status()["checked_out"] == 1)
+
+        status = db.pool_status()
+        assert(status["checked_out"] == 0)
+
+        # A setter in a unit is rolled back with the rest of the unit.
+        with pytest.raises(RuntimeError):
+            with db.unit_of_work():
+                db.set_group_huid(groups[0].uid, "unit_of_work_test")
+                assert(db.get_group_uid(groups[0].uid).huid == "unit_of_work_test")
+                raise RuntimeError("undo")
+
+        assert(db.get_group_uid(groups[0].uid).huid == groups[0].huid)
+
+        # As is a dry run, without undoing the rest of the unit.
+        with db.unit_of_work():
+            db.del_by_sqlite(groups[0].sqlite, dry_run=True)
+            assert(len(db.get_groups()) == len(groups))
+        assert(status["connects"] <= status["checkouts"])
+
+        # Outside a unit of work, each call gets its own session.
+        with db.session() as first:
+            with db.session() as second:
+                assert(first is not second)
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_group_image_bbs(get_data):
+    from sealhits.bbox import points_to_bb
+
+    try:
+        datapath, db, db_blank = get_data
+        group = db.get_groups()[0]
+        group_bbs = db.get_group_image_bbs(group.uid)
+        assert(len(group_bbs) > 0)
+
+        # The batched query matches the per-image one.
+        for img in db.get_images_group(group.uid):
+            points = db.get_image_points_by_filename_group(img.filename, group.uid)
+            found = group_bbs.get((img.filename, img.sonarid), None)
+
+            if len(points) == 0:
+                assert(found is None)
+            else:
+                assert(sorted(p.uid for p in found[0]) == sorted(p.uid for p in points))
+                assert(vars(found[1]) == vars(points_to_bb(points, img.range)))
+
+        assert(all(k[1] == 854 for k in db.get_group_image_bbs(group.uid, 854).keys()))
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+# The hot query shapes, none of which should need a sequential scan.
+HOT_QUERIES = [
+    ("SELECT * FROM images WHERE filename = :f", {"f": "test.fits"}),
+    # Covered by the points_un unique constraint.
+    (
+        "SELECT * FROM points WHERE time >= now() - interval '10 ms' "
+        "AND time <= now() AND sonarid = :s",
+        {"s": 854},
+    ),
+    ("SELECT * FROM points WHERE track_id = gen_random_uuid()", {}),
+    ("SELECT * FROM points WHERE group_id = gen_random_uuid()", {}),
+    ("SELECT * FROM tracks_groups WHERE track_pam_id = 1 AND binfile = :b", {"b": "test.pgdf"}),
+    ("SELECT * FROM tracks_groups WHERE group_id = gen_random_uuid()", {}),
+    (
+        "SELECT * FROM groups WHERE gid = 1 AND sqliteid = 1 AND sqlite = :s AND split = 0",
+        {"s": "test.sqlite3"},
+    ),
+    ("SELECT uid FROM groups WHERE sqlite = :s", {"s": "test.sqlite3"}),
+    ("SELECT * FROM groups_images WHERE group_id = gen_random_uuid()", {}),
+]
+
+
+@pytest.mark.integtest
+def test_db_indexes(get_data):
+    from sqlalchemy.orm import Session
+    from sealhits.db.dbindex import create_indexes, seq_scans
+
+    try:
+        datapath, db, db_blank = get_data
+        create_indexes(db.engine)
+
+        with Session(db.engine) as session:
+            for sql, params in HOT_QUERIES:
+                assert(len(seq_scans(session, sql, params)) == 0), sql
+
+            # The check does find sequential scans.
+            assert("images" in seq_scans(session, "SELECT * FROM images WHERE range > 1"))
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
+
+
+@pytest.mark.integtest
+def test_db_iter(get_data):
+    try:
+        datapath, db, db_blank = get_data
+        groups = db.get_groups()
+
+        assert([g.uid for g in db.iter_groups(yield_per=2)] == [g.uid for g in groups])
+        rows = list(db.iter_groups(rows=True))
+        assert([r.uid for r in rows] == [g.uid for g in groups])
+        assert(len(list(db.iter_groups(code="seal"))) == 6)
+
+        assert(len(list(db.iter_pgdfs(rows=True))) == len(db.get_pgdfs()))
+        assert(len(list(db.iter_tracks_groups())) == len(db.get_tracks_groups()))
+
+        points = db.get_points_group(groups[0].uid)
+        assert(len(list(db.iter_points(groups[0].uid, rows=True))) == len(points))
+
+    finally:
+        db.engine.dispose()
+        db_blank.engine.dispose()
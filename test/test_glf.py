@@ -0,0 +1,170 @@
+'''
+  ______  ______  ____    ____    __   _  ____    __   ______  
+ |   ___||   ___||    \  |    |  |  |_| ||    | _|  |_|   ___| 
+  `-.`-. |   ___||     \ |    |_ |   _  ||    ||_    _|`-.`-.  
+ |______||______||__|\__\|______||__| |_||____|  |__| |______|
+
+test_glf.py - test the GLF ingest helpers.
+author: Benjamin Blundell (bjb8@st-andrews.ac.uk)
+
+Tests for the GLF helpers that don't need the database
+or the test data.
+'''
+
+import os
+import datetime
+import pytz
+from types import SimpleNamespace
+from sealhits.sources import glfextract
+from sealhits.sources.glf import GDat, GDatIndex, _existing_outputs, _images_by_glf, _plan_glf
+
+
+def _gdat(start, end, name):
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    return GDat(
+        base + datetime.timedelta(seconds=start),
+        base + datetime.timedelta(seconds=end),
+        None,
+        name,
+    )
+
+
+def test_gdat_index():
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    gdats = [
+        _gdat(600, 900, "c.glf"),
+        _gdat(0, 300, "a.glf"),
+        _gdat(300, 600, "b.glf"),
+        _gdat(100, 1000, "long.glf"),
+    ]
+    index = GDatIndex(gdats)
+    assert len(index) == 4
+    assert [g.full_path for g in index] == ["a.glf", "long.glf", "b.glf", "c.glf"]
+
+    found = index.overlapping(
+        base + datetime.timedelta(seconds=350), base + datetime.timedelta(seconds=400)
+    )
+    assert [g.full_path for g in found] == ["long.glf", "b.glf"]
+
+    # Ranges are inclusive at both ends
+    found = index.overlapping(
+        base + datetime.timedelta(seconds=300), base + datetime.timedelta(seconds=300)
+    )
+    assert [g.full_path for g in found] == ["a.glf", "long.glf", "b.glf"]
+
+    found = index.overlapping(
+        base + datetime.timedelta(seconds=1100), base + datetime.timedelta(seconds=1200)
+    )
+    assert len(found) == 0
+
+    found = index.overlapping(
+        base - datetime.timedelta(seconds=100), base - datetime.timedelta(seconds=50)
+    )
+    assert len(found) == 0
+
+
+def test_existing_outputs(tmp_path):
+    out_dirs = {}
+
+    # Planning doesn't create the day directory
+    assert _existing_outputs(str(tmp_path), "2023_05_29", out_dirs) == set()
+    assert not os.path.exists(str(tmp_path / "2023_05_29"))
+
+    os.mkdir(str(tmp_path / "2023_05_30"))
+    open(str(tmp_path / "2023_05_30" / "a.fits.lz4"), "w").close()
+    assert _existing_outputs(str(tmp_path), "2023_05_30", out_dirs) == {"a.fits.lz4"}
+
+
+def test_plan_glf(tmp_path):
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    gobj = SimpleNamespace(filename="test.glf")
+    gdat = GDat(base, base + datetime.timedelta(seconds=10), gobj, "test.glf")
+    group = SimpleNamespace(
+        timestart=base + datetime.timedelta(seconds=2),
+        timeend=base + datetime.timedelta(seconds=6),
+        glfs=[gobj],
+    )
+    day = base.strftime("%Y_%m_%d")
+    os.mkdir(str(tmp_path / day))
+
+    def _image(seconds, sonar_id):
+        fname = str(seconds) + "_" + str(sonar_id) + ".fits"
+        open(str(tmp_path / day / (fname + ".lz4")), "w").close()
+
+        return SimpleNamespace(
+            filename=fname,
+            glf="test.glf",
+            time=base + datetime.timedelta(seconds=seconds),
+            sonarid=sonar_id,
+        )
+
+    def _secs(image):
+        return (image.time - base).total_seconds()
+
+    def _plan(images):
+        return _plan_glf(group, gdat, _images_by_glf({i.filename: i for i in images}), str(tmp_path), {})
+
+    # Both sonars cover the group, so the GLF is skipped.
+    both = [_image(t * 0.5, s) for t in range(4, 13) for s in (853, 854)]
+    assert len(_plan(both)) == 18
+
+    # One sonar only has images in another group's time.
+    one = [i for i in both if i.sonarid == 854] + [_image(8, 853)]
+    assert _plan(one) is None
+
+    # A hole in one sonar's images.
+    holed = [i for i in both if not (i.sonarid == 853 and 3.5 <= _secs(i) <= 4.5)]
+    assert _plan(holed) is None
+
+    # The group times have grown since.
+    short = [i for i in both if _secs(i) <= 4.5]
+    assert _plan(short) is None
+
+    # A missing FITS file.
+    os.remove(str(tmp_path / day / (both[0].filename + ".lz4")))
+    assert _plan(both) is None
+
+    # Not linked to the group before.
+    group.glfs = []
+    assert _plan(both) is None
+
+
+def test_glf_frames_skips_unreadable(monkeypatch):
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+
+    class FakeGLF:
+        def __init__(self, path):
+            self.path = path
+
+        def __enter__(self):
+            if self.path == "bad.glf":
+                raise IOError("truncated")
+
+            self.images = [
+                SimpleNamespace(
+                    db_tx_time=base + datetime.timedelta(seconds=i),
+                    header=SimpleNamespace(device_id=854),
+                    path=self.path,
+                )
+                for i in range(3)
+            ]
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+        def extract_image(self, image_rec):
+            return (bytes(6), (3, 2))
+
+    monkeypatch.setattr(glfextract, "GLF", FakeGLF)
+
+    # An unreadable GLF is skipped, rather than ending the stream.
+    frames = list(
+        glfextract.glf_frames(
+            ["one.glf", "bad.glf", "two.glf"],
+            base,
+            base + datetime.timedelta(seconds=2),
+        )
+    )
+    assert [rec.path for rec, _ in frames] == ["one.glf"] * 2 + ["two.glf"] * 2
+    assert frames[0][1].shape == (2, 3)
@@ -0,0 +1,187 @@
+'''
+  ______  ______  ____    ____    __   _  ____    __   ______
+ |   ___||   ___||    \  |    |  |  |_| ||    | _|  |_|   ___|
+  `-.`-. |   ___||     \ |    |_ |   _  ||    ||_    _|`-.`-.
+ |______||______||__|\__\|______||__| |_||____|  |__| |______|
+
+test_group.py - test the group splitting.
+author: Benjamin Blundell (bjb8@st-andrews.ac.uk)
+
+Tests for split_groups. These don't need the database
+or the test data; the earlier splits are faked.
+'''
+
+import datetime
+import uuid
+import numpy as np
+import pytz
+from contextlib import nullcontext
+from sealhits.db.dbschema import Groups
+from sealhits.sources.group import split_groups
+from sealhits.sources.points import POINT_DTYPE, PointStore, from_datetime64, to_datetime64
+
+BASE = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+BUFFER = datetime.timedelta(seconds=4)
+
+
+class _Session(object):
+    """Finds each of the existing splits in turn, then no more."""
+
+    no_autoflush = nullcontext()
+
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+
+    def query(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def one_or_none(self):
+        if len(self.existing) > 0:
+            return self.existing.pop(0)
+
+        return None
+
+
+def _group(gid, secs):
+    return Groups(
+        uid=uuid.uuid4(),
+        gid=gid,
+        sqliteid=gid,
+        sqlite="test.sqlite3",
+        split=-1,
+        huid="group_" + str(gid),
+        timestart=BASE + datetime.timedelta(seconds=min(secs, default=0)),
+        timeend=BASE + datetime.timedelta(seconds=max(secs, default=0)),
+        code="",
+        comment="",
+        interact=False,
+        mammal=0,
+        fish=0,
+        bird=0,
+        pgdfs=[],
+    )
+
+
+def _store(groups_secs):
+    store = PointStore()
+
+    for group, secs in groups_secs:
+        points = np.zeros(len(secs), dtype=POINT_DTYPE)
+        points["time"] = [to_datetime64(BASE + datetime.timedelta(seconds=s)) for s in secs]
+        points["sonarid"] = 854
+        store.append(points, uuid.uuid4(), group.uid, [None] * len(secs))
+
+    return store
+
+
+def _old_split(group, times):
+    """The loops split_groups used before it was vectorised, giving the
+    time ranges of the new splits."""
+    times = sorted(times)
+    splits = []
+
+    for tidx in range(len(times) - 2):
+        if times[tidx + 1] - times[tidx] > BUFFER:
+            splits.append(tidx + 1)
+
+    if len(splits) == 0:
+        return [(group.timestart, group.timeend)]
+
+    ranges = [(group.timestart, times[splits[0] - 1])]
+
+    for sidx, split in enumerate(splits):
+        timeend = times[-1]
+
+        if sidx + 1 < len(splits):
+            timeend = times[splits[sidx + 1] - 1]
+
+        ranges.append((times[split] - BUFFER, timeend + BUFFER))
+
+    return ranges
+
+
+def _old_assign(times, ranges):
+    """The split each point was assigned to before, the first that covers it."""
+    assignment = []
+
+    for ptime in sorted(times):
+        for sidx, (sstart, send) in enumerate(ranges):
+            if ptime >= sstart and ptime <= send:
+                assignment.append(sidx)
+                break
+
+    return assignment
+
+
+def _check(secs, existing=()):
+    group = _group(1, secs)
+    times = [BASE + datetime.timedelta(seconds=s) for s in secs]
+    ranges = _old_split(group, times)
+
+    # Splits found from an earlier ingest keep their times.
+    for sidx, split in enumerate(existing):
+        ranges[sidx + 1] = (split.timestart, split.timeend)
+
+    assignment = _old_assign(times, ranges)
+    groups, store = split_groups(_Session(existing), [group], _store([(group, secs)]), 4)
+
+    # The original group is returned last, after its splits.
+    splits = [group] + groups[:-1]
+    assert groups[-1] is group
+    assert [(g.timestart, g.timeend) for g in splits] == ranges
+
+    if len(splits) > 1:
+        assert [g.split for g in splits] == list(range(len(splits)))
+
+    data = store.data
+    assert [from_datetime64(t) for t in data["time"]] == sorted(times)
+    assert [store.group_ids[g] for g in data["group"]] == [splits[a].uid for a in assignment]
+
+
+def test_split_groups():
+    # A gap of exactly the buffer doesn't split.
+    _check([0, 1, 5, 6])
+
+    # Two splits, with the points out of order.
+    _check([11, 0, 2, 1, 10, 20, 21])
+
+    # The gap before the final point is never considered.
+    _check([0, 1, 2, 30])
+    _check([0, 1, 10, 11, 40])
+
+    # Points sharing a time at the edge of a split.
+    _check([0, 1, 1, 9, 9, 10])
+
+    # Existing splits that overlap. The first to cover a point wins.
+    first = _group(1, [5, 22])
+    first.split = 1
+    second = _group(1, [15, 25])
+    second.split = 2
+    _check([0, 1, 2, 10, 11, 20, 21], [first, second])
+
+    # Layouts with gaps either side of the buffer.
+    rng = np.random.default_rng(42)
+
+    for _ in range(20):
+        gaps = rng.choice([0.0, 0.5, 3.0, 4.0, 4.5, 9.0], size=rng.integers(2, 15))
+        _check(list(np.cumsum(gaps)))
+
+
+def test_split_groups_few_points():
+    one = _group(1, [3])
+    empty = _group(2, [])
+    other = _group(3, [0, 10, 20])
+    store = _store([(one, [3]), (other, [0, 10, 20])])
+    groups, store = split_groups(_Session(), [one, empty, other], store, 4)
+
+    # A group with no points is dropped, one with a single point is kept
+    # unsplit, and the next group still splits.
+    assert groups[0] is one
+    assert empty not in groups
+    assert len(groups) == 3
+    assert groups[-1] is other and other.split == 0
+    assert len(store) == 4
+    assert store.group_ids[store.data["group"][0]] == one.uid
@@ -0,0 +1,87 @@
+'''
+  ______  ______  ____    ____    __   _  ____    __   ______  
+ |   ___||   ___||    \  |    |  |  |_| ||    | _|  |_|   ___| 
+  `-.`-. |   ___||     \ |    |_ |   _  ||    ||_    _|`-.`-.  
+ |______||______||__|\__\|______||__| |_||____|  |__| |______|
+
+test_inventory.py - test the cached file inventory.
+author: Benjamin Blundell (bjb8@st-andrews.ac.uk)
+
+Tests for the file inventory. These don't need the
+database or the test data.
+'''
+
+import os
+from sealhits.sources.inventory import FileInventory
+
+
+def _touch(path, mtime=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as f:
+        f.write("x")
+
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_inventory(tmp_path):
+    root = tmp_path / "disk"
+    cache = str(tmp_path / "cache")
+    _touch(str(root / "a" / "one.glf"))
+    _touch(str(root / "a" / "two.GLF"))
+    _touch(str(root / "b" / "c" / "three.pgdf"))
+    _touch(str(root / "b" / "notes.txt"))
+
+    inv = FileInventory(str(root), cache).refresh()
+    assert [os.path.basename(p) for p in inv.paths("glf")] == ["one.glf", "two.GLF"]
+    assert [os.path.basename(p) for p in inv.paths("pgdf")] == ["three.pgdf"]
+    assert os.path.exists(inv.path)
+
+    # A new inventory picks up the saved one, then finds the changes.
+    _touch(str(root / "b" / "c" / "four.pgdf"))
+    os.remove(str(root / "a" / "one.glf"))
+
+    inv = FileInventory(str(root), cache)
+    assert len(inv.paths("glf")) == 2
+    inv.refresh()
+    assert [os.path.basename(p) for p in inv.paths("glf")] == ["two.GLF"]
+    assert [os.path.basename(p) for p in inv.paths("pgdf")] == ["four.pgdf", "three.pgdf"]
+
+    # Directories with an unchanged mtime are taken from the cache without
+    # being listed, so a removal that leaves the mtime alone is only seen
+    # when the files are stat-ed.
+    for d in [root, root / "a", root / "b", root / "b" / "c"]:
+        os.utime(str(d), (1000000, 1000000))
+
+    inv.refresh()
+    os.remove(str(root / "a" / "two.GLF"))
+    os.utime(str(root / "a"), (1000000, 1000000))
+    inv = FileInventory(str(root), cache).refresh()
+    assert len(inv.paths("glf")) == 1
+    assert len(inv.files("glf", restat=True)) == 0
+
+
+def test_inventory_rewrite(tmp_path):
+    root = tmp_path / "disk"
+    cache = str(tmp_path / "cache")
+    path = str(root / "a" / "one.pgdf")
+    _touch(path, 1000000)
+    os.utime(str(root / "a"), (1000000, 1000000))
+
+    inv = FileInventory(str(root), cache).refresh()
+    assert inv.files("pgdf")[0]["size"] == 1
+
+    # Appending to a file in place leaves the directory mtime alone, so
+    # it is only seen when the files are stat-ed.
+    with open(path, "a") as f:
+        f.write("more")
+
+    os.utime(path, (2000000, 2000000))
+    os.utime(str(root / "a"), (1000000, 1000000))
+
+    inv = FileInventory(str(root), cache).refresh()
+    assert inv.files("pgdf")[0]["size"] == 1
+    found = inv.files("pgdf", restat=True)
+    assert found[0]["size"] == 5
+    assert found[0]["mtime"] == 2000000 * 10**9
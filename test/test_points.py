@@ -0,0 +1,129 @@
+'''
+  ______  ______  ____    ____    __   _  ____    __   ______  
+ |   ___||   ___||    \  |    |  |  |_| ||    | _|  |_|   ___| 
+  `-.`-. |   ___||     \ |    |_ |   _  ||    ||_    _|`-.`-.  
+ |______||______||__|\__\|______||__| |_||____|  |__| |______|
+
+test_points.py - test the columnar point store.
+author: Benjamin Blundell (bjb8@st-andrews.ac.uk)
+
+Tests for the point store used during an ingest. These
+don't need the database or the test data.
+'''
+
+import datetime
+import uuid
+import numpy as np
+import pytz
+from sealhits.db.dbschema import Points
+from types import SimpleNamespace
+from sealhits.sources.points import KEY_FIELDS, POINT_DTYPE, PointStore, point_key, points_array, to_datetime64
+
+
+def _points(secs):
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    points = np.zeros(len(secs), dtype=POINT_DTYPE)
+    points["time"] = [to_datetime64(base + datetime.timedelta(seconds=s)) for s in secs]
+    points["sonarid"] = 854
+    points["minbearing"] = 0.1
+    return points
+
+
+def test_point_store():
+    track_a = uuid.uuid4()
+    track_b = uuid.uuid4()
+    group_a = uuid.uuid4()
+    group_b = uuid.uuid4()
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    existing = Points(
+        uid=uuid.uuid4(),
+        time=base + datetime.timedelta(seconds=1),
+        sonarid=854,
+        minbearing=0.1,
+        maxbearing=0.0,
+        minrange=0.0,
+        maxrange=0.0,
+        peakbearing=0.0,
+        peakrange=0.0,
+        maxvalue=0.0,
+        occupancy=0.0,
+        objsize=0.0,
+    )
+
+    store = PointStore()
+    store.append(_points([0, 1, 2]), track_a, group_a, [None, existing, None])
+    store.append(_points([5, 6]), track_b, group_b, [None, None])
+    assert len(store) == 5
+
+    index = store.indices_by_group()
+    assert list(index[group_a]) == [0, 1, 2]
+    assert list(index[group_b]) == [3, 4]
+
+    # Moving points to another group
+    store.set_group(np.array([2]), group_b)
+    index = store.indices_by_group()
+    assert list(index[group_b]) == [2, 3, 4]
+
+    # Each group's earliest and latest point time
+    bounds = store.time_bounds()
+    assert bounds[group_a] == (base, base + datetime.timedelta(seconds=1))
+    assert bounds[group_b] == (
+        base + datetime.timedelta(seconds=2),
+        base + datetime.timedelta(seconds=6),
+    )
+
+    # Existing points are moved to their track and group, and only once.
+    # Their other values are left as loaded.
+    assert store.attach_existing() == 1
+    assert existing.group_id == group_a
+    assert existing.minbearing == 0.1
+    assert store.attach_existing() == 0
+
+    # Existing points keep their object, new points are made on demand
+    points = list(store)
+    assert points[1] is existing
+    assert existing.group_id == group_a
+    assert existing.track_id == track_a
+    assert points[2].group_id == group_b
+    assert len(list(store.rows(new_only=True))) == 4
+
+    assert store.uids() == {p.uid for p in points}
+
+    sub = store.subset(index[group_b])
+    assert len(sub) == 3
+    assert [p.track_id for p in sub] == [track_a, track_b, track_b]
+
+    # A store made from objects gives the same objects back
+    again = PointStore.from_points(points)
+    assert all(a is b for a, b in zip(again, points))
+
+    # Keys from the database and from a PGDF row match
+    key = point_key(points[0].time, 854, 0.1, 0, 0, 0, 0, 0, 0, 0)
+    assert key == store.data[KEY_FIELDS][0].tolist()
+
+
+def test_points_array():
+    base = datetime.datetime(2023, 5, 29, 14, 0, 0).astimezone(tz=pytz.UTC)
+    pam_points = [
+        SimpleNamespace(
+            time=base + datetime.timedelta(seconds=s),
+            sonar_id=854,
+            min_bearing=0.1,
+            max_bearing=0.2,
+            min_range=1.0,
+            max_range=2.0,
+            peak_bearing=0.15,
+            peak_range=1.5,
+            max_value=100.0,
+            occupancy=0.5,
+            obj_size=3.0,
+        )
+        for s in [0, 1]
+    ]
+
+    points = points_array(pam_points)
+    assert points.dtype == POINT_DTYPE
+    assert len(points) == 2
+    assert points["time"][1] == to_datetime64(base + datetime.timedelta(seconds=1))
+    assert points["sonarid"][0] == 854
+    assert points["peakrange"][0] == np.float32(1.5)
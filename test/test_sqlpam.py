@@ -23,6 +23,12 @@ def test_sqlpam(get_data):
         sqlpam = SQLPAM(sqlitepath)
         assert(len(sqlpam.track_groups) == 3)
         assert(len(sqlpam.track_children) == 11)
+        assert(sqlpam.num_groups() == 3)
+
+        # Streaming in small batches gives the same groups and children
+        streamed = list(sqlpam.iter_groups(fetch_size=2))
+        assert([g.uid for g in streamed] == [g.uid for g in sqlpam.track_groups])
+        assert(sum(len(g.children) for g in streamed) == 11)
     finally:
         db.engine.dispose()
         db_blank.engine.dispose()
@@ -16,8 +16,16 @@ from sealhits.db.db import DB
 
 def undigest(args): 
     """Delete an ingest using the sqliteid."""
-    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass)
-    pgdb.del_by_sqlite(args.sqlite)
+    pgdb = DB(db_name=args.dbname, username=args.dbuser, password=args.dbpass, host=args.dbhost)
+    counts = pgdb.del_by_sqlite(args.sqlite, dry_run=args.dry_run)
+
+    if args.dry_run:
+        print("Dry run - nothing was deleted. Rows that would be deleted:")
+    else:
+        print("Rows deleted:")
+
+    for table, count in counts.items():
+        print(" ", table, count)
 
 
 def main():
@@ -32,6 +40,13 @@ def main():
     )
 
     parser.add_argument("-s", "--sqlite", help="The name of the SQLITE file that we are deleting.")
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        default=False,
+        help="Count what would be deleted without deleting anything (default: False)",
+    )
    
     parser.add_argument(
         "-d",
@@ -22,13 +22,12 @@ from datetime import datetime
 from tqdm import tqdm
 from sealhits import image, utils
 from sealhits.db.db import DB
-from pytritech.glftimes import glf_times
-from pytritech.glf import GLF
 from sealhits.btable import bearing_table
-from sealhits.sources.files import glf_files_avail
-from sealhits.video import gen_video
+from sealhits.sources.catalogue import TimeCatalogue
+from sealhits.video import gen_video, gen_video_stream
+from sealhits.sources.glfextract import glf_frames
 from sealhits.cache import is_cached_fan
-from sealhits.bbox import points_to_bb, XYBox, bb_to_fix
+from sealhits.bbox import XYBox, bb_to_fix
 
 
 def check_cache(cache_path, fname, fresult, fan_size):
@@ -88,9 +87,8 @@ def group_to_video(args):
         uids_to_check = []
         
         if "ALL" == args.id:
-            groups = seal_db.get_groups()
-            
-            for group in groups:
+            # Only the uids are needed, so stream lightweight rows.
+            for group in seal_db.iter_groups(rows=True):
                 uids_to_check.append(group.uid)
         
         else:
@@ -115,6 +113,11 @@ def group_to_video(args):
                 gcode = group_details.code
                 comment = group_details.comment
                 gid = group_details.gid
+                group_bbs = {}
+
+                if args.draw_bboxes:
+                    # All the points and boxes for this group, in one query.
+                    group_bbs = seal_db.get_group_image_bbs(uid, args.sonarid)
 
                 # Find all the images and create the base frames.
                 for idx, img in enumerate(tqdm(group_images, desc="Create Base Frames")):
@@ -135,11 +138,10 @@ def group_to_video(args):
                         # Find the Bounding boxes for each frame, if we have any.
                         # BBS need flipping just like the images, but only vertically
                         if args.draw_bboxes:
-                            fname = img.filename
-                            points = seal_db.get_image_points_by_filename_group(fname, uid)
+                            found = group_bbs.get((img.filename, img.sonarid), None)
 
-                            if len(points) > 0: # Since we have buffer start / end images and intermediates, 0 tracks are possible
-                                bb = points_to_bb(points, img.range)
+                            if found is not None: # Since we have buffer start / end images and intermediates, 0 tracks are possible
+                                _, bb = found
                                 print(bb, img.range)
                                 bbox = bb.to_xy(fan_size)
                                 ((xmin, ymin), (xmax, ymax)) = bbox.pair()
@@ -164,49 +166,50 @@ def group_to_video(args):
 
 
 def glf_to_video(args):
-    """ Given a list of GLFs and a timerange, generate video from that."""
+    """ Given a list of GLFs and a timerange, generate video from that.
+    Frames are streamed from the GLFs, rendered as fans and encoded one
+    at a time, so memory use doesn't depend on the length of the time range."""
 
-    glf_files = glf_files_avail(args.glfpath)
-    glf_files.sort()
-    assert(len(glf_files) > 0)
     fan_size = utils.get_fan_size(args.height)
-    frames = []
-    rate = 4
-    
-    try:
-        start_time = datetime.strptime(args.starttime, "%Y-%m-%d %H:%M:%S.%f").replace(tz=pytz.UTC)
-        end_time = datetime.strptime(args.endtime, "%Y-%m-%d %H:%M:%S.%f").replace(tz=pytz.UTC)
-    
-        for gf in glf_files:
-            try:
-                gstart, gend = glf_times(gf)
-
-                if end_time >= gstart and start_time <= gend:
-                    with GLF(gf) as f:
-                        
-                        for image_rec in f.images:
-                            if image_rec.header.time >= start_time and image_rec.header.time < end_time:
-                                image_data, image_size = f.extract_image(image_rec)
-                                np_frame = np.frombuffer(image_data, dtype=np.uint8).reshape((image_size[1], image_size[0]))
-                                fan_image = np.fliplr(np.flipud(image.fan_distort(np_frame, fan_size[1], bearing_table)))
-                                frames.append(fan_image)
-            
-            except Exception as e:
-                print("Could not read GLF", gf)
-                print(e)
+    rate = args.rate
 
-        np_frames = np.array(frames)
-        td = end_time - start_time
-        rate = int(len(frames) / td.seconds)
-        print("Frame Rate:", rate)
-        assert(len(frames) > 0)
-        gen_video(np_frames, None, str(start_time) + "\n" + str(end_time), args.outpath, rate=rate)
+    try:
+        start_time = datetime.strptime(args.starttime, "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=pytz.UTC)
+        end_time = datetime.strptime(args.endtime, "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=pytz.UTC)
 
     except ValueError as e:
         print("Failed to parse start and end times from arguments.")
         print(e)
         return
 
+    # Only the GLFs that overlap our time range are read. The catalogue
+    # holds the times of every GLF, so only the headers of new GLFs are read.
+    with TimeCatalogue(args.glfpath) as catalogue:
+        glf_used = [
+            gf
+            for gf, _, _ in catalogue.refresh(("glf",)).overlapping(
+                "glf", start_time, end_time
+            )
+        ]
+        assert(len(glf_used) > 0)
+
+        if rate <= 0:
+            # Work out the frame rate from the catalogue's frame counts, which
+            # are only read for the GLFs we use, the first time they are asked for.
+            num_frames = catalogue.estimate_frames(start_time, end_time, args.sonarid)
+            assert(num_frames > 0)
+            td = end_time - start_time
+            rate = max(1, int(num_frames / td.total_seconds()))
+
+    print("Frame Rate:", rate)
+
+    fans = (
+        np.fliplr(np.flipud(image.fan_distort(np_frame, fan_size[1], bearing_table)))
+        for _, np_frame in glf_frames(glf_used, start_time, end_time, args.sonarid)
+    )
+
+    gen_video_stream(fans, str(start_time) + "\n" + str(end_time), args.outpath, rate=rate)
+
 
 def main():
     import argparse
@@ -232,7 +235,7 @@ def main():
         "-s", "--starttime", default="", help="(optional) Start Date Time in YYYY-mm-dd HH:MM:SS.f UTC (default: none)"
     )
     parser.add_argument(
-        "-e", "--endtime", default="",  help="(optional) End Date Time in YYYY-mm-dd HH:MM:SS.f UTC (default: none)"
+        "-e", "--endtime", default="",  help="(optional) End Date Time in YYYY-mm-dd HH:MM:SS.f UTC, exclusive (default: none)"
     )
     parser.add_argument(
         "-r", "--sonarid", type=int, default=854, help="Which Sonar are we looking at (default: 854)?"
@@ -242,6 +245,9 @@ def main():
     )
     parser.add_argument("-b", "--draw-bboxes", action="store_true", default=False)
     parser.add_argument("-g", "--glfpath", default="", help="Rather than use a group, use glfs on this path (default: none)")
+    parser.add_argument(
+        "-a", "--rate", type=int, default=0, help="Frame rate when using glfs. 0 works it out from the GLF frame counts in the catalogue (default: 0)"
+    )
 
     parser.add_argument(
         "-f",